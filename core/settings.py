@@ -55,7 +55,9 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'store.middleware.RequestMetricsMiddleware',
     'store.middleware.TenantMiddleware',  # your custom one
+    'store.middleware.ReplicaRoutingMiddleware',
 ]
 
 
@@ -100,6 +102,71 @@ else:
     }
 
 
+# Optional tenant shards: SHARD_DATABASE_URLS="shard1=postgres://...,shard2=sqlite:///shard2.sqlite3".
+# Vendors are mapped to shards by TENANT_SHARDS ("<vendor_id>=<alias>,...") or the
+# store.TenantShard table; unmapped vendors stay on "default" (see store.sharding).
+for _entry in filter(None, os.getenv("SHARD_DATABASE_URLS", "").split(",")):
+    _alias, _url = _entry.split("=", 1)
+    DATABASES[_alias.strip()] = dj_database_url.parse(_url.strip())
+
+TENANT_SHARDS = {
+    int(_vendor): _alias.strip()
+    for _vendor, _alias in (
+        _entry.split("=", 1) for _entry in filter(None, os.getenv("TENANT_SHARDS", "").split(","))
+    )
+}
+
+# Optional read replicas: REPLICA_DATABASE_URLS="replica1=postgres://...,shard1/shard1_replica=postgres://...".
+# "<primary>/" defaults to "default". Safe requests to product/order viewsets read from a
+# random replica of their primary; a client or tenant that wrote within PIN_SECONDS is
+# pinned to the primary (cookie + cache marker) so it always reads its own writes.
+READ_REPLICAS = {
+    "REPLICAS": {},
+    "PIN_SECONDS": int(os.getenv("REPLICA_PIN_SECONDS", "5")),
+    "COOKIE": "primary_pin",
+    "CACHE_ALIAS": os.getenv("REPLICA_PIN_CACHE_ALIAS", "default"),
+}
+for _entry in filter(None, os.getenv("REPLICA_DATABASE_URLS", "").split(",")):
+    _alias, _url = _entry.split("=", 1)
+    _primary, _, _alias = _alias.strip().rpartition("/")
+    _primary = _primary or "default"
+    DATABASES[_alias] = dj_database_url.parse(_url.strip())
+    DATABASES[_alias]["TEST"] = {"MIRROR": _primary}
+    READ_REPLICAS["REPLICAS"].setdefault(_primary, []).append(_alias)
+
+# Connection reuse for every alias (default, shards, replicas). DB_CONN_MODE is:
+#   "persistent": each worker thread keeps its connection for CONN_MAX_AGE seconds and
+#                 pings it before reusing it in a new request (default under WSGI);
+#   "pool":       PostgreSQL only, needs psycopg 3 (pip install "psycopg[binary,pool]").
+#                 Each process shares POOL_SIZE connections, growing by up to POOL_OVERFLOW
+#                 under load and waiting POOL_TIMEOUT seconds for a free one. Other engines
+#                 fall back to "persistent";
+#   "none":       a new connection per request (default under ASGI, where requests do not
+#                 stay on one thread).
+# Connection and pool counters are exported on /metrics (store.db_connections).
+DB_CONNECTIONS = {
+    "MODE": os.getenv("DB_CONN_MODE", "none" if os.getenv("SERVER_MODE") == "asgi" else "persistent"),
+    "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "60")),
+    "HEALTH_CHECKS": os.getenv("DB_CONN_HEALTH_CHECKS", "True").lower() == "true",
+    "POOL_SIZE": int(os.getenv("DB_POOL_SIZE", "4")),
+    "POOL_OVERFLOW": int(os.getenv("DB_POOL_OVERFLOW", "4")),
+    "POOL_TIMEOUT": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+}
+for _db in DATABASES.values():
+    if DB_CONNECTIONS["MODE"] == "pool" and _db["ENGINE"] == "django.db.backends.postgresql":
+        _db["CONN_MAX_AGE"] = 0  # the pool owns connection lifetime
+        _db.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": DB_CONNECTIONS["POOL_SIZE"],
+            "max_size": DB_CONNECTIONS["POOL_SIZE"] + DB_CONNECTIONS["POOL_OVERFLOW"],
+            "timeout": DB_CONNECTIONS["POOL_TIMEOUT"],
+        }
+    elif DB_CONNECTIONS["MODE"] != "none":
+        _db["CONN_MAX_AGE"] = DB_CONNECTIONS["CONN_MAX_AGE"]
+        _db["CONN_HEALTH_CHECKS"] = DB_CONNECTIONS["HEALTH_CHECKS"]
+
+DATABASE_ROUTERS = ["store.replicas.ReplicaRouter", "store.sharding.TenantShardRouter"]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -147,19 +214,156 @@ AUTH_USER_MODEL = "store.User"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "store.authentication.TenantJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
 }
 
+# Web worker processes per instance; gunicorn.conf.py exports its count here.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Set REDIS_URL (and install redis) to share caches between workers; the default
+# LocMem cache is per process.
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+
+# Per-vendor read-through cache for product catalog responses (store.response_cache).
+# CACHE_ALIAS must be a shared backend (e.g. REDIS_URL) for invalidations to reach
+# every worker; with a per-process cache and WEB_CONCURRENCY > 1 it is switched off.
+CATALOG_CACHE = {
+    "CACHE_ALIAS": os.getenv("CATALOG_CACHE_ALIAS", "default"),
+    "TIMEOUT": int(os.getenv("CATALOG_CACHE_TIMEOUT", "300")),
+}
+
+# Keyset pagination for product/order list endpoints (store.pagination).
+STORE_PAGINATION = {
+    "PAGE_SIZE": int(os.getenv("STORE_PAGE_SIZE", "50")),
+    "MAX_PAGE_SIZE": int(os.getenv("STORE_MAX_PAGE_SIZE", "500")),
+}
+
+# JSON list responses of the product/order viewsets are built from values_list() rows
+# by mappers compiled from their serializers (store.fast_serializers); the bytes are
+# the same as the serializer output. orjson is used for encoding when installed.
+FAST_SERIALIZATION = {
+    "ENABLED": os.getenv("FAST_SERIALIZATION_ENABLED", "True").lower() == "true",
+}
+
+STORE_ADMIN = {
+    "ESTIMATE_THRESHOLD": int(os.getenv("ADMIN_ESTIMATE_THRESHOLD", 100000)),
+    "COUNT_CAP": int(os.getenv("ADMIN_COUNT_CAP", 100000)),
+    "INLINE_PER_PAGE": 50,
+}
+
 from datetime import timedelta
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
 
+# Per-request instrumentation (store.instrumentation): Server-Timing headers,
+# Prometheus histograms at /metrics and a slow-request log with the N slowest queries.
+STORE_METRICS = {
+    "ENABLED": os.getenv("STORE_METRICS_ENABLED", "True").lower() == "true",
+    # Server-Timing exposes DB timings to every client, so it follows DEBUG by default.
+    "SERVER_TIMING": os.getenv("STORE_SERVER_TIMING", str(DEBUG)).lower() == "true",
+    "SLOW_REQUEST_MS": int(os.getenv("SLOW_REQUEST_MS", "1000")),
+    "SLOW_QUERY_COUNT": int(os.getenv("SLOW_QUERY_COUNT", "5")),
+    "TENANT_LABEL": True,
+    # Required for /metrics unless DEBUG is on.
+    "METRICS_TOKEN": os.getenv("METRICS_TOKEN") or None,
+    "MAX_SERIES": int(os.getenv("STORE_METRICS_MAX_SERIES", "2000")),
+}
+
+# Tenant resolution cache used by TenantMiddleware. CACHE_ALIAS points at an
+# optional shared tier (e.g. Redis) in CACHES; leave it None for process-local only.
+TENANT_CACHE = {
+    "MAX_SIZE": int(os.getenv("TENANT_CACHE_MAX_SIZE", "1024")),
+    "TTL": int(os.getenv("TENANT_CACHE_TTL", "60")),
+    "CACHE_ALIAS": os.getenv("TENANT_CACHE_ALIAS") or None,
+    "SHARED_TTL": 300,
+}
+
+# Claims-based authentication re-reads a user's is_active flag (and password
+# hash, with SIMPLE_JWT CHECK_REVOKE_TOKEN) at most every USER_CHECK_TTL
+# seconds per worker; 0 checks on every request.
+TOKEN_AUTH = {
+    "USER_CHECK_TTL": int(os.getenv("TOKEN_USER_CHECK_TTL", "30")),
+}
+
+# Idempotency-Key support on POST /api/orders/place/ (store.idempotency). Keys are
+# kept for TTL seconds; purge them with `manage.py purge_idempotency_keys`.
+IDEMPOTENCY = {
+    "TTL": int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600))),
+    "WAIT": int(os.getenv("IDEMPOTENCY_WAIT", "10")),
+    "LOCK_TIMEOUT": 30,
+    "POLL_INTERVAL": 0.05,
+}
+
+# Outbox job queue (store.jobs) drained by `manage.py runworker`. Failed jobs are
+# retried after BACKOFF * 2**(attempt-1) seconds (capped at MAX_BACKOFF).
+# RUN_INLINE drains the queue in the web process after each enqueueing commit,
+# for deployments without a worker process.
+JOBS = {
+    "THREADS": int(os.getenv("JOB_WORKER_THREADS", "4")),
+    "BATCH_SIZE": int(os.getenv("JOB_BATCH_SIZE", "50")),
+    "POLL_INTERVAL": float(os.getenv("JOB_POLL_INTERVAL", "1.0")),
+    "LEASE": 300,
+    "MAX_ATTEMPTS": 5,
+    "BACKOFF": 2.0,
+    "MAX_BACKOFF": 3600,
+    "RUN_INLINE": os.getenv("JOB_RUN_INLINE", "False").lower() == "true",
+}
+
+# Automatic staff assignment for new orders and products (store.assignment).
+# STRATEGY is "least_outstanding" (fewest open orders / products) or "round_robin".
+# Loads are counted in CACHE_ALIAS and rebuilt from the database every TTL seconds.
+# With a per-process CACHE_ALIAS and WEB_CONCURRENCY > 1 each worker only counts
+# its own picks, so loads are rebuilt every LOCAL_TTL seconds instead; share the
+# cache (REDIS_URL) for exact counts.
+STAFF_ASSIGNMENT = {
+    "ENABLED": os.getenv("STAFF_ASSIGNMENT_ENABLED", "True").lower() == "true",
+    "STRATEGY": os.getenv("STAFF_ASSIGNMENT_STRATEGY", "least_outstanding"),
+    "OPEN_STATUSES": ("pending",),
+    "CACHE_ALIAS": os.getenv("STAFF_ASSIGNMENT_CACHE_ALIAS", "default"),
+    "TTL": int(os.getenv("STAFF_ASSIGNMENT_TTL", "300")),
+    "LOCAL_TTL": int(os.getenv("STAFF_ASSIGNMENT_LOCAL_TTL", "30")),
+}
+
+# Login pipeline (store.login): password hashes are verified on a bounded pool,
+# attempts are counted per username and per client IP in process memory, and
+# /api/auth/refresh/ issues access tokens from claims unless the revocation check is on.
+STORE_LOGIN = {
+    "HASH_WORKERS": int(os.getenv("LOGIN_HASH_WORKERS", str(os.cpu_count() or 2))),
+    "HASH_EXECUTOR": os.getenv("LOGIN_HASH_EXECUTOR", "thread"),
+    "MAX_PENDING": int(os.getenv("LOGIN_MAX_PENDING", "64")),
+    "USER_ATTEMPTS": int(os.getenv("LOGIN_USER_ATTEMPTS", "10")),
+    "IP_ATTEMPTS": int(os.getenv("LOGIN_IP_ATTEMPTS", "100")),
+    "WINDOW": int(os.getenv("LOGIN_WINDOW", "60")),
+    "VERIFIED_CACHE_TTL": int(os.getenv("LOGIN_VERIFIED_CACHE_TTL", "0")),
+    "REFRESH_REVOCATION_CHECK": os.getenv("REFRESH_REVOCATION_CHECK", "False").lower() == "true",
+    # Reverse proxies in front of the app; the client IP is read from
+    # X-Forwarded-For instead of REMOTE_ADDR, which would be the proxy's.
+    # Render sets RENDER=true and puts one proxy in front of every service.
+    "TRUSTED_PROXY_HOPS": int(os.getenv("LOGIN_TRUSTED_PROXY_HOPS", "1" if os.getenv("RENDER") else "0")),
+}
+
+# Product search (store.search): a per-vendor trigram index over name, SKU and
+# description. A product matches when it shares MIN_SIMILARITY of the query's
+# trigrams; the score sums the field WEIGHTS of the shared trigrams.
+PRODUCT_SEARCH = {
+    "WEIGHTS": {"sku": 4, "name": 3, "description": 1},
+    "DESCRIPTION_CHARS": int(os.getenv("PRODUCT_SEARCH_DESCRIPTION_CHARS", "2000")),
+    "MIN_SIMILARITY": float(os.getenv("PRODUCT_SEARCH_MIN_SIMILARITY", "0.3")),
+    "MAX_RESULTS": int(os.getenv("PRODUCT_SEARCH_MAX_RESULTS", "100")),
+}
+
 # Only enable these for production; keep safe defaults.
 # Tell Django it's behind a proxy/load balancer that sets X-Forwarded-Proto
 SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
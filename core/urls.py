@@ -17,6 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.http import JsonResponse
+from store.instrumentation import metrics_view
 
 def home(request):
     return JsonResponse({"status": "ok", "message": "Django backend running successfully on Render!"})
@@ -24,5 +25,6 @@ def home(request):
 urlpatterns = [
     path('', home),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', include('store.urls')),
 ]
@@ -0,0 +1,24 @@
+"""
+Gunicorn settings shared by both deployment modes (see Procfile).
+
+SERVER_MODE=wsgi (default) runs sync workers on core.wsgi; SERVER_MODE=asgi
+runs uvicorn workers on core.asgi, where the /api/async/ endpoints serve
+reads without tying up a worker per slow query.
+"""
+import os
+
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+
+bind = "0.0.0.0:{}".format(os.getenv("PORT", "8000"))
+# gunicorn's own default: one worker unless WEB_CONCURRENCY says otherwise. More
+# than one with the default per-process cache switches the catalog cache off
+# and makes staff loads per worker, so set REDIS_URL when raising it.
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Workers inherit this; caches that must be shared check it (see core.settings).
+os.environ["WEB_CONCURRENCY"] = str(workers)
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+
+if SERVER_MODE == "asgi":
+    worker_class = "uvicorn_worker.UvicornWorker"
+else:
+    threads = int(os.getenv("GUNICORN_THREADS", "1"))
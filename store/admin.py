@@ -1,18 +1,190 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, transaction
+from django.forms.models import BaseInlineFormSet
+from django.http import QueryDict
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+from .assignment import order_changed
 from .models import Vendor, User, Product, Customer, Order, OrderItem
 
 
+def _config():
+    conf = {"ESTIMATE_THRESHOLD": 100000, "COUNT_CAP": 100000, "INLINE_PER_PAGE": 50}
+    conf.update(getattr(settings, 'STORE_ADMIN', {}))
+    return conf
+
+
+class AutocompleteFilter(admin.RelatedFieldListFilter):
+    """
+    Foreign key filter rendered as an autocomplete box (the admin's
+    autocomplete view, searched through the related admin's
+    ``search_fields``) instead of one link per related row. Only the selected
+    row is loaded. Use as ``list_filter = [("vendor", AutocompleteFilter)]``.
+    """
+
+    template = 'admin/store/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.model_admin = model_admin
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def field_choices(self, field, request, model_admin):
+        return []
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            "selected": self.lookup_val is None and not self.lookup_val_isnull,
+            "query_string": changelist.get_query_string(remove=[self.lookup_kwarg, self.lookup_kwarg_isnull]),
+            "display": _("All"),
+        }
+        selected = self.lookup_val[-1] if self.lookup_val else None
+        widget = forms.ModelChoiceField(
+            queryset=self.field.remote_field.model._default_manager.all(), required=False,
+            widget=AutocompleteSelect(self.field, self.model_admin.admin_site),
+        ).widget
+        yield {
+            "widget": widget.render(self.lookup_kwarg, selected, attrs={
+                "id": "id_filter_{}".format(self.field_path),
+                "data-url": changelist.get_query_string({self.lookup_kwarg: "__pk__"}, [self.lookup_kwarg_isnull]),
+                "data-clear-url": changelist.get_query_string(remove=[self.lookup_kwarg, self.lookup_kwarg_isnull]),
+            }),
+        }
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Changelist paginator that does not COUNT(*) big tables: an unfiltered
+    table over ``ESTIMATE_THRESHOLD`` rows uses the planner's row estimate,
+    and filtered counts stop at ``COUNT_CAP`` (later pages are not linked).
+    """
+
+    @cached_property
+    def count(self):
+        conf = _config()
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate >= conf["ESTIMATE_THRESHOLD"]:
+                return estimate
+        return queryset[:conf["COUNT_CAP"]].count()
+
+
+def estimated_rows(model, using):
+    """The database's own row estimate for ``model``'s table, or None if it keeps none."""
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'postgresql': ('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [table]),
+        'mysql': ('SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s', [table]),
+        # Written by ANALYZE; each row's stat starts with the table's row count.
+        'sqlite': ('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table]),
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(*queries[connection.vendor])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None  # sqlite_stat1 does not exist before the first ANALYZE
+    if row is None or row[0] is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None  # PostgreSQL reports -1 before the first ANALYZE
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Changelists for big tables: no unfiltered COUNT(*) and no full-count query."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        # Scripts for the AutocompleteFilter boxes on the changelist.
+        return super().media + AutocompleteSelect(Product._meta.get_field('vendor'), self.admin_site).media
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """Inline formset over one page of the parent's rows; the inline sets ``page``/``per_page``."""
+
+    page = 1
+    per_page = 50
+    page_param = 'page'
+    query = QueryDict()  # the change view's query string, kept in page links
+
+    def get_queryset(self):
+        if not hasattr(self, '_page_queryset'):
+            queryset = super().get_queryset()
+            self.total = queryset.count()
+            self.pages = max(1, -(-self.total // self.per_page))
+            self.page = min(self.page, self.pages)
+            start = (self.page - 1) * self.per_page
+            self._page_queryset = queryset[start:start + self.per_page]
+        return self._page_queryset
+
+    def page_query(self, page):
+        query = self.query.copy()
+        query[self.page_param] = page
+        return query.urlencode()
+
+    @property
+    def previous_page_query(self):
+        return self.page_query(self.page - 1)
+
+    @property
+    def next_page_query(self):
+        return self.page_query(self.page + 1)
+
+
+class PaginatedTabularInline(admin.TabularInline):
+    """Read-only tabular inline listing ``INLINE_PER_PAGE`` rows per page (``?<prefix>_page=N``)."""
+
+    formset = PaginatedInlineFormSet
+    template = 'admin/store/paginated_tabular.html'
+    extra = 0
+    can_delete = False
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        param = '{}_page'.format(formset.get_default_prefix())
+        try:
+            page = max(1, int(request.GET.get(param, 1)))
+        except ValueError:
+            page = 1
+        attrs = {'page': page, 'per_page': _config()["INLINE_PER_PAGE"], 'page_param': param, 'query': request.GET}
+        return type(formset.__name__, (formset,), attrs)
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Vendor)
-class VendorAdmin(admin.ModelAdmin):
+class VendorAdmin(ScalableAdmin):
     list_display = ("id", "name", "contact_email", "domain", "created_at")
     search_fields = ("name", "contact_email", "domain")
     list_filter = ("created_at",)
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(ScalableAdmin):
     list_display = ("username", "email", "role", "vendor", "is_active", "is_staff")
-    list_filter = ("role", "vendor", "is_active")
+    list_filter = ("role", ("vendor", AutocompleteFilter), "is_active")
+    list_select_related = ("vendor",)
     search_fields = ("username", "email")
     fieldsets = (
         (None, {"fields": ("username", "email", "password")}),
@@ -22,38 +194,51 @@ class UserAdmin(admin.ModelAdmin):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ScalableAdmin):
     list_display = ("id", "name", "vendor", "price", "quantity", "assigned_to", "created_at")
-    list_filter = ("vendor",)
+    list_filter = (("vendor", AutocompleteFilter),)
+    list_select_related = ("vendor", "assigned_to")
     search_fields = ("name", "sku")
     autocomplete_fields = ("vendor", "assigned_to")
 
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(ScalableAdmin):
     list_display = ("id", "name", "email", "vendor", "phone")
-    list_filter = ("vendor",)
+    list_filter = (("vendor", AutocompleteFilter),)
+    list_select_related = ("vendor",)
     search_fields = ("name", "email")
     autocomplete_fields = ("vendor", "user")
 
 
 # ---------------- Order ----------------
-class OrderItemInline(admin.TabularInline):
+class OrderItemInline(PaginatedTabularInline):
     model = OrderItem
-    extra = 1
+    fields = ("product", "qty", "price")
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("product")
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ScalableAdmin):
     list_display = ("id", "vendor", "customer", "total_amount", "status", "assigned_to", "created_at")
-    list_filter = ("vendor", "status")
+    list_filter = (("vendor", AutocompleteFilter), "status")
+    list_select_related = ("vendor", "customer", "assigned_to")
     search_fields = ("id", "customer__name")
     autocomplete_fields = ("vendor", "customer", "assigned_to")
     inlines = [OrderItemInline]
 
+    def save_model(self, request, obj, form, change):
+        # Status is only editable here, so keep the cached staff loads in step.
+        before = (form.initial.get("assigned_to"), form.initial.get("status")) if change else (None, None)
+        super().save_model(request, obj, form, change)
+        order_changed(obj.vendor_id, before, (obj.assigned_to_id, obj.status))
+
 
 # ---------------- OrderItem ----------------
 @admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
+class OrderItemAdmin(ScalableAdmin):
     list_display = ("id", "order", "product", "qty", "price")
+    list_select_related = ("order", "product")
     autocomplete_fields = ("order", "product")
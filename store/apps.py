@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'store'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import search  # noqa: F401  registers the index job
+        from . import stats  # noqa: F401  registers the rollup job
@@ -0,0 +1,160 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+from django.db.models import Count
+
+from .models import Order, Product, User
+from .response_cache import is_process_local
+
+ORDER, PRODUCT = 'order', 'product'
+
+
+def _config():
+    conf = {
+        "ENABLED": True, "STRATEGY": "least_outstanding", "OPEN_STATUSES": ("pending",),
+        "CACHE_ALIAS": "default", "TTL": 300, "LOCAL_TTL": 30,
+    }
+    conf.update(getattr(settings, 'STAFF_ASSIGNMENT', {}))
+    return conf
+
+
+def _cache():
+    return caches[_config()["CACHE_ALIAS"]]
+
+
+def _roster_key(kind, vendor_id):
+    return 'assign:{}:{}:staff'.format(kind, vendor_id)
+
+
+def _load_key(kind, vendor_id, staff_id):
+    return 'assign:{}:{}:{}'.format(kind, vendor_id, staff_id)
+
+
+def _turn_key(kind, vendor_id):
+    return 'assign:{}:{}:turn'.format(kind, vendor_id)
+
+
+def workload(kind, vendor_id):
+    """Rows that count as staff load: open orders, or all products."""
+    if kind == ORDER:
+        return Order.objects.filter(vendor_id=vendor_id, status__in=_config()["OPEN_STATUSES"])
+    return Product.objects.filter(vendor_id=vendor_id)
+
+
+def outstanding(kind, vendor_id, staff_ids):
+    """Load per staff member, in one grouped query."""
+    counts = dict(
+        workload(kind, vendor_id).filter(assigned_to_id__in=staff_ids)
+        .values_list('assigned_to_id').annotate(n=Count('id')).order_by()
+    )
+    return {staff_id: counts.get(staff_id, 0) for staff_id in staff_ids}
+
+
+def _rebuild(kind, vendor_id):
+    conf = _config()
+    roster = tuple(
+        User.objects.filter(vendor_id=vendor_id, role='staff', is_active=True)
+        .order_by('id').values_list('id', flat=True)
+    )
+    loads = outstanding(kind, vendor_id, roster) if roster else {}
+    # A per-process cache only counts this worker's picks, so it is
+    # reconciled with the database more often.
+    ttl = conf["LOCAL_TTL"] if is_process_local(conf["CACHE_ALIAS"]) else conf["TTL"]
+    cache = _cache()
+    cache.set_many({_load_key(kind, vendor_id, staff_id): load for staff_id, load in loads.items()}, ttl)
+    cache.set(_roster_key(kind, vendor_id), roster, ttl)
+    return roster, loads
+
+
+def staff_loads(kind, vendor_id):
+    """
+    ``(roster, {staff_id: load})`` from the cache; rebuilt with two queries
+    when any entry is missing, e.g. after the TTL bounds drift from writes
+    made outside the API (admin, shell) or, with a per-process cache, from
+    the picks of other workers.
+    """
+    cache = _cache()
+    roster = cache.get(_roster_key(kind, vendor_id))
+    if roster is not None:
+        found = cache.get_many([_load_key(kind, vendor_id, staff_id) for staff_id in roster])
+        if len(found) == len(roster):
+            return roster, {staff_id: found[_load_key(kind, vendor_id, staff_id)] for staff_id in roster}
+    return _rebuild(kind, vendor_id)
+
+
+def _incr(kind, key, delta):
+    """
+    Adjust a cached load once the surrounding transaction commits, so
+    rolled-back or deadlock-retried placements are not counted.
+    """
+    def apply():
+        try:
+            _cache().incr(key, delta)
+        except ValueError:
+            pass  # Expired; the next pick rebuilds it from the database.
+    transaction.on_commit(apply, using=router.db_for_write(Order if kind == ORDER else Product))
+
+
+def pick_staff(kind, vendor_id):
+    """
+    Choose the staff member for a new order/product of ``vendor_id`` and
+    count it against them once the transaction commits. Returns None when
+    assignment is disabled or the vendor has no active staff. Costs a couple
+    of cache reads, no COUNTs.
+    """
+    return pick_staff_many(kind, vendor_id, 1)[0]
+
+
+def pick_staff_many(kind, vendor_id, count):
+    """``pick_staff`` for ``count`` new rows at once, e.g. a bulk import chunk."""
+    conf = _config()
+    if not conf["ENABLED"] or vendor_id is None or not count:
+        return [None] * count
+    roster, loads = staff_loads(kind, vendor_id)
+    if not roster:
+        return [None] * count
+    if conf["STRATEGY"] == "round_robin":
+        cache = _cache()
+        cache.add(_turn_key(kind, vendor_id), -1, None)
+        try:
+            last = cache.incr(_turn_key(kind, vendor_id), count)
+        except ValueError:
+            last = count - 1
+        picks = [roster[turn % len(roster)] for turn in range(last - count + 1, last + 1)]
+    else:
+        loads, picks = dict(loads), []
+        for _ in range(count):
+            staff_id = min(roster, key=lambda candidate: (loads[candidate], candidate))
+            loads[staff_id] += 1
+            picks.append(staff_id)
+    for staff_id, picked in Counter(picks).items():
+        _incr(kind, _load_key(kind, vendor_id, staff_id), picked)
+    return picks
+
+
+def reassigned(kind, vendor_id, old_staff_id, new_staff_id):
+    """Move one unit of load between staff members (either may be None)."""
+    if old_staff_id == new_staff_id or vendor_id is None:
+        return
+    if old_staff_id is not None:
+        _incr(kind, _load_key(kind, vendor_id, old_staff_id), -1)
+    if new_staff_id is not None:
+        _incr(kind, _load_key(kind, vendor_id, new_staff_id), 1)
+
+
+def order_changed(vendor_id, before, after):
+    """
+    Keep order load in step with an update/delete. ``before``/``after`` are
+    ``(assigned_to_id, status)``; only open statuses count as outstanding.
+    """
+    open_statuses = _config()["OPEN_STATUSES"]
+    old = before[0] if before[1] in open_statuses else None
+    new = after[0] if after[1] in open_statuses else None
+    reassigned(ORDER, vendor_id, old, new)
+
+
+def forget(vendor_id):
+    """Force the next pick to reload staff and loads, e.g. after staff changes or a rebalance."""
+    _cache().delete_many([_roster_key(kind, vendor_id) for kind in (ORDER, PRODUCT)])
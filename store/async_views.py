@@ -0,0 +1,89 @@
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.utils.functional import SimpleLazyObject
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import TokenPrincipal, check_user_state, get_validated_token, user_states
+from .middleware import aresolve_tenant
+from .views import OrderViewSet, ProductViewSet
+
+
+class AsyncReadView(View):
+    """
+    Async list/retrieve for a store viewset, for ASGI deployments.
+
+    Scoping, projections and serialization are borrowed from ``viewset_class``
+    so responses match the DRF endpoints byte for byte; only the queries run
+    through the async ORM. Access is limited to owners and staff, as on the
+    viewsets, and authentication is bearer-token only.
+    """
+
+    viewset_class = None
+    replica_reads = True
+    http_method_names = ['get', 'head']
+
+    async def get(self, request, pk=None):
+        try:
+            drf_request = Request(request)
+            drf_request.user = await self.authenticate(request)
+            if isinstance(getattr(request, 'tenant', None), SimpleLazyObject):
+                # Served under WSGI: resolve without touching the sync ORM.
+                request.tenant = await aresolve_tenant(request)
+            viewset = self.viewset_class(
+                request=drf_request, args=(), kwargs={} if pk is None else {'pk': pk},
+                action='list' if pk is None else 'retrieve', format_kwarg=None,
+            )
+            if pk is None:
+                data = await self.list(viewset, drf_request)
+            else:
+                data = await self.retrieve(viewset, pk)
+            return self.render(data)
+        except exceptions.APIException as exc:
+            response = self.render({'detail': exc.detail}, status=exc.status_code)
+            if isinstance(exc, exceptions.NotAuthenticated):
+                response['WWW-Authenticate'] = 'Bearer realm="api"'
+            return response
+
+    async def authenticate(self, request):
+        token = get_validated_token(request)
+        if token is None:
+            raise exceptions.NotAuthenticated()
+        if token.get('role') is None:
+            user = await get_user_model().objects.filter(pk=token[api_settings.USER_ID_CLAIM]).afirst()
+            if user is None:
+                raise exceptions.AuthenticationFailed('User not found')
+        else:
+            user = TokenPrincipal.from_token(token)
+            check_user_state(token, await user_states.aget(user.id))
+        if user.role not in ('owner', 'staff'):
+            raise exceptions.PermissionDenied()
+        return user
+
+    async def list(self, viewset, request):
+        paginator = viewset.paginator
+        rows = await paginator.apaginate_queryset(viewset.get_queryset(), request)
+        return paginator.get_paginated_data(viewset.get_serializer(rows, many=True).data)
+
+    async def retrieve(self, viewset, pk):
+        # The scoped queryset already limits rows to the caller's vendor or
+        # assignments, which is what the viewsets' object permissions check.
+        queryset = viewset.get_queryset()
+        instance = await queryset.filter(pk=pk).afirst()
+        if instance is None:
+            raise exceptions.NotFound('No {} matches the given query.'.format(queryset.model._meta.object_name))
+        return viewset.get_serializer(instance).data
+
+    def render(self, data, status=200):
+        return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+class AsyncProductView(AsyncReadView):
+    viewset_class = ProductViewSet
+
+
+class AsyncOrderView(AsyncReadView):
+    viewset_class = OrderViewSet
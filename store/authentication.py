@@ -0,0 +1,198 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .tenant_cache import LRUCache, get_vendor
+
+
+def _config():
+    conf = {"USER_CHECK_TTL": 30}
+    conf.update(getattr(settings, 'TOKEN_AUTH', {}))
+    return conf
+
+
+class TokenPrincipal:
+    """
+    Lightweight stand-in for ``User`` built from verified access token claims.
+
+    ``id``, ``role``, ``vendor_id`` and ``username`` come straight from the
+    token and ``vendor`` is resolved through the tenant cache. Any other
+    attribute loads the real ``User`` row once and delegates to it.
+    """
+
+    __slots__ = ('id', 'role', 'vendor_id', 'username', '_user')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, role, vendor_id, username):
+        self.id = user_id
+        self.role = role
+        self.vendor_id = vendor_id
+        self.username = username
+        self._user = None
+
+    @classmethod
+    def from_token(cls, validated_token):
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        if isinstance(user_id, str) and user_id.isdigit():
+            # simplejwt writes the claim as a string; keep it comparable with FK ids.
+            user_id = int(user_id)
+        return cls(
+            user_id,
+            validated_token.get('role'),
+            validated_token.get('tenant_id'),
+            validated_token.get('username', ''),
+        )
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def vendor(self):
+        if self.vendor_id is None:
+            return None
+        return get_vendor(self.vendor_id)
+
+    @property
+    def user(self):
+        if self._user is None:
+            self._user = get_user_model().objects.get(pk=self.id)
+        return self._user
+
+    def __getattr__(self, name):
+        # Only reached for attributes that are not slots/properties above.
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __eq__(self, other):
+        if isinstance(other, (TokenPrincipal, get_user_model())):
+            return other.pk == self.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return self.username
+
+
+class UserStateCache:
+    """
+    Per-process memo of each user's ``is_active`` flag and password hash
+    digest, so claims-based authentication still rejects deactivated users
+    (and, with ``CHECK_REVOKE_TOKEN``, tokens issued before a password
+    change) without a ``User`` query per request. Entries live for
+    ``USER_CHECK_TTL`` seconds; saving a user drops its entry in the saving
+    process, other processes notice within the TTL.
+    """
+
+    def __init__(self):
+        self._entries = LRUCache(max_size=100000, ttl=24 * 3600)
+
+    def cached(self, user_id):
+        state, expires_at = self._entries.get(user_id, (None, 0))
+        return state if expires_at >= time.monotonic() else None
+
+    def load(self, user_id):
+        row = get_user_model().objects.filter(pk=user_id).values_list('is_active', 'password').first()
+        state = () if row is None else (row[0], get_md5_hash_password(row[1]))
+        ttl = _config()["USER_CHECK_TTL"]
+        if ttl:
+            self._entries.set(user_id, (state, time.monotonic() + ttl))
+        return state
+
+    def get(self, user_id):
+        state = self.cached(user_id)
+        return self.load(user_id) if state is None else state
+
+    async def aget(self, user_id):
+        state = self.cached(user_id)
+        return await sync_to_async(self.load)(user_id) if state is None else state
+
+    def forget(self, user_id):
+        self._entries.delete(user_id)
+
+    def clear(self):
+        self._entries.clear()
+
+
+user_states = UserStateCache()
+
+
+def check_user_state(validated_token, state):
+    """The checks simplejwt's ``get_user`` makes, against a ``UserStateCache`` entry."""
+    if not state:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    is_active, password_digest = state
+    if api_settings.CHECK_USER_IS_ACTIVE and not is_active:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_digest:
+        raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+
+
+def get_validated_token(request):
+    """
+    Validate the bearer token on ``request`` once and memoize it on the
+    underlying Django request, so TenantMiddleware and DRF share the work.
+    Returns None when there is no (valid) bearer token.
+    """
+    request = getattr(request, '_request', request)
+    cached = getattr(request, '_validated_jwt', None)
+    if cached is not None:
+        return cached or None
+
+    authenticator = TenantJWTAuthentication()
+    token = False
+    header = authenticator.get_header(request)
+    if header is not None:
+        try:
+            raw_token = authenticator.get_raw_token(header)
+            if raw_token is not None:
+                token = authenticator.get_validated_token(raw_token)
+        except (AuthenticationFailed, InvalidToken, TokenError):
+            token = False
+    request._validated_jwt = token
+    return token or None
+
+
+class TenantJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that trusts the token's ``role``/``tenant_id`` claims
+    and returns a ``TokenPrincipal`` instead of loading the ``User`` row;
+    ``is_active`` is checked through ``user_states``. Tokens without a
+    ``role`` claim fall back to the regular user lookup.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = get_validated_token(request)
+        if validated_token is None:
+            # Re-run validation to surface the proper error response.
+            validated_token = self.get_validated_token(raw_token)
+
+        return self.get_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+        if validated_token.get('role') is None:
+            return super().get_user(validated_token)
+        user = TokenPrincipal.from_token(validated_token)
+        check_user_state(validated_token, user_states.get(user.id))
+        return user
@@ -0,0 +1,77 @@
+import json
+import math
+import re
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an unsorted list of numbers."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, int(math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(latencies, elapsed):
+    """Throughput and latency percentiles (ms) for a list of per-call seconds."""
+    count = len(latencies)
+    return {
+        'count': count,
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(count / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def load_collection(path):
+    """
+    Map request names in a Postman v2.1 collection to ``(method, path, body)``
+    with the ``{{base_url}}`` prefix stripped and JSON bodies decoded.
+    """
+    with open(path, encoding='utf-8') as handle:
+        collection = json.load(handle)
+    requests = {}
+
+    def walk(items):
+        for item in items:
+            if 'item' in item:
+                walk(item['item'])
+                continue
+            request = item['request']
+            url = request['url']['raw'] if isinstance(request['url'], dict) else request['url']
+            raw_body = (request.get('body') or {}).get('raw') or ''
+            requests[item['name']] = (
+                request['method'],
+                re.sub(r'^\{\{base_url\}\}', '', url),
+                json.loads(raw_body) if raw_body.strip() else None,
+            )
+
+    walk(collection['item'])
+    return requests
+
+
+def queries_from_server_timing(header):
+    """Query count from the ``db`` entry of a Server-Timing header, or None."""
+    match = re.search(r'db;[^,]*desc="(\d+) queries"', header or '')
+    return int(match.group(1)) if match else None
+
+
+def compare_baselines(baseline, current, tolerance=0.15):
+    """
+    Per-endpoint deltas between two ``bench_load`` reports. An endpoint
+    regresses when its req/s drops or its p95 grows by more than ``tolerance``.
+    Returns ``(rows, regressions)``.
+    """
+    rows, regressions = [], []
+    for name, now in sorted(current['endpoints'].items()):
+        before = baseline['endpoints'].get(name)
+        if before is None:
+            continue
+        rps = (now['rps'] - before['rps']) / before['rps'] if before['rps'] else 0.0
+        p95 = (now['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+        rows.append((name, round(rps * 100, 1), round(p95 * 100, 1)))
+        if rps < -tolerance or p95 > tolerance:
+            regressions.append(name)
+    return rows, regressions
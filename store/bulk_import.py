@@ -0,0 +1,186 @@
+import codecs
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+from django.db import router, transaction
+from rest_framework.exceptions import ParseError
+
+from .assignment import PRODUCT, pick_staff_many
+from .jobs import enqueue
+from .models import Product, User
+from .response_cache import bump_generation
+
+IMPORT_CHUNK_SIZE = 1000
+# Row keys (``clean_row`` output) to the model fields an upsert overwrites.
+UPDATE_FIELDS = {
+    'name': 'name', 'description': 'description', 'price': 'price',
+    'quantity': 'quantity', 'assigned_to_id': 'assigned_to',
+}
+MAX_PRICE = Decimal('99999999.99')
+
+
+def iter_upload_rows(request):
+    """
+    Yield raw row dicts from either a multipart ``file`` CSV upload (read
+    incrementally) or a JSON array body. Returns None for anything else.
+    """
+    upload = request.FILES.get('file')
+    if upload is not None:
+        # Decoding errors would otherwise surface mid-import, after earlier
+        # chunks were written.
+        decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        try:
+            for block in upload.chunks():
+                decoder.decode(block)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            raise ParseError('CSV uploads must be UTF-8 encoded.')
+        upload.seek(0)
+        return csv.DictReader(io.TextIOWrapper(upload.file, encoding='utf-8-sig'))
+    if isinstance(request.data, list):
+        return iter(request.data)
+    return None
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def clean_row(raw, staff_ids):
+    """
+    Validate one row in memory; returns ``(fields, errors)``. Optional
+    columns the row does not carry (and a blank quantity) are left out of
+    ``fields``, so upserts keep the stored values.
+    """
+    if not isinstance(raw, dict):
+        return None, {'non_field_errors': ['Expected an object.']}
+    errors = {}
+    fields = {}
+
+    name = raw.get('name')
+    if _blank(name):
+        errors['name'] = ['This field is required.']
+    elif len(str(name)) > 255:
+        errors['name'] = ['Ensure this field has no more than 255 characters.']
+    else:
+        fields['name'] = str(name).strip()
+
+    sku = raw.get('sku')
+    if _blank(sku):
+        fields['sku'] = None
+    elif len(str(sku)) > 100:
+        errors['sku'] = ['Ensure this field has no more than 100 characters.']
+    else:
+        fields['sku'] = str(sku).strip()
+
+    if 'description' in raw:
+        fields['description'] = '' if raw['description'] is None else str(raw['description'])
+
+    try:
+        price = Decimal(str(raw.get('price')).strip())
+        if not price.is_finite() or price < 0 or price > MAX_PRICE or price.as_tuple().exponent < -2:
+            raise InvalidOperation
+        fields['price'] = price
+    except (InvalidOperation, ValueError):
+        errors['price'] = ['A valid number with at most 2 decimal places is required.']
+
+    quantity = raw.get('quantity')
+    if not _blank(quantity):
+        try:
+            fields['quantity'] = int(quantity)
+            if fields['quantity'] < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors['quantity'] = ['A valid non-negative integer is required.']
+
+    if 'assigned_to' in raw:
+        assigned_to = raw['assigned_to']
+        if _blank(assigned_to):
+            fields['assigned_to_id'] = None
+        else:
+            try:
+                fields['assigned_to_id'] = int(assigned_to)
+            except (TypeError, ValueError):
+                errors['assigned_to'] = ['A valid integer is required.']
+            else:
+                if fields['assigned_to_id'] not in staff_ids:
+                    errors['assigned_to'] = ['Assigned staff must belong to the same vendor.']
+
+    return fields, errors
+
+
+def _write_chunk(vendor, chunk):
+    # Last row wins when the same SKU appears twice in one chunk; a single
+    # INSERT ... ON CONFLICT cannot touch the same row twice.
+    by_sku = {}
+    without_sku = []
+    for fields in chunk:
+        if fields['sku'] is None:
+            without_sku.append(fields)
+        else:
+            by_sku[fields['sku']] = fields
+    using = router.db_for_write(Product)
+    with transaction.atomic(using=using):
+        # New products without an assigned_to column get staff the way API
+        # creates do; existing ones keep theirs.
+        existing = set(
+            Product.objects.filter(vendor=vendor, sku__in=list(by_sku)).values_list('sku', flat=True)) if by_sku else set()
+        unassigned = [
+            fields for fields in without_sku + [f for sku, f in by_sku.items() if sku not in existing]
+            if 'assigned_to_id' not in fields
+        ]
+        for fields, staff_id in zip(unassigned, pick_staff_many(PRODUCT, vendor.id, len(unassigned))):
+            fields['assigned_to_id'] = staff_id
+        # One upsert per set of columns present, so rows only overwrite what they carry.
+        upserts = {}
+        for fields in by_sku.values():
+            upserts.setdefault(tuple(key for key in UPDATE_FIELDS if key in fields), []).append(
+                Product(vendor=vendor, **fields))
+        without_sku = [Product(vendor=vendor, **fields) for fields in without_sku]
+        for columns, products in upserts.items():
+            Product.objects.bulk_create(
+                products,
+                update_conflicts=True,
+                unique_fields=['vendor', 'sku'],
+                update_fields=[UPDATE_FIELDS[key] for key in columns],
+            )
+        if without_sku:
+            Product.objects.bulk_create(without_sku)
+        # bulk_create skips the signal that maintains the search index; a job
+        # indexes the chunk off the request, re-reading rows that kept stored descriptions.
+        product_ids = [product.pk for product in without_sku if product.pk is not None]
+        if by_sku:
+            product_ids += Product.objects.filter(vendor=vendor, sku__in=list(by_sku)).values_list('id', flat=True)
+        if product_ids:
+            enqueue('search.index_products', {'product_ids': product_ids}, vendor_id=vendor.id, using=using)
+
+
+def import_products(vendor, rows, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Validate and upsert product rows on ``(vendor, sku)`` in chunks.
+    Returns a per-row error report; valid rows are written even when others fail.
+    """
+    staff_ids = set(User.objects.filter(vendor=vendor, role='staff').values_list('id', flat=True))
+    report = {'processed': 0, 'upserted': 0, 'failed': 0, 'errors': []}
+    chunk = []
+    for number, raw in enumerate(rows, start=1):
+        report['processed'] += 1
+        fields, errors = clean_row(raw, staff_ids)
+        if errors:
+            report['failed'] += 1
+            report['errors'].append({'row': number, 'errors': errors})
+            continue
+        chunk.append(fields)
+        if len(chunk) >= chunk_size:
+            _write_chunk(vendor, chunk)
+            report['upserted'] += len(chunk)
+            chunk = []
+    if chunk:
+        _write_chunk(vendor, chunk)
+        report['upserted'] += len(chunk)
+
+    # bulk_create bypasses Product signals.
+    if report['upserted']:
+        bump_generation(vendor.id)
+    return report
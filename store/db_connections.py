@@ -0,0 +1,62 @@
+import threading
+from collections import Counter
+
+from django.db import connections
+
+_lock = threading.Lock()
+_connects = Counter()
+
+# psycopg_pool.ConnectionPool.get_stats() keys exported as gauges/counters.
+POOL_GAUGES = ('pool_min', 'pool_max', 'pool_size', 'pool_available', 'requests_waiting')
+POOL_COUNTERS = ('requests_num', 'requests_queued', 'requests_errors', 'connections_num', 'connections_errors')
+
+
+def count_connect(sender, connection, **kwargs):
+    """``connection_created`` receiver: a new connection, or a checkout from a pool."""
+    with _lock:
+        _connects[connection.alias] += 1
+
+
+def connect_counts():
+    with _lock:
+        return dict(_connects)
+
+
+def reset():
+    with _lock:
+        _connects.clear()
+
+
+def mode(alias):
+    settings_dict = connections.settings[alias]
+    if settings_dict.get('OPTIONS', {}).get('pool'):
+        return 'pool'
+    return 'persistent' if settings_dict.get('CONN_MAX_AGE') != 0 else 'none'
+
+
+def pool_stats(alias):
+    """Counters of the alias's psycopg pool in this process, or None if it has none (yet)."""
+    pools = getattr(type(connections[alias]), '_connection_pools', {})
+    pool = pools.get(alias)
+    return pool.get_stats() if pool is not None else None
+
+
+def expose():
+    """Prometheus lines for connects per alias and, in pool mode, the pool counters."""
+    connects = connect_counts()
+    lines = ['# TYPE store_db_connects_total counter']
+    for alias in connections:
+        lines.append('store_db_connects_total{{alias="{}",mode="{}"}} {}'.format(
+            alias, mode(alias), connects.get(alias, 0)))
+    pools = {alias: pool_stats(alias) for alias in connections if mode(alias) == 'pool'}
+    pools = {alias: stats for alias, stats in pools.items() if stats is not None}
+    if pools:
+        lines.append('# TYPE store_db_pool gauge')
+        for alias, stats in pools.items():
+            lines.extend('store_db_pool{{alias="{}",stat="{}"}} {}'.format(alias, key, stats.get(key, 0))
+                         for key in POOL_GAUGES)
+        lines.append('# TYPE store_db_pool_total counter')
+        for alias, stats in pools.items():
+            lines.extend('store_db_pool_total{{alias="{}",stat="{}"}} {}'.format(alias, key, stats.get(key, 0))
+                         for key in POOL_COUNTERS)
+    return lines
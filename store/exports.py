@@ -0,0 +1,60 @@
+import csv
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.http import StreamingHttpResponse
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Spreadsheets evaluate text cells starting with these as formulas.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    """File-like object whose write() hands the row straight back to the generator."""
+
+    def write(self, value):
+        return value
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _cell(value):
+    # Text such as a product name is quoted so it cannot run as a formula;
+    # numbers (e.g. a negative price) are left alone.
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return _plain(value)
+
+
+def csv_rows(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([_cell(value) for value in row])
+
+
+def ndjson_rows(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, (_plain(value) for value in row))), separators=(',', ':')) + '\n'
+
+
+def export_response(export_format, filename, header, rows):
+    """
+    Stream ``rows`` (tuples matching ``header``, typically a values_list
+    iterator) as CSV or NDJSON without materializing them.
+    """
+    generator = csv_rows if export_format == 'csv' else ndjson_rows
+    response = StreamingHttpResponse(generator(header, rows), content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(filename, export_format)
+    return response
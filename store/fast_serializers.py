@@ -0,0 +1,227 @@
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from .instrumentation import serializing
+from .pagination import KeysetPagination
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder produces the same bytes
+    orjson = None
+
+MAX_MAPPERS = 256
+_mappers = {}
+
+# Serializer fields whose representation of a value of these model fields is
+# the value itself.
+IDENTITY = (
+    (serializers.BooleanField, (models.BooleanField,)),
+    (serializers.IntegerField, (models.IntegerField,)),
+    (serializers.CharField, (models.CharField, models.TextField)),
+)
+
+
+def _config():
+    conf = {"ENABLED": True}
+    conf.update(getattr(settings, 'FAST_SERIALIZATION', {}))
+    return conf
+
+
+def _decimal(field):
+    slow = field.to_representation
+    if (not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING) or field.localize
+            or getattr(field, 'normalize_output', False) or field.decimal_places is None):
+        return slow
+    exponent = -field.decimal_places
+
+    def convert(value):
+        # Database values already carry the field's scale, so quantize() is a no-op.
+        if value.__class__ is Decimal and value.as_tuple()[2] == exponent:
+            return format(value, 'f')
+        return slow(value)
+    return convert
+
+
+def _datetime(field):
+    slow = field.to_representation
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if (output_format is None or output_format.lower() != 'iso-8601' or field_timezone is None
+            or (field_timezone is not dt_timezone.utc and str(field_timezone) != 'UTC')):
+        return slow
+
+    def convert(value):
+        if value.tzinfo is dt_timezone.utc:
+            return value.isoformat()[:-6] + 'Z'
+        return slow(value)
+    return convert
+
+
+def _column(model, field):
+    """``(values_list path, converter or None)`` for ``field``, or None if unsupported."""
+    if len(field.source_attrs) != 1:
+        return None
+    try:
+        model_field = model._meta.get_field(field.source)
+    except FieldDoesNotExist:
+        return None
+    if not model_field.concrete:
+        return None
+    if isinstance(field, PrimaryKeyRelatedField):
+        if field.pk_field is not None or not model_field.many_to_one:
+            return None
+        return model_field.attname, None
+    if model_field.is_relation:
+        return None
+    if isinstance(field, serializers.DecimalField):
+        return model_field.attname, _decimal(field)
+    if isinstance(field, serializers.DateTimeField) and isinstance(model_field, models.DateTimeField):
+        return model_field.attname, _datetime(field)
+    for field_class, model_classes in IDENTITY:
+        if type(field) is field_class and isinstance(model_field, model_classes):
+            return model_field.attname, None
+    return None
+
+
+class RowMapper:
+    """
+    A serializer's readable fields compiled into one function, built from a
+    getter per field, that turns a ``values_list()`` row into the dict
+    ``serializer.data`` would hold.
+    Reverse relations serialized with ``many=True`` are loaded with one
+    query per relation and grouped by their foreign key.
+    """
+
+    def __init__(self, model, columns, build, nested):
+        self.model = model
+        self.columns = columns  # values_list() paths; columns[0] is the pk
+        self.build = build
+        self.nested = nested  # [(RowMapper, foreign key attname)]
+
+    def values(self, queryset, *extra):
+        columns = self.columns + [name for name in extra if name not in self.columns]
+        return queryset.prefetch_related(None).values_list(*columns, named=True)
+
+    def rows(self, rows, using):
+        groups = []
+        if self.nested:
+            keys = [row[0] for row in rows]
+            for child, foreign_key in self.nested:
+                found = list(
+                    child.model._default_manager.using(using)
+                    .filter(**{foreign_key + '__in': keys}).order_by('pk')
+                    .values_list(*child.columns, foreign_key)
+                ) if keys else []
+                grouped = {}
+                for raw, data in zip(found, child.rows(found, using)):
+                    grouped.setdefault(raw[-1], []).append(data)
+                groups.append(grouped)
+        build = self.build
+        return [build(row, groups) for row in rows]
+
+
+def _reader(index, convert):
+    """Getter for one ``values_list()`` column of a row."""
+    if convert is None:
+        get = itemgetter(index)
+        return lambda row, groups: get(row)
+    return lambda row, groups: None if row[index] is None else convert(row[index])
+
+
+def _children(position):
+    """Getter for the nested rows grouped under the row's pk."""
+    return lambda row, groups: groups[position].get(row[0]) or []
+
+
+def _builder(items):
+    def build(row, groups):
+        return {name: read(row, groups) for name, read in items}
+    return build
+
+
+def compile_mapper(serializer):
+    """RowMapper equivalent to ``serializer``, or None when a field has no fast form."""
+    if type(serializer).to_representation is not serializers.Serializer.to_representation:
+        return None
+    model = serializer.Meta.model
+    columns, items, nested = [model._meta.pk.attname], [], []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            relation = model._meta.fields_map.get(field.source)
+            child = compile_mapper(field.child) if isinstance(field.child, serializers.ModelSerializer) else None
+            if relation is None or not relation.one_to_many or child is None or child.model is not relation.related_model:
+                return None
+            items.append((name, _children(len(nested))))
+            nested.append((child, relation.field.attname))
+            continue
+        found = _column(model, field)
+        if found is None:
+            return None
+        column, convert = found
+        if column not in columns:
+            columns.append(column)
+        items.append((name, _reader(columns.index(column), convert)))
+    return RowMapper(model, columns, _builder(items), nested)
+
+
+def mapper_for(serializer):
+    """Cached ``compile_mapper``, keyed by serializer class, fields and active timezone."""
+    key = (type(serializer), tuple(serializer.fields), timezone.get_current_timezone_name())
+    if key not in _mappers:
+        if len(_mappers) >= MAX_MAPPERS:
+            _mappers.clear()
+        _mappers[key] = compile_mapper(serializer)
+    return _mappers[key]
+
+
+def render_json(data, renderer, accepted_media_type=None, renderer_context=None):
+    """``renderer.render(data)`` byte for byte, through orjson when it can."""
+    if (orjson is not None and type(renderer) is JSONRenderer and renderer.compact and not renderer.ensure_ascii
+            and renderer.get_indent(accepted_media_type or '', renderer_context or {}) is None):
+        try:
+            content = orjson.dumps(data)
+        except TypeError:
+            pass
+        else:
+            return content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return renderer.render(data, accepted_media_type, renderer_context)
+
+
+class FastListMixin:
+    """
+    ``list`` for JSON clients without per-object serializer work: page rows
+    come from ``values_list()`` and go through the RowMapper compiled from
+    ``get_serializer()``, and the same bytes are rendered as the regular
+    path. Other renderers and unsupported serializers use ``super().list``.
+    """
+
+    def get_fast_mapper(self):
+        if (not _config()["ENABLED"] or type(self.request.accepted_renderer) is not JSONRenderer
+                or not isinstance(self.paginator, KeysetPagination)):
+            return None
+        return mapper_for(self.get_serializer())
+
+    def list(self, request, *args, **kwargs):
+        mapper = self.get_fast_mapper()
+        if mapper is None:
+            return super().list(request, *args, **kwargs)
+        page_queryset = self.paginator.get_page_queryset(self.filter_queryset(self.get_queryset()), request)
+        rows = self.paginator.build_page(list(mapper.values(page_queryset, 'id', 'created_at')))
+        with serializing():
+            data = self.paginator.get_paginated_data(mapper.rows(rows, page_queryset.db))
+            content = render_json(
+                data, request.accepted_renderer, request.accepted_media_type, self.get_renderer_context())
+        return HttpResponse(content, content_type=request.accepted_renderer.media_type)
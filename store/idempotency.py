@@ -0,0 +1,146 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+
+from .inventory import retry_on_deadlock
+from .models import IdempotencyKey, User, Vendor
+
+HEADER = 'Idempotency-Key'
+
+
+def _config():
+    conf = {"TTL": 24 * 3600, "WAIT": 10, "LOCK_TIMEOUT": 30, "POLL_INTERVAL": 0.05}
+    conf.update(getattr(settings, 'IDEMPOTENCY', {}))
+    return conf
+
+
+class KeyInProgress(exceptions.APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'A request with this Idempotency-Key is still being processed.'
+    default_code = 'idempotency_key_in_progress'
+
+
+class KeyReused(exceptions.APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used with a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+def fingerprint(request):
+    """Hash of the method, path and (canonical JSON) body the key was first used with."""
+    body = json.dumps(request.data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256('\n'.join((request.method, request.path, body)).encode()).hexdigest()
+
+
+def replay(record):
+    response = HttpResponse(record.response, status=record.status_code, content_type='application/json')
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(using, scope, digest, conf):
+    """
+    Insert the in-progress row for ``scope``; returns ``(record, claimed)``.
+    Expired rows are replaced, and an in-progress row whose lock ran out
+    (its worker died) is taken over.
+    """
+    now = timezone.now()
+    lock = now + timedelta(seconds=conf["LOCK_TIMEOUT"])
+    keys = IdempotencyKey.objects.using(using)
+    try:
+        with transaction.atomic(using=using):
+            record = keys.create(
+                fingerprint=digest, locked_until=lock, expires_at=now + timedelta(seconds=conf["TTL"]), **scope)
+        return record, True
+    except IntegrityError:
+        pass
+    record = keys.filter(**scope).first()
+    if record is None:
+        # The row we clashed with is gone; only retry if the insert could have
+        # failed on the key and not on a vendor or user that no longer exists.
+        if not User.objects.using(using).filter(pk=scope['user_id']).exists():
+            raise exceptions.AuthenticationFailed('User not found', code='user_not_found')
+        if not Vendor.objects.using(using).filter(pk=scope['vendor_id']).exists():
+            raise exceptions.PermissionDenied('Unknown vendor.')
+        return None, False
+    if record.expires_at <= now:
+        keys.filter(pk=record.pk, expires_at__lte=now).delete()
+        return None, False
+    if record.status_code is None and record.fingerprint == digest and record.locked_until <= now:
+        if keys.filter(pk=record.pk, status_code__isnull=True, locked_until=record.locked_until).update(locked_until=lock):
+            return record, True
+    return record, False
+
+
+def run_once(request, key, handler):
+    """
+    Run ``handler()`` (returning a Response) once per vendor, user and ``key``.
+
+    The first request claims the key and stores its successful response in
+    the same transaction as the handler's writes; repeats replay that
+    response without calling the handler. A duplicate that arrives while the
+    first is still running polls until it finishes (up to ``WAIT`` seconds,
+    then 409). Failed requests release the key so the client can retry.
+    """
+    if not key or len(key) > 255:
+        raise exceptions.ValidationError({HEADER: 'Must be 1-255 characters.'})
+    conf = _config()
+    tenant = getattr(request, 'tenant', None)
+    scope = {'vendor_id': tenant.id if tenant else request.user.vendor_id, 'user_id': request.user.id, 'key': key}
+    if scope['vendor_id'] is None:
+        raise exceptions.PermissionDenied('Idempotency-Key needs a vendor to scope it to.')
+    using = router.db_for_write(IdempotencyKey, instance=IdempotencyKey(vendor_id=scope['vendor_id']))
+    digest = fingerprint(request)
+
+    deadline = time.monotonic() + conf["WAIT"]
+    while True:
+        record, claimed = _claim(using, scope, digest, conf)
+        if claimed:
+            break
+        if record is not None:
+            if record.fingerprint != digest:
+                raise KeyReused()
+            if record.status_code is not None:
+                return replay(record)
+        if time.monotonic() >= deadline:
+            raise KeyInProgress()
+        time.sleep(conf["POLL_INTERVAL"])
+
+    def attempt():
+        with transaction.atomic(using=using):
+            response = handler()
+            if status.is_success(response.status_code):
+                # Stored rendered so replays match the original byte for byte.
+                IdempotencyKey.objects.using(using).filter(pk=record.pk).update(
+                    status_code=response.status_code, locked_until=None,
+                    response=JSONRenderer().render(response.data).decode(),
+                )
+            return response
+
+    try:
+        response = retry_on_deadlock(attempt, using=using)
+    except Exception:
+        IdempotencyKey.objects.using(using).filter(pk=record.pk, status_code__isnull=True).delete()
+        raise
+    if not status.is_success(response.status_code):
+        IdempotencyKey.objects.using(using).filter(pk=record.pk, status_code__isnull=True).delete()
+    return response
+
+
+def purge_expired(using, batch_size=1000):
+    """Delete expired keys on ``using`` in batches; returns the number removed."""
+    deleted = 0
+    keys = IdempotencyKey.objects.using(using)
+    while True:
+        ids = list(keys.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += keys.filter(pk__in=ids).delete()[0]
@@ -0,0 +1,253 @@
+import heapq
+import hmac
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework import serializers
+
+from . import db_connections
+from .authentication import get_validated_token
+from .tenant_cache import tenant_cache
+
+logger = logging.getLogger('store.slow_requests')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+# Anything else a client sends is counted as "other".
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+_current = ContextVar('store_request_metrics', default=None)
+
+
+def _config():
+    conf = {
+        "ENABLED": True, "SERVER_TIMING": False, "SLOW_REQUEST_MS": 1000, "SLOW_QUERY_COUNT": 5,
+        "TENANT_LABEL": True, "METRICS_TOKEN": None, "MAX_SERIES": 2000,
+    }
+    conf.update(getattr(settings, 'STORE_METRICS', {}))
+    return conf
+
+
+class RequestMetrics:
+    """Counters for one request; queries keep only the N slowest statements."""
+
+    __slots__ = ('started', 'queries', 'db_time', 'serializer_time', 'serializing', 'slowest', 'keep')
+
+    def __init__(self, keep):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializing = False
+        self.slowest = []
+        self.keep = keep
+
+    def add_query(self, duration, alias, sql):
+        self.queries += 1
+        self.db_time += duration
+        if self.keep:
+            # Parameters are not kept: they may hold password hashes or personal data.
+            entry = (duration, self.queries, alias, sql)
+            if len(self.slowest) < self.keep:
+                heapq.heappush(self.slowest, entry)
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+
+def start_request():
+    """Begin collecting for the current request; None when metrics are disabled."""
+    conf = _config()
+    if not conf["ENABLED"]:
+        return None
+    metrics = RequestMetrics(conf["SLOW_QUERY_COUNT"])
+    _current.set(metrics)
+    return metrics
+
+
+def finish_request(request, response, metrics):
+    """Record the request in the registry, add Server-Timing and log it if slow."""
+    _current.set(None)
+    wall = time.perf_counter() - metrics.started
+    conf = _config()
+    labels = request_labels(request, conf)
+    registry.observe(labels, wall, metrics)
+    if conf["SERVER_TIMING"]:
+        response['Server-Timing'] = server_timing(wall, metrics)
+    if wall * 1000 >= conf["SLOW_REQUEST_MS"]:
+        log_slow_request(labels, wall, metrics)
+    return response
+
+
+def query_timer(execute, sql, params, many, context):
+    """``execute_wrapper`` installed on every connection (see ``install_query_timer``)."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(time.perf_counter() - start, context['connection'].alias, sql)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+@contextmanager
+def serializing():
+    """Counts the block as serializer time of the current request (outermost block only)."""
+    metrics = _current.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - start
+        metrics.serializing = False
+
+
+class TimedSerializerMixin:
+    """Adds the time spent producing ``.data`` to the current request's metrics."""
+
+    @property
+    def data(self):
+        with serializing():
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][index] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def expose(self, label_names):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} histogram'.format(self.name)]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            base = ','.join('{}="{}"'.format(name, _escape(value)) for name, value in zip(label_names, labels))
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(self.name, base, bound, cumulative))
+            lines.append('{}_bucket{{{},le="+Inf"}} {}'.format(self.name, base, count))
+            lines.append('{}_sum{{{}}} {}'.format(self.name, base, repr(total)))
+            lines.append('{}_count{{{}}} {}'.format(self.name, base, count))
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    """
+    In-process Prometheus histograms labelled by view, method and tenant.
+    Each worker process keeps its own registry, so scrape every worker (or
+    run one worker per target) when serving with several processes. Past
+    ``MAX_SERIES`` label sets, new tenants are counted as ``tenant="other"``.
+    """
+
+    label_names = ('view', 'method', 'tenant')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.duration = Histogram('store_request_duration_seconds', 'Wall time per request.', LATENCY_BUCKETS)
+            self.db = Histogram('store_request_db_seconds', 'Database time per request.', LATENCY_BUCKETS)
+            self.serializer = Histogram('store_request_serializer_seconds', 'Serializer time per request.', LATENCY_BUCKETS)
+            self.queries = Histogram('store_request_queries', 'Database queries per request.', QUERY_BUCKETS)
+
+    def observe(self, labels, wall, metrics):
+        with self._lock:
+            if labels not in self.duration.series and len(self.duration.series) >= _config()["MAX_SERIES"]:
+                labels = labels[:2] + ('other',)
+            self.duration.observe(labels, wall)
+            self.db.observe(labels, metrics.db_time)
+            self.serializer.observe(labels, metrics.serializer_time)
+            self.queries.observe(labels, metrics.queries)
+
+    def expose(self):
+        with self._lock:
+            lines = []
+            for histogram in (self.duration, self.db, self.serializer, self.queries):
+                lines.extend(histogram.expose(self.label_names))
+        stats = tenant_cache.stats()
+        lines.append('# TYPE store_tenant_cache_lookups_total counter')
+        for result in ('local_hits', 'shared_hits', 'misses'):
+            lines.append('store_tenant_cache_lookups_total{{result="{}"}} {}'.format(result, stats[result]))
+        lines.append('# TYPE store_tenant_cache_size gauge')
+        lines.append('store_tenant_cache_size {}'.format(stats['size']))
+        lines.extend(db_connections.expose())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def request_labels(request, conf):
+    match = getattr(request, 'resolver_match', None)
+    view = match.view_name if match is not None and match.view_name else '<unmatched>'
+    method = request.method if request.method in METHODS else 'other'
+    tenant = ''
+    if conf["TENANT_LABEL"]:
+        # Only from a verified token (never the client's X-Tenant-ID header),
+        # and without resolving the tenant.
+        token = get_validated_token(request)
+        tenant = token.get('tenant_id') if token is not None else ''
+    return view, method, str(tenant or '')
+
+
+def server_timing(wall, metrics):
+    return 'db;dur={:.2f};desc="{} queries", ser;dur={:.2f}, app;dur={:.2f}'.format(
+        metrics.db_time * 1000, metrics.queries, metrics.serializer_time * 1000, wall * 1000)
+
+
+def log_slow_request(labels, wall, metrics):
+    lines = ['{} {} tenant={} took {:.1f}ms: {} queries in {:.1f}ms, serializer {:.1f}ms'.format(
+        labels[1], labels[0], labels[2] or '-', wall * 1000, metrics.queries, metrics.db_time * 1000,
+        metrics.serializer_time * 1000)]
+    for duration, _, alias, sql in sorted(metrics.slowest, reverse=True):
+        lines.append('  {:.1f}ms [{}] {}'.format(duration * 1000, alias, sql))
+    logger.warning('\n'.join(lines))
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition, guarded by ``STORE_METRICS['METRICS_TOKEN']``.
+    Without a token it is only served with DEBUG on.
+    """
+    token = _config()["METRICS_TOKEN"]
+    if not token and not settings.DEBUG:
+        return HttpResponseForbidden()
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer {}'.format(token)):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,104 @@
+import random
+import time
+from collections import defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Product
+
+DEADLOCK_SQLSTATES = ('40P01', '40001')
+MYSQL_DEADLOCK_CODES = (1205, 1213)
+
+
+class InsufficientStock(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Insufficient stock.'
+    default_code = 'insufficient_stock'
+
+    def __init__(self, short_lines):
+        super().__init__()
+        self.detail = {'detail': self.default_detail, 'short': short_lines}
+
+
+class _Shortfall(Exception):
+    pass
+
+
+def aggregate_lines(items):
+    """Collapse order lines into {product_id: qty}, ordered by product id."""
+    lines = defaultdict(int)
+    for item in items:
+        lines[item['product'].id] += item['qty']
+    return dict(sorted(lines.items()))
+
+
+def _target_ids(product_ids, using):
+    # On PostgreSQL, take the row locks through an ordered FOR UPDATE
+    # subquery so that concurrent orders over the same products always lock
+    # them in ascending id order instead of whatever order the plan picks.
+    if connections[using].vendor == 'postgresql':
+        return Product.objects.using(using).filter(id__in=product_ids).order_by('id').select_for_update().values('id')
+    return product_ids
+
+
+def reserve_stock(lines, using=DEFAULT_DB_ALIAS):
+    """
+    Atomically decrement stock for ``{product_id: qty}`` with one conditional
+    UPDATE. Either every line is reserved and ``[]`` is returned, or nothing
+    is changed and the short lines are returned as
+    ``{'product', 'requested', 'available'}`` dicts.
+    """
+    if not lines:
+        return []
+
+    wanted = Case(
+        *[When(id=product_id, then=Value(qty)) for product_id, qty in lines.items()],
+        output_field=IntegerField(),
+    )
+    try:
+        with transaction.atomic(using=using):
+            updated = (
+                Product.objects.using(using)
+                .filter(id__in=_target_ids(list(lines), using), quantity__gte=wanted)
+                .update(quantity=F('quantity') - wanted)
+            )
+            if updated != len(lines):
+                raise _Shortfall
+    except _Shortfall:
+        available = dict(Product.objects.using(using).filter(id__in=list(lines)).values_list('id', 'quantity'))
+        return [
+            {'product': product_id, 'requested': qty, 'available': available.get(product_id, 0)}
+            for product_id, qty in lines.items()
+            if available.get(product_id, 0) < qty
+        ]
+    return []
+
+
+def is_deadlock(exc):
+    cause = exc.__cause__
+    code = getattr(cause, 'pgcode', None) or getattr(cause, 'sqlstate', None)
+    if code in DEADLOCK_SQLSTATES:
+        return True
+    args = getattr(cause, 'args', ())
+    if args and args[0] in MYSQL_DEADLOCK_CODES:
+        return True
+    message = str(exc).lower()
+    return 'deadlock' in message or 'database is locked' in message
+
+
+def retry_on_deadlock(func, attempts=3, backoff=0.05, using=DEFAULT_DB_ALIAS):
+    """
+    Call ``func`` and retry it with jittered exponential backoff when the
+    database reports a deadlock or serialization failure. Retrying is only
+    safe for the outermost transaction, so nested calls re-raise.
+    """
+    for attempt in range(attempts):
+        try:
+            return func()
+        except OperationalError as exc:
+            if attempt == attempts - 1 or connections[using].in_atomic_block or not is_deadlock(exc):
+                raise
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
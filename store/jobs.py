@@ -0,0 +1,137 @@
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .inventory import retry_on_deadlock
+from .models import Job
+from .sharding import pinned
+
+logger = logging.getLogger('store.jobs')
+
+_tasks = {}
+
+
+def _config():
+    conf = {
+        "BATCH_SIZE": 50, "THREADS": 4, "POLL_INTERVAL": 1.0, "LEASE": 300,
+        "MAX_ATTEMPTS": 5, "BACKOFF": 2.0, "MAX_BACKOFF": 3600, "RUN_INLINE": False,
+    }
+    conf.update(getattr(settings, 'JOBS', {}))
+    return conf
+
+
+def task(name, max_attempts=None):
+    """Register ``func(payload)`` as the handler for jobs called ``name``."""
+    def register(func):
+        _tasks[name] = (func, max_attempts)
+        return func
+    return register
+
+
+def enqueue(name, payload, vendor_id=None, using=None, delay=0):
+    """
+    Add a job to the outbox. Call it inside the transaction that writes the
+    data the job refers to, on the same alias, so both commit or neither does.
+    With ``RUN_INLINE`` (no worker deployed) due jobs run once it commits.
+    """
+    if name not in _tasks:
+        raise KeyError('Unknown job {!r}.'.format(name))
+    job = Job(
+        name=name, payload=payload, vendor_id=vendor_id,
+        max_attempts=_tasks[name][1] or _config()["MAX_ATTEMPTS"],
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+    using = using or router.db_for_write(Job, instance=job)
+    job.save(using=using)
+    if _config()["RUN_INLINE"]:
+        transaction.on_commit(lambda: run_pending(using=using), using=using)
+    return job
+
+
+def queue_aliases():
+    """Databases that hold a job table: ``default`` and shards, never replicas."""
+    return [alias for alias in connections if router.allow_migrate_model(alias, Job)]
+
+
+def claim(using, limit, lease):
+    """
+    Lease up to ``limit`` due jobs on ``using`` and count the attempt. Jobs
+    whose lease ran out (their worker died) are due again. With ``SKIP LOCKED`` concurrent
+    workers never wait on each other's rows; elsewhere each row is claimed
+    with a conditional update so a job is still handed out once.
+    """
+    now = timezone.now()
+    due = Job.objects.using(using).filter(
+        Q(status=Job.PENDING, run_after__lte=now) | Q(status=Job.RUNNING, locked_until__lte=now)
+    ).order_by('run_after')
+    lease_until = now + timedelta(seconds=lease)
+    with transaction.atomic(using=using):
+        if connections[using].features.has_select_for_update_skip_locked:
+            ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.using(using).filter(pk__in=ids).update(
+                status=Job.RUNNING, locked_until=lease_until, attempts=F('attempts') + 1)
+        else:
+            ids = [
+                pk for pk, status, locked_until in due.values_list('pk', 'status', 'locked_until')[:limit]
+                if Job.objects.using(using).filter(pk=pk, status=status, locked_until=locked_until)
+                .update(status=Job.RUNNING, locked_until=lease_until, attempts=F('attempts') + 1)
+            ]
+    return list(Job.objects.using(using).filter(pk__in=ids).order_by('run_after'))
+
+
+def backoff(attempts, conf):
+    """Seconds before retry number ``attempts``: exponential, capped, with jitter."""
+    delay = min(conf["BACKOFF"] * 2 ** (attempts - 1), conf["MAX_BACKOFF"])
+    return delay * (1 + random.random() / 4)
+
+
+def run(job):
+    """
+    Run one leased job. The handler's writes and the job's removal share a
+    transaction, so a crash in between leaves neither and the job reruns.
+    The row is removed first: that locks it for the rest of the transaction,
+    and a job deleted since it was leased (see backfill_stats) is skipped.
+    Sharded queries inside the handler follow the job's database.
+    """
+    using = job._state.db
+    func, _ = _tasks.get(job.name, (None, None))
+
+    def attempt():
+        with pinned(using), transaction.atomic(using=using):
+            if Job.objects.using(using).filter(pk=job.pk).delete()[0]:
+                func(job.payload)
+
+    try:
+        if func is None:
+            raise KeyError('No handler registered for job {!r}.'.format(job.name))
+        # Lock conflicts between worker threads are retried on the spot.
+        retry_on_deadlock(attempt, using=using)
+        return True
+    except Exception:
+        failed = func is None or job.attempts >= job.max_attempts
+        logger.warning('Job %s (%s) attempt %s failed', job.pk, job.name, job.attempts, exc_info=True)
+        Job.objects.using(using).filter(pk=job.pk).update(
+            status=Job.FAILED if failed else Job.PENDING, locked_until=None,
+            run_after=timezone.now() + timedelta(seconds=0 if failed else backoff(job.attempts, _config())),
+            last_error=traceback.format_exc()[-4000:],
+        )
+        return False
+
+
+def run_pending(using=None, limit=None):
+    """Run due jobs inline until none are left (tests and one-off drains)."""
+    conf = _config()
+    done = 0
+    for alias in [using] if using else queue_aliases():
+        while True:
+            jobs = claim(alias, limit or conf["BATCH_SIZE"], conf["LEASE"])
+            if not jobs:
+                break
+            done += sum(1 for job in jobs if run(job))
+    return done
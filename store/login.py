@@ -0,0 +1,196 @@
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from rest_framework import exceptions
+
+from .tenant_cache import LRUCache
+
+logger = logging.getLogger('store.login')
+
+# Verified against when the username does not exist, so unknown users cost
+# the same hashing work as wrong passwords.
+_DUMMY_PASSWORD = make_password(None)
+
+
+def _config():
+    conf = {
+        "HASH_WORKERS": os.cpu_count() or 2, "HASH_EXECUTOR": "thread", "MAX_PENDING": 64,
+        "USER_ATTEMPTS": 10, "IP_ATTEMPTS": 100, "WINDOW": 60,
+        "VERIFIED_CACHE_TTL": 0, "REFRESH_REVOCATION_CHECK": False, "TRUSTED_PROXY_HOPS": 0,
+    }
+    conf.update(getattr(settings, 'STORE_LOGIN', {}))
+    return conf
+
+
+class PoolBusy(exceptions.APIException):
+    status_code = 503
+    default_detail = 'Too many logins in progress, try again shortly.'
+    default_code = 'login_busy'
+
+
+class HashPool:
+    """
+    Bounded executor for password verification. The calling request still
+    waits for its hash, so a sync worker with one thread is busy for the
+    whole verification either way. What the pool adds is a cap on how many
+    hashes burn CPU at once across a worker's threads (``GUNICORN_THREADS``,
+    or the ASGI server's thread pool; PBKDF2 releases the GIL), and beyond
+    ``MAX_PENDING`` queued verifications logins fail fast with 503 instead
+    of piling up behind it.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = None
+
+    def _ensure(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    conf = _config()
+                    executor_class = ProcessPoolExecutor if conf["HASH_EXECUTOR"] == "process" else ThreadPoolExecutor
+                    self._slots = threading.BoundedSemaphore(conf["HASH_WORKERS"] + conf["MAX_PENDING"])
+                    self._executor = executor_class(max_workers=conf["HASH_WORKERS"])
+        return self._executor
+
+    def verify(self, password, encoded):
+        executor = self._ensure()
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusy()
+        try:
+            return executor.submit(check_password, password, encoded).result()
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+hash_pool = HashPool()
+
+
+class AttemptLimiter:
+    """Fixed-window attempt counter per key, kept in process memory."""
+
+    def __init__(self, max_size=100000):
+        # Entries outlive any sane window; ``hit`` resets expired windows itself.
+        self._counts = LRUCache(max_size=max_size, ttl=24 * 3600)
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window):
+        """Count one attempt; returns seconds to wait when over ``limit``, else 0."""
+        now = time.monotonic()
+        with self._lock:
+            started, count = self._counts.get(key, (now, 0))
+            if now - started >= window:
+                started, count = now, 0
+            count += 1
+            self._counts.set(key, (started, count))
+        if count > limit:
+            return max(1, int(started + window - now))
+        return 0
+
+    def clear(self):
+        self._counts.clear()
+
+
+attempts = AttemptLimiter()
+_unset_hops_warned = False
+
+
+def client_ip(request):
+    """
+    The client address for per-IP limits. Behind ``TRUSTED_PROXY_HOPS``
+    reverse proxies it is that many entries from the right of
+    ``X-Forwarded-For`` (earlier entries are client-supplied); requests that
+    did not pass through all of them fall back to ``REMOTE_ADDR``.
+    """
+    global _unset_hops_warned
+    hops = _config()["TRUSTED_PROXY_HOPS"]
+    header = request.META.get('HTTP_X_FORWARDED_FOR', '')
+    if hops:
+        forwarded = [addr.strip() for addr in header.split(',') if addr.strip()]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    elif header and not _unset_hops_warned:
+        _unset_hops_warned = True
+        logger.warning(
+            'X-Forwarded-For is set but TRUSTED_PROXY_HOPS is 0: per-IP login limits count every '
+            'client behind the proxy as %s. Set LOGIN_TRUSTED_PROXY_HOPS.', request.META.get('REMOTE_ADDR'))
+    return request.META.get('REMOTE_ADDR')
+
+
+def check_login_rate(username, ip):
+    """Seconds the client must wait before another login attempt, or 0."""
+    conf = _config()
+    waits = []
+    if conf["USER_ATTEMPTS"] and username:
+        waits.append(attempts.hit(('user', username.lower()), conf["USER_ATTEMPTS"], conf["WINDOW"]))
+    if conf["IP_ATTEMPTS"] and ip:
+        waits.append(attempts.hit(('ip', ip), conf["IP_ATTEMPTS"], conf["WINDOW"]))
+    return max(waits, default=0)
+
+
+class VerifiedCache:
+    """
+    Optional short-lived memo of recent successful verifications, keyed by
+    user and the stored hash, holding an HMAC of the password under
+    SECRET_KEY. A password change alters the stored hash and so misses.
+    Disabled unless ``VERIFIED_CACHE_TTL`` is set.
+    """
+
+    def __init__(self):
+        self._entries = LRUCache(max_size=10000, ttl=24 * 3600)
+
+    def _digest(self, password, encoded):
+        return hmac.new(settings.SECRET_KEY.encode(), (encoded + '\0' + password).encode(), hashlib.sha256).digest()
+
+    def check(self, user_id, password, encoded):
+        if not _config()["VERIFIED_CACHE_TTL"]:
+            return False
+        digest, expires_at = self._entries.get((user_id, encoded), (None, 0))
+        if digest is None or expires_at < time.monotonic():
+            return False
+        return hmac.compare_digest(digest, self._digest(password, encoded))
+
+    def remember(self, user_id, password, encoded):
+        ttl = _config()["VERIFIED_CACHE_TTL"]
+        if ttl:
+            self._entries.set((user_id, encoded), (self._digest(password, encoded), time.monotonic() + ttl))
+
+    def clear(self):
+        self._entries.clear()
+
+
+verified_cache = VerifiedCache()
+
+
+def verify_password(user, password):
+    """
+    Check ``password`` for ``user`` (None for an unknown username) through the
+    hash pool. Upgrades the stored hash when the hasher settings changed.
+    """
+    if user is None:
+        hash_pool.verify(password, _DUMMY_PASSWORD)
+        return False
+    encoded = user.password
+    if verified_cache.check(user.pk, password, encoded):
+        return True
+    if not hash_pool.verify(password, encoded):
+        return False
+    if identify_hasher(encoded).must_update(encoded):
+        user.set_password(password)
+        user.save(update_fields=['password'])
+    verified_cache.remember(user.pk, password, user.password)
+    return True
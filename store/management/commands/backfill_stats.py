@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from store.models import Job, Order, OrderItem, VendorDailyStats, ProductDailyStats
+from store.sharding import pinned
+from store.stats import Deltas
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily vendor/product rollups from existing orders in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendor', type=int, help='Only rebuild this vendor.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Shard alias to rebuild.')
+
+    def handle(self, *args, **opts):
+        with pinned(opts['database']):
+            self.backfill(opts)
+
+    def backfill(self, opts):
+        orders = Order.objects.all()
+        if opts['vendor']:
+            orders = orders.filter(vendor_id=opts['vendor'])
+
+        # Orders placed after this point are recorded by their queued jobs.
+        last_id = orders.order_by('-id').values_list('id', flat=True).first()
+        if last_id is None:
+            self.stdout.write('No orders to backfill.')
+            return
+
+        with transaction.atomic(using=opts['database']):
+            scope = {'vendor_id': opts['vendor']} if opts['vendor'] else {}
+            # Queued rollups for orders this run covers would count them twice.
+            # Deleting them first waits for any a worker is running (it holds
+            # the row until it commits) and makes leased ones skip themselves.
+            Job.objects.filter(name='stats.record_order', payload__order_id__lte=last_id, **scope).delete()
+            VendorDailyStats.objects.filter(**scope).delete()
+            ProductDailyStats.objects.filter(**scope).delete()
+
+        cursor, total = 0, 0
+        while True:
+            batch = list(
+                orders.filter(id__gt=cursor, id__lte=last_id)
+                .order_by('id')
+                .values_list('id', 'vendor_id', 'created_at')[:opts['batch_size']]
+            )
+            if not batch:
+                break
+            lines = {}
+            for order_id, product_id, qty, price in (
+                OrderItem.objects.filter(order_id__in=[row[0] for row in batch])
+                .values_list('order_id', 'product_id', 'qty', 'price')
+            ):
+                lines.setdefault(order_id, []).append((product_id, qty, price))
+
+            deltas = Deltas()
+            for order_id, vendor_id, created_at in batch:
+                deltas.add_order(vendor_id, created_at, lines.get(order_id, []))
+            deltas.apply()
+
+            cursor = batch[-1][0]
+            total += len(batch)
+            self.stdout.write('Backfilled {} orders (up to id {}).'.format(total, cursor))
+
+        self.stdout.write(self.style.SUCCESS('Done: {} orders.'.format(total)))
@@ -0,0 +1,111 @@
+import copy
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connections
+
+from store.benchmarking import summarize
+from store.db_connections import connect_counts, pool_stats
+from store.models import Product
+from store.sharding import pinned
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-request connection overhead: run a primary-key product lookup (the query "
+        "behind GET /api/products/{id}/) inside the request_started/request_finished signals, "
+        "so Django opens, reuses or checks out connections exactly as it does per request, "
+        "with connection reuse off, persistent connections and (PostgreSQL + psycopg 3) a pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Requests per mode.')
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--modes', default='none,persistent,pool',
+                            help='Comma-separated subset of none, persistent, pool.')
+
+    def handle(self, *args, **opts):
+        alias = opts['database']
+        if alias not in connections:
+            raise CommandError('Unknown database alias {!r}.'.format(alias))
+        with pinned(alias):
+            product_id = Product.objects.using(alias).values_list('id', flat=True).first()
+        if product_id is None:
+            raise CommandError('No products on {!r}; seed some first.'.format(alias))
+        original = copy.deepcopy(connections.settings[alias])
+        conf = settings.DB_CONNECTIONS
+        try:
+            for mode in opts['modes'].split(','):
+                mode = mode.strip()
+                if not self.configure(alias, mode, original, conf):
+                    self.stdout.write('{:<10}  skipped (needs PostgreSQL with psycopg 3 and psycopg_pool)'.format(mode))
+                    continue
+                stats, connects = self.run(alias, product_id, opts['requests'])
+                line = '{:<10}  p50={p50_ms}ms  p95={p95_ms}ms  p99={p99_ms}ms  {rps:>8} req/s  connects={connects}'.format(
+                    mode, connects=connects, **stats)
+                if mode == 'pool':
+                    pool = pool_stats(alias) or {}
+                    line += '  pool_size={}  connections_num={}'.format(
+                        pool.get('pool_size'), pool.get('connections_num'))
+                self.stdout.write(line)
+        finally:
+            self.configure(alias, None, original, conf)
+
+    def configure(self, alias, mode, original, conf):
+        """Reset ``alias`` to ``mode`` (None restores the configured settings)."""
+        connection = connections[alias]
+        connection.close()
+        if hasattr(connection, 'close_pool') and connection.pool:
+            connection.close_pool()
+        # The wrapper holds this very dict, so edits apply from its next connect.
+        settings_dict = connections.settings[alias]
+        settings_dict.clear()
+        settings_dict.update(copy.deepcopy(original))
+        if mode is None:
+            return True
+        settings_dict.get('OPTIONS', {}).pop('pool', None)
+        if mode == 'none':
+            settings_dict['CONN_MAX_AGE'] = 0
+        elif mode == 'persistent':
+            settings_dict['CONN_MAX_AGE'] = conf['CONN_MAX_AGE'] or None  # 0 would mean "none"
+            settings_dict['CONN_HEALTH_CHECKS'] = conf['HEALTH_CHECKS']
+        elif mode == 'pool':
+            if settings_dict['ENGINE'] != 'django.db.backends.postgresql' or not self.has_pool():
+                return False
+            settings_dict['CONN_MAX_AGE'] = 0
+            settings_dict.setdefault('OPTIONS', {})['pool'] = {
+                'min_size': conf['POOL_SIZE'],
+                'max_size': conf['POOL_SIZE'] + conf['POOL_OVERFLOW'],
+                'timeout': conf['POOL_TIMEOUT'],
+            }
+        else:
+            raise CommandError('Unknown mode {!r}.'.format(mode))
+        return True
+
+    def has_pool(self):
+        try:
+            import psycopg  # noqa: F401
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def run(self, alias, product_id, count):
+        products = Product.objects.using(alias).filter(pk=product_id)
+        before = connect_counts().get(alias, 0)
+        latencies = []
+        started = time.perf_counter()
+        with pinned(alias):
+            for _ in range(count):
+                start = time.perf_counter()
+                request_started.send(sender=WSGIHandler, environ={})
+                try:
+                    list(products.values_list('id', 'name', 'price'))
+                finally:
+                    request_finished.send(sender=WSGIHandler)
+                latencies.append(time.perf_counter() - start)
+        elapsed = time.perf_counter() - started
+        return summarize(latencies, elapsed), connect_counts().get(alias, 0) - before
@@ -0,0 +1,250 @@
+import http.client
+import json
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from store.benchmarking import compare_baselines, load_collection, queries_from_server_timing, summarize
+from store.models import Customer, Order, OrderItem, Product, User, Vendor
+from store.token_serializers import MyTokenObtainPairSerializer
+
+COLLECTION = 'Multi-Tenant E-Commerce.postman_collection.json'
+PASSWORD = 'bench-load-pass'
+
+# Benchmark endpoint -> (request name in the Postman collection, role that sends it).
+ENDPOINTS = {
+    'login': ('Customer Login', 'customer'),
+    'list_products': ('Staff: List Products (assigned)', 'owner'),
+    'place_order': ('Place Order (customer)', 'customer'),
+    'list_orders': ('Owner: List Orders', 'owner'),
+}
+
+# Relative weights of each endpoint per traffic mix.
+MIXES = {
+    'browse': {'list_products': 70, 'list_orders': 25, 'login': 5},
+    'checkout': {'list_products': 40, 'place_order': 40, 'list_orders': 10, 'login': 10},
+    'mixed': {'login': 5, 'list_products': 45, 'place_order': 20, 'list_orders': 30},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic multi-vendor dataset and replay a weighted mix of the Postman "
+        "collection's login / list products / place order / list orders requests concurrently, "
+        "in-process through the WSGI test client or against a running server (--url). Reports "
+        "req/s, p50/p95/p99 and queries per request per endpoint; --save/--compare JSON baselines."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+        parser.add_argument('--requests', type=int, default=1000, help='Total requests to replay.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--vendors', type=int, default=3)
+        parser.add_argument('--products', type=int, default=200, help='Products per vendor.')
+        parser.add_argument('--customers', type=int, default=20, help='Customers per vendor.')
+        parser.add_argument('--orders', type=int, default=200, help='Seeded orders per vendor.')
+        parser.add_argument('--items', type=int, default=3, help='Items per seeded and placed order.')
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:8000. Default: in-process.')
+        parser.add_argument('--collection', default=str(settings.BASE_DIR / COLLECTION))
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the request mix.')
+        parser.add_argument('--save', help='Write the report to this JSON file.')
+        parser.add_argument('--compare', help='Compare against a saved JSON baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed req/s drop / p95 growth (fraction).')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded benchmark data.')
+
+    def handle(self, *args, **opts):
+        templates = load_collection(opts['collection'])
+        missing = [name for name, _ in ENDPOINTS.values() if name not in templates]
+        if missing:
+            raise CommandError('Collection has no request named {}.'.format(', '.join(missing)))
+
+        run = uuid.uuid4().hex[:8]
+        vendors = []
+        try:
+            started = time.perf_counter()
+            tenants = self.seed(run, opts, vendors)
+            self.stdout.write('seeded {} vendors in {:.1f}s'.format(len(tenants), time.perf_counter() - started))
+            report = self.replay(templates, tenants, opts)
+        finally:
+            if not opts['keep']:
+                OrderItem.objects.filter(order__vendor__in=vendors).delete()
+                User.objects.filter(vendor__in=vendors).delete()
+                Vendor.objects.filter(pk__in=[vendor.pk for vendor in vendors]).delete()
+
+        self.print_report(report)
+        if opts['save']:
+            with open(opts['save'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+            self.stdout.write('saved {}'.format(opts['save']))
+        if opts['compare']:
+            with open(opts['compare'], encoding='utf-8') as handle:
+                baseline = json.load(handle)
+            changed = [key for key in ('target', 'mix', 'concurrency', 'database')
+                       if baseline['meta'].get(key) != report['meta'][key]]
+            if changed:
+                self.stdout.write(self.style.WARNING('baseline differs in {}; deltas are not comparable'.format(', '.join(changed))))
+            rows, regressions = compare_baselines(baseline, report, opts['tolerance'])
+            for name, rps, p95 in rows:
+                self.stdout.write('{:<14} req/s {:+.1f}%  p95 {:+.1f}%'.format(name, rps, p95))
+            if regressions:
+                raise CommandError('Regressed beyond {:.0%}: {}'.format(opts['tolerance'], ', '.join(regressions)))
+            self.stdout.write(self.style.SUCCESS('no regressions'))
+
+    def seed(self, run, opts, vendors):
+        password = make_password(PASSWORD)
+        tenants = []
+        for v in range(opts['vendors']):
+            vendor = Vendor.objects.create(name='bench-load-{}-{}'.format(run, v), contact_email='bench@example.com')
+            vendors.append(vendor)
+            owner = User.objects.create(
+                username='bl-{}-{}-owner'.format(run, v), role='owner', vendor=vendor, password=password)
+            users = User.objects.bulk_create([
+                User(username='bl-{}-{}-c{}'.format(run, v, c), role='customer', vendor=vendor, password=password)
+                for c in range(opts['customers'])
+            ])
+            customers = Customer.objects.bulk_create([
+                Customer(vendor=vendor, user=user, name=user.username, email='') for user in users
+            ])
+            products = Product.objects.bulk_create([
+                Product(vendor=vendor, name='p{}'.format(p), sku='bl-{}'.format(p), price='9.99', quantity=10 ** 9)
+                for p in range(opts['products'])
+            ])
+            orders = Order.objects.bulk_create([
+                Order(vendor=vendor, customer=customers[o % len(customers)], total_amount='29.97')
+                for o in range(opts['orders'])
+            ]) if customers else []
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=products[(o + k) % len(products)], qty=1, price='9.99')
+                for o, order in enumerate(orders) for k in range(opts['items'])
+            ], batch_size=1000)
+            tenants.append({
+                'owner': str(MyTokenObtainPairSerializer.get_token(owner).access_token),
+                'customers': users,
+                'products': [product.id for product in products],
+            })
+        return tenants
+
+    def replay(self, templates, tenants, opts):
+        mix = MIXES[opts['mix']]
+        rng = random.Random(opts['seed'])
+        plan = [
+            (endpoint, rng.randrange(len(tenants)), rng.random())
+            for endpoint in rng.choices(list(mix), weights=list(mix.values()), k=opts['requests'])
+        ]
+        send = self.http_sender(opts['url']) if opts['url'] else self.inprocess_sender()
+        tokens = {}
+        tokens_lock = threading.Lock()
+
+        def customer_token(user):
+            with tokens_lock:
+                if user.pk not in tokens:
+                    tokens[user.pk] = str(MyTokenObtainPairSerializer.get_token(user).access_token)
+                return tokens[user.pk]
+
+        def call(step):
+            endpoint, tenant_index, pick = step
+            tenant = tenants[tenant_index]
+            request_name, role = ENDPOINTS[endpoint]
+            method, path, body = templates[request_name]
+            customer = tenant['customers'][int(pick * len(tenant['customers']))] if tenant['customers'] else None
+            token = tenant['owner'] if role == 'owner' else customer_token(customer)
+            if endpoint == 'login':
+                body, token = dict(body, username=customer.username, password=PASSWORD), None
+            elif endpoint == 'place_order':
+                products = tenant['products']
+                first = int(pick * len(products))
+                body = {'items': [{'product': products[(first + k) % len(products)], 'qty': 1}
+                                  for k in range(opts['items'])]}
+            start = time.perf_counter()
+            status, timing = send(method, path, body, token)
+            return endpoint, status, time.perf_counter() - start, queries_from_server_timing(timing)
+
+        # Query counts come from Server-Timing, which is off by default; a
+        # server under --url needs STORE_SERVER_TIMING=True.
+        timing_on = nullcontext() if opts['url'] else override_settings(
+            STORE_METRICS=dict(getattr(settings, 'STORE_METRICS', {}), SERVER_TIMING=True))
+        started = time.perf_counter()
+        with timing_on, ThreadPoolExecutor(max_workers=opts['concurrency']) as pool:
+            results = list(pool.map(call, plan))
+        elapsed = time.perf_counter() - started
+
+        by_endpoint = defaultdict(list)
+        for result in results:
+            by_endpoint[result[0]].append(result)
+        endpoints = {}
+        for endpoint, rows in by_endpoint.items():
+            stats = summarize([latency for _, _, latency, _ in rows], elapsed)
+            queries = [count for _, _, _, count in rows if count is not None]
+            stats['errors'] = sum(1 for _, status, _, _ in rows if status is None or status >= 400)
+            stats['queries_per_request'] = round(sum(queries) / len(queries), 2) if queries else None
+            endpoints[endpoint] = stats
+        overall = summarize([latency for _, _, latency, _ in results], elapsed)
+        overall['errors'] = sum(stats['errors'] for stats in endpoints.values())
+        return {
+            'meta': {
+                'created': timezone.now().isoformat(), 'target': opts['url'] or 'in-process',
+                'mix': opts['mix'], 'requests': opts['requests'], 'concurrency': opts['concurrency'],
+                'vendors': opts['vendors'], 'products': opts['products'], 'customers': opts['customers'],
+                'orders': opts['orders'], 'items': opts['items'], 'database': connection.vendor,
+            },
+            'overall': overall,
+            'endpoints': endpoints,
+        }
+
+    def inprocess_sender(self):
+        local = threading.local()
+
+        def send(method, path, body, token):
+            if not hasattr(local, 'client'):
+                local.client = APIClient(SERVER_NAME='localhost')
+            extra = {'HTTP_AUTHORIZATION': 'Bearer ' + token} if token else {}
+            data = json.dumps(body) if body is not None else ''
+            response = local.client.generic(method, path, data, content_type='application/json', **extra)
+            return response.status_code, response.get('Server-Timing')
+        return send
+
+    def http_sender(self, base_url):
+        parts = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        prefix = parts.path.rstrip('/')
+        local = threading.local()
+
+        def send(method, path, body, token):
+            if not hasattr(local, 'conn'):
+                local.conn = connection_class(parts.netloc, timeout=60)
+            headers = {'Content-Type': 'application/json'}
+            if token:
+                headers['Authorization'] = 'Bearer ' + token
+            try:
+                local.conn.request(method, prefix + path, json.dumps(body) if body is not None else None, headers)
+                response = local.conn.getresponse()
+                response.read()
+                return response.status, response.getheader('Server-Timing')
+            except (OSError, http.client.HTTPException):
+                local.conn.close()
+                del local.conn
+                return None, None
+        return send
+
+    def print_report(self, report):
+        self.stdout.write('{:<14} {:>6} {:>9} {:>9} {:>9} {:>9} {:>8} {:>7}'.format(
+            'endpoint', 'count', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'errors'))
+        rows = sorted(report['endpoints'].items()) + [('overall', report['overall'])]
+        for name, stats in rows:
+            queries = stats.get('queries_per_request')
+            self.stdout.write('{:<14} {:>6} {:>9} {:>9} {:>9} {:>9} {:>8} {:>7}'.format(
+                name, stats['count'], stats['rps'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+                '-' if queries is None else queries, stats['errors']))
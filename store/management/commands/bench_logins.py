@@ -0,0 +1,84 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from store.benchmarking import summarize
+from store.login import hash_pool
+from store.models import User, Vendor
+from store.token_serializers import MyTokenObtainPairSerializer
+from store.views import ClaimsTokenRefreshView, CustomTokenObtainPairView
+
+PASSWORD = 'bench-login-pass'
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare logins/s and refreshes/s of the stock simplejwt views (authenticate() in the "
+        "request thread, User lookup on refresh) with the store login pipeline (bounded hash "
+        "pool, claims-based refresh). Attempt limits are disabled for the run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--logins', type=int, default=200, help='Logins per variant.')
+        parser.add_argument('--refreshes', type=int, default=2000, help='Refreshes per variant.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--workers', type=int, help='Hash pool size (default: STORE_LOGIN["HASH_WORKERS"]).')
+        parser.add_argument('--verified-cache-ttl', type=int, default=0,
+                            help='Enable the verified-credential cache for the pipeline run (seconds).')
+
+    def handle(self, *args, **opts):
+        vendor = Vendor.objects.create(name='bench-logins', contact_email='bench@example.com')
+        password = make_password(PASSWORD)
+        users = User.objects.bulk_create([
+            User(username='bench-login-{}-{}'.format(vendor.id, i), role='customer', vendor=vendor, password=password)
+            for i in range(opts['users'])
+        ])
+        login_overrides = {'USER_ATTEMPTS': 0, 'IP_ATTEMPTS': 0, 'VERIFIED_CACHE_TTL': opts['verified_cache_ttl']}
+        if opts['workers']:
+            login_overrides['HASH_WORKERS'] = opts['workers']
+        try:
+            with override_settings(STORE_LOGIN=login_overrides):
+                hash_pool.shutdown()  # pick up the overridden pool size
+                refresh = [str(MyTokenObtainPairSerializer.get_token(user)) for user in users]
+                variants = [
+                    ('login   stock   ', TokenObtainPairView.as_view(), '/api/auth/login/', opts['logins'],
+                     lambda i: {'username': users[i % len(users)].username, 'password': PASSWORD}),
+                    ('login   pipeline', CustomTokenObtainPairView.as_view(), '/api/auth/login/', opts['logins'],
+                     lambda i: {'username': users[i % len(users)].username, 'password': PASSWORD}),
+                    ('refresh stock   ', TokenRefreshView.as_view(), '/api/auth/refresh/', opts['refreshes'],
+                     lambda i: {'refresh': refresh[i % len(refresh)]}),
+                    ('refresh claims  ', ClaimsTokenRefreshView.as_view(), '/api/auth/refresh/', opts['refreshes'],
+                     lambda i: {'refresh': refresh[i % len(refresh)]}),
+                ]
+                for label, view, path, count, body in variants:
+                    stats, errors = self.run(view, path, count, body, opts['concurrency'])
+                    self.stdout.write(
+                        '{label}  {rps:>8} /s  p50={p50_ms}ms  p95={p95_ms}ms  p99={p99_ms}ms  errors={errors}'.format(
+                            label=label, errors=errors, **stats)
+                    )
+        finally:
+            hash_pool.shutdown()
+            User.objects.filter(vendor=vendor).delete()
+            vendor.delete()
+
+    def run(self, view, path, count, body, concurrency):
+        factory = APIRequestFactory()
+
+        def call(i):
+            request = factory.post(path, body(i), format='json')
+            start = time.perf_counter()
+            response = view(request)
+            return response.status_code, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            started = time.perf_counter()
+            results = list(pool.map(call, range(count)))
+            elapsed = time.perf_counter() - started
+        errors = sum(1 for status, _ in results if status != 200)
+        return summarize([latency for _, latency in results], elapsed), errors
@@ -0,0 +1,84 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIClient
+
+from store.benchmarking import summarize
+from store.models import Customer, Order, OrderItem, Product, User, Vendor
+from store.token_serializers import MyTokenObtainPairSerializer
+
+
+class Command(BaseCommand):
+    help = "Fire concurrent POST /api/orders/place/ calls against the same products and check stock accounting."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=200, help='Total orders to place.')
+        parser.add_argument('--products', type=int, default=5, help='Hot products shared by every order.')
+        parser.add_argument('--qty', type=int, default=1, help='Units of each product per order.')
+        parser.add_argument('--stock', type=int, default=None, help='Initial stock per product (default: enough for all but ~10%% of orders).')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded benchmark data.')
+
+    def handle(self, *args, **opts):
+        stock = opts['stock']
+        if stock is None:
+            stock = int(opts['orders'] * opts['qty'] * 0.9)
+
+        vendor = Vendor.objects.create(name='bench-place-orders', contact_email='bench@example.com')
+        try:
+            self.run(vendor, stock, opts)
+        finally:
+            if not opts['keep']:
+                OrderItem.objects.filter(order__vendor=vendor).delete()
+                vendor.delete()
+
+    def run(self, vendor, stock, opts):
+        products = Product.objects.bulk_create([
+            Product(vendor=vendor, name='hot-{}'.format(i), sku='bench-{}'.format(i), price='9.99', quantity=stock)
+            for i in range(opts['products'])
+        ])
+        tokens = []
+        for i in range(opts['workers']):
+            user = User.objects.create(username='bench-cust-{}-{}'.format(vendor.id, i), role='customer', vendor=vendor)
+            Customer.objects.create(user=user, vendor=vendor, name=user.username, email='')
+            tokens.append(str(MyTokenObtainPairSerializer.get_token(user).access_token))
+
+        payload = {'items': [{'product': p.id, 'qty': opts['qty']} for p in products]}
+        local = threading.local()
+        next_token = itertools.count()
+
+        def place(_):
+            if not hasattr(local, 'client'):
+                token = tokens[next(next_token) % len(tokens)]
+                local.client = APIClient(SERVER_NAME='localhost')
+                local.client.credentials(HTTP_AUTHORIZATION='Bearer ' + token)
+            start = time.perf_counter()
+            response = local.client.post('/api/orders/place/', payload, format='json')
+            elapsed = time.perf_counter() - start
+            connection.close()
+            return response.status_code, elapsed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=opts['workers']) as pool:
+            results = list(pool.map(place, range(opts['orders'])))
+        elapsed = time.perf_counter() - started
+
+        by_status = {}
+        for code, _ in results:
+            by_status[code] = by_status.get(code, 0) + 1
+        placed = Order.objects.filter(vendor=vendor).count()
+        remaining = dict(Product.objects.filter(vendor=vendor).values_list('id', 'quantity'))
+        consistent = all(remaining[p.id] == stock - placed * opts['qty'] for p in products)
+
+        stats = summarize([latency for _, latency in results], elapsed)
+        self.stdout.write('status codes: {}'.format(by_status))
+        self.stdout.write('orders placed: {}  stock left: {}'.format(placed, sorted(set(remaining.values()))))
+        self.stdout.write('{rps} orders/s  p50={p50_ms}ms  p95={p95_ms}ms  p99={p99_ms}ms'.format(**stats))
+        if consistent:
+            self.stdout.write(self.style.SUCCESS('stock accounting consistent'))
+        else:
+            self.stdout.write(self.style.ERROR('stock accounting INCONSISTENT'))
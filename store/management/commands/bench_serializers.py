@@ -0,0 +1,96 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from store.fast_serializers import compile_mapper, orjson, render_json
+from store.models import Customer, Order, OrderItem, Product, User, Vendor
+from store.serializers import OrderSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Serialize and render the same product and order rows with the DRF serializers and "
+        "with the fast list path (store.fast_serializers), check the JSON is byte-identical "
+        "and report the best time of each phase."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--items', type=int, default=2, help='Items per order.')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded vendor.')
+
+    def handle(self, *args, **opts):
+        vendor = self.seed(opts['rows'], opts['items'])
+        try:
+            products = Product.objects.filter(vendor=vendor).order_by('-created_at', '-id')
+            orders = Order.objects.filter(vendor=vendor).order_by('-created_at', '-id')
+            items = Prefetch('items', queryset=OrderItem.objects.order_by('pk'))
+            self.stdout.write('{} rows, encoder: {}'.format(opts['rows'], 'orjson' if orjson else 'json'))
+            self.compare('products', ProductSerializer, products, products, opts['repeat'])
+            self.compare('orders', OrderSerializer, orders.prefetch_related(items), orders, opts['repeat'])
+        finally:
+            if not opts['keep']:
+                OrderItem.objects.filter(order__vendor=vendor).delete()
+                Order.objects.filter(vendor=vendor).delete()
+                vendor.delete()
+
+    def seed(self, rows, per_order):
+        vendor = Vendor.objects.create(name='bench-serializers', contact_email='bench@example.com')
+        staff = User.objects.create(username='bench-ser-staff-{}'.format(vendor.id), role='staff', vendor=vendor)
+        customer = Customer.objects.create(vendor=vendor, name='bench', email='bench@example.com')
+        Product.objects.bulk_create([
+            Product(vendor=vendor, name='Product {}'.format(i), sku='BS-{}'.format(i), description='Bench product {}'.format(i),
+                    price='{}.{:02d}'.format(i % 500, i % 100), quantity=i % 50, assigned_to=staff if i % 2 else None)
+            for i in range(rows)
+        ], batch_size=1000)
+        products = list(Product.objects.filter(vendor=vendor).values_list('id', 'price'))
+        orders = Order.objects.bulk_create([
+            Order(vendor=vendor, customer=customer, total_amount='19.98', assigned_to=staff if i % 3 else None)
+            for i in range(rows)
+        ], batch_size=1000)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=products[(i + n) % len(products)][0], qty=1 + n,
+                      price=products[(i + n) % len(products)][1])
+            for i, order in enumerate(orders) for n in range(per_order)
+        ], batch_size=1000)
+        return vendor
+
+    def compare(self, label, serializer_class, queryset, plain_queryset, repeat):
+        renderer = JSONRenderer()
+        mapper = compile_mapper(serializer_class())
+        if mapper is None:
+            raise CommandError('{} has fields without a fast form.'.format(serializer_class.__name__))
+
+        def drf():
+            start = time.perf_counter()
+            objects = list(queryset.all())
+            fetched = time.perf_counter()
+            data = serializer_class(objects, many=True).data
+            mapped = time.perf_counter()
+            content = renderer.render(data)
+            return content, (fetched - start, mapped - fetched, time.perf_counter() - mapped)
+
+        def fast():
+            start = time.perf_counter()
+            rows = list(mapper.values(plain_queryset))
+            fetched = time.perf_counter()
+            data = mapper.rows(rows, plain_queryset.db)
+            mapped = time.perf_counter()
+            content = render_json(data, renderer)
+            return content, (fetched - start, mapped - fetched, time.perf_counter() - mapped)
+
+        results = {}
+        for name, run in (('drf', drf), ('fast', fast)):
+            runs = [run() for _ in range(repeat)]
+            results[name] = runs[0][0], [min(phase) for phase in zip(*(timings for _, timings in runs))]
+        if results['drf'][0] != results['fast'][0]:
+            raise CommandError('{}: fast output differs from the serializer output.'.format(label))
+        for name, (_, (fetch, mapping, rendering)) in results.items():
+            self.stdout.write('{:<8} {:<4}  fetch={:8.1f}ms  serialize={:8.1f}ms  render={:7.1f}ms  total={:8.1f}ms'.format(
+                label, name, fetch * 1000, mapping * 1000, rendering * 1000, (fetch + mapping + rendering) * 1000))
+        slow_total, fast_total = sum(results['drf'][1]), sum(results['fast'][1])
+        self.stdout.write('{:<8} identical output ({} bytes), {:.1f}x faster'.format(
+            label, len(results['fast'][0]), slow_total / fast_total))
@@ -0,0 +1,125 @@
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store.benchmarking import summarize
+from store.models import Customer, Order, OrderItem, Product, User, Vendor
+from store.token_serializers import MyTokenObtainPairSerializer
+
+# (label, SERVER_MODE, path prefix)
+STACKS = [
+    ('wsgi  sync viewset', 'wsgi', '/api/'),
+    ('asgi  async view  ', 'asgi', '/api/async/'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Start gunicorn in WSGI (sync workers) and ASGI (uvicorn workers) mode against the "
+        "configured database and compare requests/s and latency percentiles of the product/order "
+        "list endpoint with the async equivalent. Needs a database both servers can reach."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resource', choices=['products', 'orders'], default='products')
+        parser.add_argument('--workers', type=int, default=2, help='Gunicorn workers per server.')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client connections.')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per stack.')
+        parser.add_argument('--rows', type=int, default=500, help='Seeded products/orders.')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded benchmark data.')
+
+    def handle(self, *args, **opts):
+        if opts['resource'] == 'products':
+            self.stdout.write('note: the WSGI product list is answered from the catalog response cache after the first hit')
+        vendor = Vendor.objects.create(name='bench-servers', contact_email='bench@example.com')
+        try:
+            token = self.seed(vendor, opts['rows'])
+            for offset, (label, mode, prefix) in enumerate(STACKS):
+                port = opts['port'] + offset
+                server = self.start(mode, port, opts['workers'])
+                try:
+                    stats, errors = self.load(port, prefix + opts['resource'] + '/', token, opts)
+                finally:
+                    server.terminate()
+                    server.wait(timeout=10)
+                self.stdout.write(
+                    '{label}  {rps:>8} req/s  p50={p50_ms}ms  p95={p95_ms}ms  p99={p99_ms}ms  errors={errors}'.format(
+                        label=label, errors=errors, **stats)
+                )
+        finally:
+            if not opts['keep']:
+                OrderItem.objects.filter(order__vendor=vendor).delete()
+                vendor.delete()
+
+    def seed(self, vendor, rows):
+        owner = User.objects.create(username='bench-servers-{}'.format(vendor.id), role='owner', vendor=vendor)
+        customer_user = User.objects.create(username='bench-servers-c-{}'.format(vendor.id), role='customer', vendor=vendor)
+        customer = Customer.objects.create(user=customer_user, vendor=vendor, name='bench', email='')
+        products = Product.objects.bulk_create([
+            Product(vendor=vendor, name='p{}'.format(i), sku='bench-{}'.format(i), price='9.99', quantity=10)
+            for i in range(rows)
+        ])
+        orders = Order.objects.bulk_create([
+            Order(vendor=vendor, customer=customer, total_amount='9.99') for _ in range(rows)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=products[i], qty=1, price='9.99') for i, order in enumerate(orders)
+        ])
+        return str(MyTokenObtainPairSerializer.get_token(owner).access_token)
+
+    def start(self, mode, port, workers):
+        env = dict(os.environ, SERVER_MODE=mode)
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'core.{}:application'.format(mode), '-c', 'gunicorn.conf.py',
+             '--bind', '127.0.0.1:{}'.format(port), '--workers', str(workers), '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('gunicorn ({}) exited with code {}.'.format(mode, server.returncode))
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+                conn.request('GET', '/')
+                conn.getresponse().read()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('gunicorn ({}) did not start listening on port {}.'.format(mode, port))
+
+    def load(self, port, path, token, opts):
+        headers = {'Authorization': 'Bearer ' + token, 'Host': '127.0.0.1'}
+        local = threading.local()
+
+        def fetch(_):
+            if not hasattr(local, 'conn'):
+                local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            start = time.perf_counter()
+            try:
+                local.conn.request('GET', path, headers=headers)
+                response = local.conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                local.conn.close()
+                del local.conn
+                status = None
+            return status, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=opts['concurrency']) as pool:
+            list(pool.map(fetch, range(opts['concurrency'] * 2)))  # warm up connections and workers
+            started = time.perf_counter()
+            results = list(pool.map(fetch, range(opts['requests'])))
+            elapsed = time.perf_counter() - started
+
+        errors = sum(1 for status, _ in results if status != 200)
+        return summarize([latency for _, latency in results], elapsed), errors
@@ -0,0 +1,150 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from store.models import (
+    Customer, IdempotencyKey, Job, Order, OrderItem, Product, ProductDailyStats, ProductSearchTerm, TenantShard,
+    User, Vendor, VendorDailyStats,
+)
+from store.response_cache import bump_generation
+from store.sharding import MAP_TTL, forget_vendor, shard_for_vendor
+from store.signals import mirror_row
+
+# Parents before children; deletes run in reverse.
+MOVE_ORDER = [
+    (Customer, 'vendor_id'),
+    (Product, 'vendor_id'),
+    (Order, 'vendor_id'),
+    (OrderItem, 'order__vendor_id'),
+    (VendorDailyStats, 'vendor_id'),
+    (ProductDailyStats, 'vendor_id'),
+    (IdempotencyKey, 'vendor_id'),
+    (Job, 'vendor_id'),
+    (ProductSearchTerm, 'vendor_id'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy a vendor's store rows to another database alias in batches, switch the "
+        "tenant->shard mapping, then delete the rows from the old shard. Writes for the "
+        "vendor are refused (503) from before the copy until the switch, and each step "
+        "waits until every process has dropped its cached mapping. Rows keep their "
+        "primary keys, so shards must use disjoint id ranges."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('vendor', type=int)
+        parser.add_argument('target', help='Target database alias.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--keep-source', action='store_true', help='Do not delete rows from the old shard.')
+        parser.add_argument('--wait', type=float, default=MAP_TTL,
+                            help='Seconds other processes may keep a cached shard mapping (default: %(default)s).')
+
+    def handle(self, *args, **opts):
+        vendor_id, target, batch_size = opts['vendor'], opts['target'], opts['batch_size']
+        if target not in connections.databases:
+            raise CommandError('Unknown database alias "{}".'.format(target))
+        try:
+            vendor = Vendor.objects.using(DEFAULT_DB_ALIAS).get(pk=vendor_id)
+        except Vendor.DoesNotExist:
+            raise CommandError('Vendor {} does not exist.'.format(vendor_id))
+        source = shard_for_vendor(vendor_id)
+        if source == target:
+            raise CommandError('Vendor {} already lives on "{}".'.format(vendor_id, target))
+
+        self.check_collisions(vendor_id, source, target, batch_size)
+
+        # Fence writes first: a process still routing on a cached mapping
+        # would otherwise write to the source while (or after) it is copied.
+        self.set_mapping(vendor_id, source, frozen=True)
+        self.wait(opts['wait'], 'Writes for vendor {} paused'.format(vendor_id))
+        try:
+            if target != DEFAULT_DB_ALIAS:
+                mirror_row(vendor, target)
+                for user in User.objects.using(DEFAULT_DB_ALIAS).filter(vendor_id=vendor_id).iterator(chunk_size=batch_size):
+                    mirror_row(user, target)
+
+            for model, vendor_field in MOVE_ORDER:
+                copied = self.copy(model, vendor_field, vendor_id, source, target, batch_size)
+                self.stdout.write('{}: copied {} rows'.format(model.__name__, copied))
+            self.reset_sequences(target)
+        except BaseException:
+            self.set_mapping(vendor_id, source, frozen=False)
+            raise
+
+        self.set_mapping(vendor_id, target, frozen=False)
+        bump_generation(vendor_id)
+        self.stdout.write('Vendor {} now routed to "{}".'.format(vendor_id, target))
+
+        if not opts['keep_source']:
+            # Stale mappings still read from the source until they expire.
+            self.wait(opts['wait'], 'Keeping the rows on "{}" for cached mappings'.format(source))
+            for model, vendor_field in reversed(MOVE_ORDER):
+                deleted = self.delete(model, vendor_field, vendor_id, source, batch_size)
+                self.stdout.write('{}: deleted {} rows from "{}"'.format(model.__name__, deleted, source))
+
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def set_mapping(self, vendor_id, alias, frozen):
+        if alias == DEFAULT_DB_ALIAS and not frozen:
+            TenantShard.objects.filter(vendor_id=vendor_id).delete()
+        else:
+            TenantShard.objects.update_or_create(vendor_id=vendor_id, defaults={'alias': alias, 'frozen': frozen})
+        forget_vendor(vendor_id)
+
+    def wait(self, seconds, reason):
+        if seconds > 0:
+            self.stdout.write('{}; waiting {:g}s for cached shard mappings to expire.'.format(reason, seconds))
+            time.sleep(seconds)
+
+    def rows(self, model, vendor_field, vendor_id, alias):
+        return model.objects.using(alias).filter(**{vendor_field: vendor_id})
+
+    def check_collisions(self, vendor_id, source, target, batch_size=1000):
+        for model, vendor_field in MOVE_ORDER:
+            ids = list(self.rows(model, vendor_field, vendor_id, source).values_list('pk', flat=True))
+            for start in range(0, len(ids), batch_size):
+                taken = (
+                    model.objects.using(target)
+                    .filter(pk__in=ids[start:start + batch_size])
+                    .exclude(**{vendor_field: vendor_id})
+                )
+                if taken.exists():
+                    raise CommandError(
+                        '{} primary keys of vendor {} already exist on "{}" for another vendor; '
+                        'give each shard its own id range first.'.format(model.__name__, vendor_id, target)
+                    )
+
+    def copy(self, model, vendor_field, vendor_id, source, target, batch_size):
+        copied, last_pk = 0, None
+        queryset = self.rows(model, vendor_field, vendor_id, source).order_by('pk')
+        while True:
+            batch = queryset.filter(pk__gt=last_pk) if last_pk is not None else queryset
+            batch = list(batch[:batch_size])
+            if not batch:
+                return copied
+            with transaction.atomic(using=target):
+                model.objects.using(target).bulk_create(batch, ignore_conflicts=True)
+            copied += len(batch)
+            last_pk = batch[-1].pk
+
+    def delete(self, model, vendor_field, vendor_id, alias, batch_size):
+        deleted = 0
+        while True:
+            ids = list(self.rows(model, vendor_field, vendor_id, alias).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            with transaction.atomic(using=alias):
+                model.objects.using(alias).filter(pk__in=ids).delete()
+            deleted += len(ids)
+
+    def reset_sequences(self, alias):
+        connection = connections[alias]
+        statements = connection.ops.sequence_reset_sql(no_style(), [model for model, _ in MOVE_ORDER])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
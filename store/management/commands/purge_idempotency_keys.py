@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+
+from store.idempotency import purge_expired
+from store.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records in batches, on every shard (or --database). Run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', help='Only purge this alias.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **opts):
+        # Replicas refuse migrations, which also keeps them out of this list.
+        aliases = [opts['database']] if opts['database'] else [
+            alias for alias in connections if router.allow_migrate_model(alias, IdempotencyKey)
+        ]
+        for alias in aliases:
+            deleted = purge_expired(alias, opts['batch_size'])
+            self.stdout.write('{}: deleted {} expired keys'.format(alias, deleted))
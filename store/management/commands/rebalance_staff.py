@@ -0,0 +1,79 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+
+from store.assignment import ORDER, PRODUCT, forget, workload
+from store.models import User, Vendor
+from store.response_cache import bump_generation
+from store.sharding import pinned, shard_for_vendor
+
+
+def plan_moves(rows, roster):
+    """
+    Even out ``rows`` (``(id, assigned_to_id)``) across ``roster`` with as
+    few moves as possible. Unassigned rows and rows of staff outside the
+    roster are always moved; each staff member keeps their oldest rows up
+    to their share. Returns ``{staff_id: [ids to assign]}``.
+    """
+    held = {staff_id: [] for staff_id in roster}
+    pool = []
+    for pk, staff_id in rows:
+        (held[staff_id] if staff_id in held else pool).append(pk)
+    base, extra = divmod(len(rows), len(roster))
+    # The extra units go to whoever already holds the most, so they stay put.
+    by_load = sorted(roster, key=lambda staff_id: (-len(held[staff_id]), staff_id))
+    targets = {staff_id: base + (1 if index < extra else 0) for index, staff_id in enumerate(by_load)}
+    for staff_id in roster:
+        pool.extend(held[staff_id][targets[staff_id]:])
+    moves = defaultdict(list)
+    for staff_id in roster:
+        need = targets[staff_id] - min(len(held[staff_id]), targets[staff_id])
+        moves[staff_id], pool = pool[:need], pool[need:]
+    return {staff_id: ids for staff_id, ids in moves.items() if ids}
+
+
+class Command(BaseCommand):
+    help = (
+        "Redistribute a vendor's open (pending) orders, and with --products its products, evenly "
+        "across its active staff with bulk updates, then reset the cached staff loads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendor', type=int, action='append', help='Vendor id (repeatable). Default: all.')
+        parser.add_argument('--products', action='store_true', help='Rebalance product assignments too.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **opts):
+        vendor_ids = opts['vendor'] or list(Vendor.objects.order_by('id').values_list('id', flat=True))
+        kinds = [ORDER, PRODUCT] if opts['products'] else [ORDER]
+        for vendor_id in vendor_ids:
+            roster = list(
+                User.objects.filter(vendor_id=vendor_id, role='staff', is_active=True)
+                .order_by('id').values_list('id', flat=True)
+            )
+            if not roster:
+                continue
+            with pinned(shard_for_vendor(vendor_id)):
+                for kind in kinds:
+                    moved = self.rebalance(kind, vendor_id, roster, opts)
+                    self.stdout.write('vendor {} {}s: {} reassigned across {} staff{}'.format(
+                        vendor_id, kind, moved, len(roster), ' (dry run)' if opts['dry_run'] else ''))
+            if not opts['dry_run']:
+                forget(vendor_id)
+                if opts['products']:
+                    bump_generation(vendor_id)  # bulk updates skip the catalog signals
+
+    def rebalance(self, kind, vendor_id, roster, opts):
+        queryset = workload(kind, vendor_id)
+        moves = plan_moves(list(queryset.order_by('id').values_list('id', 'assigned_to_id')), roster)
+        if opts['dry_run']:
+            return sum(len(ids) for ids in moves.values())
+        moved = 0
+        for staff_id, ids in moves.items():
+            for start in range(0, len(ids), opts['batch_size']):
+                batch = ids[start:start + opts['batch_size']]
+                with transaction.atomic(using=router.db_for_write(queryset.model)):
+                    moved += queryset.filter(pk__in=batch).update(assigned_to_id=staff_id)
+        return moved
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from store.jobs import queue_aliases
+from store.search import rebuild
+from store.sharding import pinned, shard_for_vendor
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the product search index (store.search) from the catalog, for one vendor "
+        "or for every product on every shard. Needed after writes that skip model signals "
+        "(queryset.update, raw SQL) or when PRODUCT_SEARCH weights change."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendor', type=int, action='append', help='Vendor id (repeatable). Default: all.')
+        parser.add_argument('--database', action='append', help='Only these aliases (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **opts):
+        if opts['vendor']:
+            targets = [(shard_for_vendor(vendor_id), vendor_id) for vendor_id in opts['vendor']]
+        else:
+            targets = [(alias, None) for alias in opts['database'] or queue_aliases()]
+        for alias, vendor_id in targets:
+            with pinned(alias):
+                count = rebuild(vendor_id, batch_size=opts['batch_size'], using=alias)
+            self.stdout.write('{}: {} products indexed{}'.format(
+                alias, count, '' if vendor_id is None else ' for vendor {}'.format(vendor_id)))
@@ -0,0 +1,59 @@
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store.jobs import _config, claim, queue_aliases, run
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued jobs (store.jobs) from every shard: claim due jobs in batches, run them "
+        "on a thread pool and retry failures with exponential backoff. Run as many workers as "
+        "needed; they share the queue through SELECT ... FOR UPDATE SKIP LOCKED where supported."
+    )
+
+    def add_arguments(self, parser):
+        conf = _config()
+        parser.add_argument('--threads', type=int, default=conf["THREADS"])
+        parser.add_argument('--batch-size', type=int, default=conf["BATCH_SIZE"])
+        parser.add_argument('--poll-interval', type=float, default=conf["POLL_INTERVAL"],
+                            help='Seconds to sleep when no job is due.')
+        parser.add_argument('--database', action='append', help='Only these aliases (repeatable).')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due.')
+
+    def handle(self, *args, **opts):
+        stopping = threading.Event()
+        previous = {signum: signal.signal(signum, lambda *_: stopping.set()) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            self.work(stopping, opts)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+    def work(self, stopping, opts):
+        aliases = opts['database'] or queue_aliases()
+        lease = _config()["LEASE"]
+        self.stdout.write('worker: {} threads on {}'.format(opts['threads'], ', '.join(aliases)))
+        ok = failed = 0
+        with ThreadPoolExecutor(max_workers=opts['threads']) as pool:
+            while not stopping.is_set():
+                jobs = [job for alias in aliases for job in claim(alias, opts['batch_size'], lease)]
+                if not jobs:
+                    if opts['once']:
+                        break
+                    stopping.wait(opts['poll_interval'])
+                    continue
+                for succeeded in pool.map(self.run_job, jobs):
+                    ok, failed = ok + succeeded, failed + (not succeeded)
+                close_old_connections()
+        self.stdout.write('worker stopped: {} done, {} failed attempts'.format(ok, failed))
+
+    def run_job(self, job):
+        close_old_connections()
+        try:
+            return run(job)
+        finally:
+            close_old_connections()
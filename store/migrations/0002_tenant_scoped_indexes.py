@@ -0,0 +1,69 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:43
+
+import logging
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+logger = logging.getLogger('store.migrations')
+
+
+def dedupe_skus(apps, schema_editor):
+    """
+    Make (vendor, sku) unique before the constraint is added: blank SKUs
+    become NULL, and within a vendor every product but the oldest with a
+    repeated SKU gets ``-dup-<id>`` appended (each is logged).
+    """
+    Product = apps.get_model('store', 'Product')
+    products = Product.objects.using(schema_editor.connection.alias)
+    products.filter(sku='').update(sku=None)
+    repeated = (
+        products.exclude(sku=None).values('vendor_id', 'sku')
+        .annotate(n=Count('id'), keep=Min('id')).filter(n__gt=1)
+    )
+    for row in repeated:
+        for product in products.filter(vendor_id=row['vendor_id'], sku=row['sku']).exclude(pk=row['keep']):
+            suffix = '-dup-{}'.format(product.pk)
+            new_sku = product.sku[:100 - len(suffix)] + suffix
+            logger.warning('Product %s of vendor %s: duplicate SKU %r renamed to %r',
+                           product.pk, row['vendor_id'], product.sku, new_sku)
+            products.filter(pk=product.pk).update(sku=new_sku)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['vendor', 'created_at'], name='order_vendor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['assigned_to', 'created_at'], name='order_assigned_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'created_at'], name='order_customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['vendor', 'status'], name='order_vendor_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['vendor', 'created_at'], name='product_vendor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['assigned_to', 'created_at'], name='product_assigned_created_idx'),
+        ),
+        migrations.RunPython(dedupe_skus, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('vendor', 'sku'), name='product_vendor_sku_uniq'),
+        ),
+    ]
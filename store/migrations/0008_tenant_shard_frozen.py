@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenantshard',
+            name='frozen',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -10,6 +10,16 @@ class Vendor(models.Model):
     def __str__(self):
         return self.name
 
+class TenantShard(models.Model):
+    """Maps a vendor to the database alias holding its store data (see store.sharding)."""
+    vendor = models.OneToOneField(Vendor, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=64)
+    # Set by move_vendor_shard while the vendor's rows are copied; writes are refused.
+    frozen = models.BooleanField(default=False)
+
+    def __str__(self):
+        return '{} -> {}'.format(self.vendor_id, self.alias)
+
 class User(AbstractUser):
     ROLE_CHOICES = (
         ('owner','Store Owner'),
@@ -31,6 +41,15 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     assigned_to = models.ForeignKey('User',null=True,blank=True,limit_choices_to={'role': 'staff'},on_delete=models.SET_NULL,related_name='assigned_products')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['vendor', 'created_at'], name='product_vendor_created_idx'),
+            models.Index(fields=['assigned_to', 'created_at'], name='product_assigned_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['vendor', 'sku'], name='product_vendor_sku_uniq'),
+        ]
+
 class Customer(models.Model):
     vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, related_name='customers')
     user = models.OneToOneField('User', null=True, blank=True, on_delete=models.SET_NULL)
@@ -46,9 +65,110 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     assigned_to = models.ForeignKey('User',null=True,blank=True,limit_choices_to={'role': 'staff'},on_delete=models.SET_NULL,related_name='assigned_orders')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['vendor', 'created_at'], name='order_vendor_created_idx'),
+            models.Index(fields=['assigned_to', 'created_at'], name='order_assigned_created_idx'),
+            models.Index(fields=['customer', 'created_at'], name='order_customer_created_idx'),
+            models.Index(fields=['vendor', 'status'], name='order_vendor_status_idx'),
+        ]
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     qty = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
+
+
+class VendorDailyStats(models.Model):
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    order_count = models.PositiveIntegerField(default=0)
+    item_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vendor', 'date'], name='vendor_daily_stats_uniq'),
+        ]
+
+
+class ProductDailyStats(models.Model):
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, related_name='product_daily_stats')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    order_count = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['vendor', 'date'], name='product_stats_vendor_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='product_daily_stats_uniq'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    One ``Idempotency-Key`` per vendor and user (see store.idempotency).
+    ``status_code`` stays null while the first request is still running.
+    """
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, related_name='idempotency_keys')
+    user = models.ForeignKey('User', on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vendor', 'user', 'key'], name='idempotency_key_uniq'),
+        ]
+
+
+class Job(models.Model):
+    """
+    Outbox row for work done after a request (see store.jobs). Written in the
+    same transaction as the data it refers to and run by ``manage.py runworker``.
+    """
+    PENDING, RUNNING, FAILED = 'pending', 'running', 'failed'
+    STATUS_CHOICES = ((PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed'))
+
+    vendor = models.ForeignKey(Vendor, null=True, blank=True, on_delete=models.CASCADE, related_name='jobs')
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField()
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+
+class ProductSearchTerm(models.Model):
+    """
+    Posting in the per-vendor product search index (see store.search): one
+    row per product and trigram, weighted by the best field it occurs in.
+    """
+    vendor = models.ForeignKey(Vendor, on_delete=models.CASCADE, related_name='+')
+    term = models.CharField(max_length=3)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [
+            # Covers the search aggregate so it never reads the table itself.
+            models.Index(fields=['vendor', 'term', 'product', 'weight'], name='search_vendor_term_idx'),
+        ]
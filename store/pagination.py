@@ -0,0 +1,160 @@
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _config():
+    conf = {"PAGE_SIZE": 50, "MAX_PAGE_SIZE": 500}
+    conf.update(getattr(settings, 'STORE_PAGINATION', {}))
+    return conf
+
+
+def _value(row, field):
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over ``(created_at, id)`` newest first.
+
+    Querysets are already scoped to one vendor/staff member/customer by the
+    viewsets, so together with the composite ``(vendor, created_at)`` style
+    indexes every page is a bounded index range scan: page 1000 costs the
+    same as page 1. Cursors are opaque base64 tokens. The total count is
+    only computed when ``?count=true`` is passed.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        conf = _config()
+        self.default_page_size = conf["PAGE_SIZE"]
+        self.max_page_size = conf["MAX_PAGE_SIZE"]
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.default_page_size
+        if size <= 0:
+            return self.default_page_size
+        return min(size, self.max_page_size)
+
+    def encode_cursor(self, row, reverse):
+        position = {'c': _value(row, 'created_at').isoformat(), 'i': _value(row, 'id'), 'r': int(reverse)}
+        raw = json.dumps(position, separators=(',', ':')).encode('ascii')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            position = json.loads(raw)
+            return datetime.fromisoformat(position['c']), int(position['i']), bool(position['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def wants_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def get_page_queryset(self, queryset, request, count=True):
+        """
+        Apply ordering, the seek predicate and the LIMIT. The returned
+        queryset fetches one extra row to detect whether more pages exist;
+        pass its rows to ``build_page``.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        self.count = None
+        if count and self.wants_count(request):
+            self.count = queryset.count()
+
+        if self.cursor is None:
+            self.reverse = False
+            return queryset.order_by('-created_at', '-id')[:self.page_size + 1]
+
+        created_at, pk, self.reverse = self.cursor
+        if self.reverse:
+            seek = Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            ordering = ('created_at', 'id')
+        else:
+            seek = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            ordering = ('-created_at', '-id')
+        return queryset.filter(seek).order_by(*ordering)[:self.page_size + 1]
+
+    def build_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = list(rows[:self.page_size])
+        if self.reverse:
+            rows.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if rows:
+            if self.reverse:
+                self.next_cursor = self.encode_cursor(rows[-1], reverse=False)
+                if has_more:
+                    self.previous_cursor = self.encode_cursor(rows[0], reverse=True)
+            else:
+                if has_more:
+                    self.next_cursor = self.encode_cursor(rows[-1], reverse=False)
+                if self.cursor is not None:
+                    self.previous_cursor = self.encode_cursor(rows[0], reverse=True)
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.build_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        """``paginate_queryset`` for async views, using the async ORM."""
+        page_queryset = self.get_page_queryset(queryset, request, count=False)
+        if self.wants_count(request):
+            self.count = await queryset.acount()
+        return self.build_page([row async for row in page_queryset])
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.previous_cursor)
+
+    def get_paginated_data(self, data):
+        payload = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['results'] = data
+        return payload
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
@@ -1,12 +1,45 @@
+from typing import NamedTuple, Optional
+
 from rest_framework import permissions
 
+
+class Principal(NamedTuple):
+    user_id: Optional[int]
+    role: Optional[str]
+    vendor_id: Optional[int]  # the user's own vendor
+    tenant_id: Optional[int]  # request.tenant, else the user's vendor
+
+
+def principal(request):
+    """
+    The caller as plain ids, worked out once per request. Object checks and
+    queryset scoping compare ``vendor_id``/``assigned_to_id`` against it
+    instead of loading related ``Vendor``/``User`` rows.
+    """
+    cached = getattr(request, '_store_principal', None)
+    if cached is None:
+        user = request.user
+        tenant = getattr(request, 'tenant', None) or getattr(user, 'vendor', None)
+        cached = Principal(
+            user.pk if user.is_authenticated else None,
+            getattr(user, 'role', None),
+            getattr(user, 'vendor_id', None),
+            tenant.pk if tenant else None,
+        )
+        request._store_principal = cached
+    return cached
+
+
 class IsStoreOwner(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and request.user.role == 'owner'
 
     def has_object_permission(self, request, view, obj):
         # Owner must belong to same vendor to manage vendor-specific objects
-        return request.user.is_authenticated and request.user.role == 'owner' and getattr(obj, 'vendor', None) == request.user.vendor
+        if not request.user.is_authenticated:
+            return False
+        caller = principal(request)
+        return caller.role == 'owner' and getattr(obj, 'vendor_id', None) == caller.vendor_id
 
 
 class IsStaffOrOwner(permissions.BasePermission):
@@ -16,10 +49,11 @@ class IsStaffOrOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if not request.user.is_authenticated:
             return False
-        if request.user.role == 'owner':
-            return getattr(obj, 'vendor', None) == request.user.vendor
-        if request.user.role == 'staff':
-            return getattr(obj, 'assigned_to', None) == request.user
+        caller = principal(request)
+        if caller.role == 'owner':
+            return getattr(obj, 'vendor_id', None) == caller.vendor_id
+        if caller.role == 'staff':
+            return getattr(obj, 'assigned_to_id', None) is not None and obj.assigned_to_id == caller.user_id
         return False
 
 
@@ -30,7 +64,7 @@ class IsCustomer(permissions.BasePermission):
 
 class IsVendorObject(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        tenant = getattr(request, 'tenant', None) or getattr(request.user, 'vendor', None)
-        if tenant is None:
-            return request.user.is_authenticated and request.user.role == 'admin'
-        return getattr(obj, 'vendor', None) == tenant
+        caller = principal(request)
+        if caller.tenant_id is None:
+            return request.user.is_authenticated and caller.role == 'admin'
+        return getattr(obj, 'vendor_id', None) == caller.tenant_id
@@ -0,0 +1,98 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from .sharding import TenantShardRouter
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_from_replica = ContextVar('store_read_from_replica', default=False)
+
+
+def _config():
+    conf = {"REPLICAS": {}, "PIN_SECONDS": 5, "COOKIE": "primary_pin", "CACHE_ALIAS": "default"}
+    conf.update(getattr(settings, 'READ_REPLICAS', {}))
+    return conf
+
+
+def replicas_for(alias):
+    return _config()["REPLICAS"].get(alias, [])
+
+
+def primary_of(alias):
+    for primary, pool in _config()["REPLICAS"].items():
+        if alias in pool:
+            return primary
+    return alias
+
+
+def set_replica_reads(enabled):
+    # A plain set rather than a reset token: under ASGI the middleware hooks
+    # run in different sync_to_async contexts, which tokens cannot cross.
+    _read_from_replica.set(enabled)
+
+
+def _pin_key(kind, value):
+    return 'replica:pin:{}:{}'.format(kind, value)
+
+
+def is_pinned(request):
+    """True if this user/tenant wrote recently and must read from the primary."""
+    conf = _config()
+    if request.COOKIES.get(conf["COOKIE"]):
+        return True
+    tenant = getattr(request, 'tenant', None)
+    if not tenant:
+        return False
+    return caches[conf["CACHE_ALIAS"]].get(_pin_key('tenant', tenant.id)) is not None
+
+
+def pin_to_primary(request, response):
+    """Pin the writer (cookie) and its tenant (cache marker) to the primary."""
+    conf = _config()
+    seconds = conf["PIN_SECONDS"]
+    response.set_cookie(conf["COOKIE"], '1', max_age=seconds, httponly=True, samesite='Lax')
+    tenant = getattr(request, 'tenant', None)
+    if tenant:
+        caches[conf["CACHE_ALIAS"]].set(_pin_key('tenant', tenant.id), int(time.time()), seconds)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to a random replica of the primary they would otherwise use
+    (``default`` or the tenant's shard) while ReplicaRoutingMiddleware has
+    flagged the request as a replica-safe read. Writes, and every query of
+    unsafe requests, stay on the primary.
+    """
+
+    shard_router = TenantShardRouter()
+
+    def db_for_read(self, model, **hints):
+        if not _read_from_replica.get():
+            return None
+        if hints.get('instance') is not None:
+            return None
+        primary = self.shard_router.db_for_read(model, **hints) or DEFAULT_DB_ALIAS
+        pool = replicas_for(primary)
+        if not pool:
+            return None
+        return random.choice(pool)
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # A row read from a replica may be related to one from its primary.
+        if primary_of(obj1._state.db) == primary_of(obj2._state.db):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive their schema through replication.
+        if primary_of(db) != db:
+            return False
+        return None
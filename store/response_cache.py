@@ -0,0 +1,150 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+
+def _config():
+    conf = {"CACHE_ALIAS": "default", "TIMEOUT": 300}
+    conf.update(getattr(settings, 'CATALOG_CACHE', {}))
+    return conf
+
+
+def _cache():
+    return caches[_config()["CACHE_ALIAS"]]
+
+
+def is_process_local(alias):
+    """
+    True when ``alias`` is a per-process cache (LocMem) while more than one
+    web worker runs (``WEB_CONCURRENCY``), so writes in one worker are not
+    seen by the others.
+    """
+    return isinstance(caches[alias], LocMemCache) and getattr(settings, 'WEB_CONCURRENCY', 1) > 1
+
+
+def enabled():
+    # Invalidation only reaches other workers through a shared backend.
+    return not is_process_local(_config()["CACHE_ALIAS"])
+
+
+def _gen_key(vendor_id):
+    return 'catalog:gen:{}'.format(vendor_id)
+
+
+def _mtime_key(vendor_id):
+    return 'catalog:mtime:{}'.format(vendor_id)
+
+
+def generation(vendor_id):
+    """Return ``(generation, last_modified_timestamp)`` for a vendor's catalog."""
+    cache = _cache()
+    gen_key, mtime_key = _gen_key(vendor_id), _mtime_key(vendor_id)
+    values = cache.get_many([gen_key, mtime_key])
+    if gen_key in values and mtime_key in values:
+        return values[gen_key], values[mtime_key]
+    # Start from a time-based generation so a key that was evicted can never
+    # come back with a number that older cached responses were stored under.
+    now = time.time()
+    cache.add(gen_key, int(now * 1000), None)
+    cache.add(mtime_key, int(now), None)
+    values = cache.get_many([gen_key, mtime_key])
+    return values.get(gen_key, 0), values.get(mtime_key, int(now))
+
+
+def _bump(vendor_id):
+    cache = _cache()
+    gen_key = _gen_key(vendor_id)
+    try:
+        cache.incr(gen_key)
+    except ValueError:
+        cache.add(gen_key, int(time.time() * 1000), None)
+    cache.set(_mtime_key(vendor_id), int(time.time()), None)
+
+
+def bump_generation(vendor_id, using=None):
+    """
+    Invalidate every cached catalog response of a vendor. Deferred until the
+    surrounding transaction commits so readers cannot cache pre-commit data
+    under the new generation.
+    """
+    if vendor_id is not None:
+        transaction.on_commit(lambda: _bump(vendor_id), using=using)
+
+
+class CatalogCacheMixin:
+    """
+    Read-through response cache for ``list``/``retrieve`` keyed by vendor,
+    catalog generation, role, staff user, renderer and query string. Emits
+    ETag/Last-Modified so conditional GETs are answered with 304 before the
+    queryset or serializer is touched. Only JSON responses are cached (the
+    browsable API embeds the user and a CSRF token), and nothing is cached
+    when the cache alias is process-local under several workers.
+    """
+
+    def get_catalog_vendor_id(self):
+        tenant = getattr(self.request, 'tenant', None)
+        if tenant:
+            return tenant.id
+        return getattr(self.request.user, 'vendor_id', None)
+
+    def get_catalog_cache_key(self, request, vendor_id, gen):
+        user = request.user
+        parts = [
+            str(vendor_id), str(gen), self.action, user.role or '',
+            str(user.id) if user.role == 'staff' else '',
+            request.accepted_renderer.format, request.path,
+            '&'.join(sorted('{}={}'.format(k, v) for k, v in request.query_params.lists())),
+        ]
+        digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+        return 'catalog:resp:{}:{}'.format(vendor_id, digest), digest
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        self._catalog_store = None
+        vendor_id = self.get_catalog_vendor_id()
+        if vendor_id is None or type(request.accepted_renderer) is not JSONRenderer or not enabled():
+            return handler(request, *args, **kwargs)
+
+        gen, last_modified = generation(vendor_id)
+        key, digest = self.get_catalog_cache_key(request, vendor_id, gen)
+        etag = '"{}"'.format(digest)
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+
+        hit = _cache().get(key)
+        if hit is not None:
+            content, content_type = hit
+            response = HttpResponse(content, content_type=content_type)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            self._catalog_store = key
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, '_catalog_store', None)
+        if key and response.status_code == 200:
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+            _cache().set(key, (response.content, response['Content-Type']), _config()["TIMEOUT"])
+        return response
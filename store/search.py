@@ -0,0 +1,122 @@
+import math
+import re
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, Sum
+
+from .jobs import task
+from .models import Product, ProductSearchTerm
+
+WORD = re.compile(r'\w+')
+PRODUCTS_PER_BATCH = 100
+TERMS_PER_INSERT = 2000
+
+
+def _config():
+    conf = {
+        "WEIGHTS": {"sku": 4, "name": 3, "description": 1},
+        "DESCRIPTION_CHARS": 2000, "MIN_SIMILARITY": 0.3, "MAX_RESULTS": 100,
+    }
+    conf.update(getattr(settings, 'PRODUCT_SEARCH', {}))
+    return conf
+
+
+def trigrams(text, prefix=False):
+    """
+    Trigrams of every word, padded like pg_trgm ("  wo", " wor", ..., "rd ").
+    With ``prefix`` the last word is left open on the right so partially
+    typed words still match.
+    """
+    words = WORD.findall(text.casefold())
+    grams = set()
+    for index, word in enumerate(words):
+        padded = '  ' + word + ('' if prefix and index == len(words) - 1 else ' ')
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def postings(product_id, vendor_id, name, sku, description):
+    """Index rows for one product, keeping the best field weight per trigram."""
+    conf = _config()
+    weights = conf["WEIGHTS"]
+    best = {}
+    for field, text in (
+        ('description', (description or '')[:conf["DESCRIPTION_CHARS"]]), ('name', name or ''), ('sku', sku or ''),
+    ):
+        for gram in trigrams(text):
+            best[gram] = max(best.get(gram, 0), weights[field])
+    return [
+        ProductSearchTerm(vendor_id=vendor_id, product_id=product_id, term=gram, weight=weight)
+        for gram, weight in best.items()
+    ]
+
+
+def index_products(rows, using=None):
+    """
+    (Re)index ``rows`` of ``(id, vendor_id, name, sku, description)`` in
+    batches: their old postings are replaced in one transaction per batch.
+    """
+    rows = list(rows)
+    using = using or router.db_for_write(ProductSearchTerm)
+    for start in range(0, len(rows), PRODUCTS_PER_BATCH):
+        batch = rows[start:start + PRODUCTS_PER_BATCH]
+        with transaction.atomic(using=using):
+            ProductSearchTerm.objects.using(using).filter(product_id__in=[row[0] for row in batch]).delete()
+            ProductSearchTerm.objects.using(using).bulk_create(
+                [term for row in batch for term in postings(*row)], batch_size=TERMS_PER_INSERT)
+
+
+def index_product(product, using=None):
+    index_products([(product.pk, product.vendor_id, product.name, product.sku, product.description)], using=using)
+
+
+@task('search.index_products')
+def index_imported(payload):
+    """Index products written without model signals; enqueued per bulk import chunk."""
+    index_products(
+        Product.objects.filter(pk__in=payload['product_ids']).values_list('id', 'vendor_id', 'name', 'sku', 'description'))
+
+
+def search(vendor_id, query, limit=20, products=None):
+    """
+    Rank the vendor's products for ``query``: ``[(product_id, score)]``, best
+    first. Only postings of the query's trigrams are read (an index range
+    per trigram), so the cost follows the number of matching postings, not
+    the catalog size. A product must share ``MIN_SIMILARITY`` of the
+    query's trigrams, which tolerates typos; the score sums the field
+    weights of the shared trigrams, so SKU and name hits outrank
+    description hits. ``products`` optionally narrows the candidates.
+    """
+    conf = _config()
+    grams = trigrams(query, prefix=True)
+    if not grams or vendor_id is None:
+        return []
+    matches = ProductSearchTerm.objects.filter(vendor_id=vendor_id, term__in=grams)
+    if products is not None:
+        matches = matches.filter(product_id__in=products.values('id'))
+    return list(
+        matches.values('product_id')
+        .annotate(hits=Count('term'), score=Sum('weight'))
+        .filter(hits__gte=max(1, math.ceil(len(grams) * conf["MIN_SIMILARITY"])))
+        .order_by('-score', 'product_id')
+        .values_list('product_id', 'score')[:min(limit, conf["MAX_RESULTS"])]
+    )
+
+
+def rebuild(vendor_id=None, batch_size=1000, using=None):
+    """Reindex a vendor's (or every) product on ``using``; returns the count."""
+    products = Product.objects.using(using) if using else Product.objects.all()
+    if vendor_id is not None:
+        products = products.filter(vendor_id=vendor_id)
+    total, last_id = 0, 0
+    while True:
+        rows = list(
+            products.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'vendor_id', 'name', 'sku', 'description')[:batch_size]
+        )
+        if not rows:
+            return total
+        index_products(rows, using=using)
+        total += len(rows)
+        last_id = rows[-1][0]
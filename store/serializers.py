@@ -1,27 +1,53 @@
+from decimal import Decimal
+
+from django.db import router, transaction
 from rest_framework import serializers
+from .assignment import ORDER, pick_staff
+from .instrumentation import TimedListSerializer, TimedSerializerMixin
+from .inventory import InsufficientStock, aggregate_lines, reserve_stock, retry_on_deadlock
 from .models import Vendor, Product, Customer, Order, OrderItem, User
+from .response_cache import bump_generation
+from .jobs import enqueue
 
-class VendorSerializer(serializers.ModelSerializer):
+class VendorSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Vendor
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     assigned_to = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role='staff'), allow_null=True, required=False)
 
     class Meta:
         model = Product
         read_only_fields = ('vendor',)
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
 
     def validate_assigned_to(self, value):
         if value is None:
             return value
         vendor = self.context.get('request').user.vendor or getattr(self.context.get('request'), 'tenant', None)
-        if value.vendor != vendor:
+        if value.vendor_id != (vendor.pk if vendor else None):
             raise serializers.ValidationError("Assigned staff must belong to the same vendor.")
         return value
 
+    def validate_sku(self, value):
+        # ``vendor`` is read-only, so DRF adds no validator for product_vendor_sku_uniq.
+        if not value:
+            return None  # A blank SKU means none, as in bulk imports; NULLs never clash.
+        if self.instance is not None:
+            vendor_id = self.instance.vendor_id
+        else:
+            vendor = getattr(self.context.get('request'), 'tenant', None) or self.context.get('request').user.vendor
+            vendor_id = vendor.pk if vendor else None
+        existing = Product.objects.filter(vendor_id=vendor_id, sku=value)
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError("A product with this SKU already exists.")
+        return value
+
     def create(self, validated_data):
         vendor = getattr(self.context.get('request'), 'tenant', None) or self.context.get('request').user.vendor
         validated_data['vendor'] = vendor
@@ -34,47 +60,84 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['product', 'qty', 'price']
 
-class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(many=True, write_only=True)
+class OrderItemWriteSerializer(serializers.ModelSerializer):
+    # Products are resolved in bulk by OrderSerializer.validate instead of one
+    # PrimaryKeyRelatedField lookup per line.
+    product = serializers.IntegerField()
+
+    class Meta:
+        model = OrderItem
+        fields = ['product', 'qty']
+
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    items = OrderItemWriteSerializer(many=True, write_only=True)
     items_detail = OrderItemSerializer(source='items', many=True, read_only=True)
 
     class Meta:
         model = Order
         fields = ['id', 'customer', 'vendor', 'items', 'items_detail', 'total_amount', 'status', 'created_at', 'assigned_to']
         read_only_fields = ['customer', 'vendor', 'total_amount', 'status', 'created_at']
+        list_serializer_class = TimedListSerializer
+
+    def __init__(self, *args, **kwargs):
+        # Optional read projection, e.g. fields=['id', 'status'] for compact lists.
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
     def validate(self, data):
         request = self.context.get('request')
         vendor = getattr(request, 'tenant', None) or request.user.vendor
-        for item in data.get('items', []):
-            product = item['product']
-            if product.vendor != vendor:
+        vendor_id = vendor.id if vendor else None
+        items = data.get('items', [])
+        products = Product.objects.only('id', 'vendor_id', 'price').in_bulk({item['product'] for item in items})
+        for item in items:
+            product = products.get(item['product'])
+            if product is None:
+                raise serializers.ValidationError({'items': 'Invalid pk "{}" - object does not exist.'.format(item['product'])})
+            if product.vendor_id != vendor_id:
                 raise serializers.ValidationError("Product {} does not belong to your vendor.".format(product.id))
+            item['product'] = product
         return data
 
     def create(self, validated_data):
+        # Follows the tenant's shard (store.sharding) for the whole placement.
+        using = router.db_for_write(Order)
+        return retry_on_deadlock(lambda: self._create(dict(validated_data), using), using=using)
+
+    def _create(self, validated_data, using):
         items_data = validated_data.pop('items', [])
         request = self.context.get('request')
-        customer = None
-        try:
-            customer = Customer.objects.get(user=request.user)
-        except Customer.DoesNotExist:
-            if request.user.role == 'customer':
-                customer = Customer.objects.create(user=request.user, vendor=request.user.vendor, name=request.user.username, email=request.user.email or '')
-            else:
-                raise serializers.ValidationError("No customer associated with this user.")
-
         vendor = getattr(request, 'tenant', None) or request.user.vendor
-        order = Order.objects.create(customer=customer, vendor=vendor)
-
-        total = 0
-        for item in items_data:
-            product = item['product']
-            qty = item['qty']
-            price = product.price
-            OrderItem.objects.create(order=order, product=product, qty=qty, price=price)
-            total += price * qty
-
-        order.total_amount = total
-        order.save()
+
+        with transaction.atomic(using=using):
+            short = reserve_stock(aggregate_lines(items_data), using=using)
+            if short:
+                raise InsufficientStock(short)
+            # The conditional UPDATE bypasses Product signals.
+            bump_generation(vendor.id if vendor else None, using=using)
+
+            customer = None
+            try:
+                customer = Customer.objects.get(user_id=request.user.id)
+            except Customer.DoesNotExist:
+                if request.user.role == 'customer':
+                    customer = Customer.objects.create(user_id=request.user.id, vendor_id=request.user.vendor_id, name=request.user.username, email=request.user.email or '')
+                else:
+                    raise serializers.ValidationError("No customer associated with this user.")
+
+            total = sum((item['product'].price * item['qty'] for item in items_data), Decimal('0'))
+            order = Order.objects.create(
+                customer=customer, vendor=vendor, total_amount=total,
+                assigned_to_id=pick_staff(ORDER, vendor.id if vendor else None),
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=item['product'], qty=item['qty'], price=item['product'].price)
+                for item in items_data
+            ])
+            # Rollups are applied by the job worker (store.jobs) so concurrent
+            # orders do not queue on the vendor's daily stats row.
+            enqueue('stats.record_order', {'order_id': order.id}, vendor_id=order.vendor_id, using=using)
         return order
@@ -0,0 +1,150 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .tenant_cache import LRUCache
+
+# Tenant-owned tables that live on the vendor's shard. Vendor and User stay
+# global on ``default`` and are mirrored into shards for FK integrity.
+SHARDED_MODELS = {
+    'product', 'customer', 'order', 'orderitem', 'vendordailystats', 'productdailystats', 'idempotencykey', 'job',
+    'productsearchterm',
+}
+
+_tenant = ContextVar('store_shard_tenant', default=None)
+_pinned = ContextVar('store_shard_pinned', default=None)
+# Seconds a process may route on a stale mapping; move_vendor_shard waits this out.
+MAP_TTL = 30
+_shard_map = LRUCache(max_size=4096, ttl=MAP_TTL)
+
+
+class ShardMoveInProgress(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'This store is being moved; try again shortly.'
+    default_code = 'shard_move_in_progress'
+
+
+def is_sharded(model):
+    return model._meta.app_label == 'store' and model._meta.model_name in SHARDED_MODELS
+
+
+def set_current_tenant(tenant):
+    """Bind the request's (lazy) tenant for the router; returns a reset token."""
+    return _tenant.set(tenant)
+
+
+def reset_current_tenant(token):
+    _tenant.reset(token)
+
+
+@contextmanager
+def pinned(alias):
+    """Route every sharded query in the block to ``alias`` (management commands)."""
+    token = _pinned.set(alias)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def _mapping(vendor_id):
+    """``(alias, frozen)`` for a vendor, cached in-process for ``MAP_TTL`` seconds."""
+    static = getattr(settings, 'TENANT_SHARDS', {})
+    if vendor_id in static or str(vendor_id) in static:
+        return static.get(vendor_id) or static[str(vendor_id)], False
+    mapping = _shard_map.get(vendor_id)
+    if mapping is None:
+        from .models import TenantShard
+        mapping = (
+            TenantShard.objects.using(DEFAULT_DB_ALIAS)
+            .filter(vendor_id=vendor_id).values_list('alias', 'frozen').first()
+        ) or (DEFAULT_DB_ALIAS, False)
+        _shard_map.set(vendor_id, mapping)
+    return mapping
+
+
+def shard_for_vendor(vendor_id):
+    """
+    Database alias holding a vendor's rows: ``TENANT_SHARDS`` overrides first,
+    then the TenantShard table (cached briefly in-process), else ``default``.
+    """
+    if vendor_id is None:
+        return DEFAULT_DB_ALIAS
+    return _mapping(vendor_id)[0]
+
+
+def is_frozen(vendor_id):
+    """True while move_vendor_shard is copying the vendor's rows."""
+    return vendor_id is not None and _mapping(vendor_id)[1]
+
+
+def forget_vendor(vendor_id):
+    _shard_map.delete(vendor_id)
+
+
+def current_alias():
+    alias = _pinned.get()
+    if alias is not None:
+        return alias
+    tenant = _tenant.get()
+    if not tenant:
+        return None
+    return shard_for_vendor(tenant.id)
+
+
+def _vendor_id_of(instance):
+    from .models import Vendor
+    if isinstance(instance, Vendor):
+        return instance.pk
+    return getattr(instance, 'vendor_id', None)
+
+
+class TenantShardRouter:
+    """
+    Sends Product/Customer/Order/OrderItem (and the rollups) to the shard of
+    the vendor they belong to. The vendor comes from the instance being
+    saved when there is one, otherwise from ``request.tenant`` as bound by
+    TenantMiddleware. Everything else, and tenant-less requests, fall
+    through to the next router / ``default``. Writes for a vendor whose
+    shard move is in progress raise ``ShardMoveInProgress``.
+    """
+
+    def _route(self, model, **hints):
+        if not is_sharded(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None:
+            if is_sharded(instance.__class__) and instance._state.db:
+                return instance._state.db
+            vendor_id = _vendor_id_of(instance)
+            if vendor_id is not None:
+                return shard_for_vendor(vendor_id)
+        return current_alias()
+
+    db_for_read = _route
+
+    def db_for_write(self, model, **hints):
+        alias = self._route(model, **hints)
+        if alias is not None and _pinned.get() is None:
+            instance = hints.get('instance')
+            vendor_id = _vendor_id_of(instance) if instance is not None else None
+            if vendor_id is None:
+                tenant = _tenant.get()
+                vendor_id = tenant.id if tenant else None
+            if is_frozen(vendor_id):
+                raise ShardMoveInProgress()
+        return alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Global Vendor/User rows are mirrored into every shard that needs them.
+        if is_sharded(obj1.__class__) or is_sharded(obj2.__class__):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Shards carry the full schema so FKs to the mirrored rows resolve.
+        return None
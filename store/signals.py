@@ -0,0 +1,75 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .assignment import forget as forget_staff_loads
+from .authentication import user_states
+from .db_connections import count_connect
+from .instrumentation import install_query_timer
+from .models import Vendor, Product, TenantShard, User
+from .response_cache import bump_generation
+from .search import index_product
+from .sharding import forget_vendor, shard_for_vendor
+from .tenant_cache import tenant_cache
+
+
+connection_created.connect(install_query_timer, dispatch_uid='store.query_timer')
+connection_created.connect(count_connect, dispatch_uid='store.connect_counter')
+
+
+@receiver([post_save, post_delete], sender=Vendor)
+def invalidate_tenant(sender, instance, **kwargs):
+    tenant_cache.invalidate(instance.pk)
+    forget_vendor(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_catalog(sender, instance, using, **kwargs):
+    bump_generation(instance.vendor_id, using=using)
+
+
+@receiver(post_save, sender=Product)
+def reindex_product(sender, instance, using, update_fields=None, **kwargs):
+    # Postings go away with the product (FK cascade); stock updates skip this.
+    if update_fields is None or {'name', 'sku', 'description'} & set(update_fields):
+        index_product(instance, using=using)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_state(sender, instance, **kwargs):
+    user_states.forget(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_staff_roster(sender, instance, **kwargs):
+    if instance.vendor_id is not None:
+        forget_staff_loads(instance.vendor_id)
+
+
+@receiver([post_save, post_delete], sender=TenantShard)
+def invalidate_shard_map(sender, instance, **kwargs):
+    forget_vendor(instance.vendor_id)
+
+
+def mirror_row(instance, alias):
+    """Upsert a global Vendor/User row into a shard so sharded FKs resolve."""
+    model = type(instance)
+    fields = [f.attname for f in model._meta.concrete_fields if not f.primary_key]
+    model.objects.using(alias).bulk_create(
+        [model(pk=instance.pk, **{name: getattr(instance, name) for name in fields})],
+        update_conflicts=True,
+        unique_fields=[model._meta.pk.name],
+        update_fields=[f.name for f in model._meta.concrete_fields if not f.primary_key],
+    )
+
+
+@receiver(post_save, sender=Vendor)
+@receiver(post_save, sender=User)
+def mirror_to_shard(sender, instance, using, **kwargs):
+    if using != DEFAULT_DB_ALIAS:
+        return
+    vendor_id = instance.pk if sender is Vendor else instance.vendor_id
+    alias = shard_for_vendor(vendor_id)
+    if alias != DEFAULT_DB_ALIAS:
+        mirror_row(instance, alias)
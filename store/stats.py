@@ -0,0 +1,90 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import router, transaction
+from django.db.models import Case, DecimalField, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from .jobs import task
+from .models import Order, OrderItem, VendorDailyStats, ProductDailyStats
+
+
+class Deltas:
+    """
+    Accumulates rollup increments in memory so they can be written with a
+    handful of statements per (vendor, day) instead of one per order line.
+    """
+
+    def __init__(self):
+        self.vendors = defaultdict(lambda: [0, 0, Decimal('0')])
+        self.products = defaultdict(lambda: [0, 0, Decimal('0')])
+
+    def add_order(self, vendor_id, created_at, lines):
+        """``lines`` is an iterable of ``(product_id, qty, price)``."""
+        day = timezone.localdate(created_at)
+        vendor = self.vendors[(vendor_id, day)]
+        vendor[0] += 1
+        seen = set()
+        for product_id, qty, price in lines:
+            amount = price * qty
+            vendor[1] += qty
+            vendor[2] += amount
+            product = self.products[(vendor_id, product_id, day)]
+            if product_id not in seen:
+                product[0] += 1
+                seen.add(product_id)
+            product[1] += qty
+            product[2] += amount
+
+    def __bool__(self):
+        return bool(self.vendors)
+
+    def apply(self):
+        with transaction.atomic(using=router.db_for_write(VendorDailyStats)):
+            self._apply_vendors()
+            self._apply_products()
+
+    def _apply_vendors(self):
+        VendorDailyStats.objects.bulk_create(
+            [VendorDailyStats(vendor_id=vendor_id, date=day) for vendor_id, day in self.vendors],
+            ignore_conflicts=True,
+        )
+        for (vendor_id, day), (orders, units, revenue) in self.vendors.items():
+            VendorDailyStats.objects.filter(vendor_id=vendor_id, date=day).update(
+                order_count=F('order_count') + orders,
+                item_count=F('item_count') + units,
+                revenue=F('revenue') + revenue,
+            )
+
+    def _apply_products(self):
+        ProductDailyStats.objects.bulk_create(
+            [ProductDailyStats(vendor_id=vendor_id, product_id=product_id, date=day)
+             for vendor_id, product_id, day in self.products],
+            ignore_conflicts=True,
+        )
+        by_day = defaultdict(dict)
+        for (vendor_id, product_id, day), values in self.products.items():
+            by_day[(vendor_id, day)][product_id] = values
+        for (vendor_id, day), products in by_day.items():
+            def increment(index, output_field):
+                return Case(
+                    *[When(product_id=product_id, then=Value(values[index])) for product_id, values in products.items()],
+                    output_field=output_field,
+                )
+            ProductDailyStats.objects.filter(vendor_id=vendor_id, date=day, product_id__in=list(products)).update(
+                order_count=F('order_count') + increment(0, PositiveIntegerField()),
+                units=F('units') + increment(1, PositiveIntegerField()),
+                revenue=F('revenue') + increment(2, DecimalField(max_digits=14, decimal_places=2)),
+            )
+
+
+@task('stats.record_order')
+def record_order(payload):
+    """Add a freshly placed order to the daily rollups; enqueued with every order."""
+    order = Order.objects.filter(pk=payload['order_id']).values_list('vendor_id', 'created_at').first()
+    if order is None:
+        return
+    lines = OrderItem.objects.filter(order_id=payload['order_id']).values_list('product_id', 'qty', 'price')
+    deltas = Deltas()
+    deltas.add_order(*order, lines)
+    deltas.apply()
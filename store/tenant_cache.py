@@ -0,0 +1,174 @@
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Vendor
+
+_MISSING = object()
+_NOT_FOUND = '__none__'
+
+
+def _config():
+    conf = {"MAX_SIZE": 1024, "TTL": 60, "CACHE_ALIAS": None, "SHARED_TTL": 300}
+    conf.update(getattr(settings, 'TENANT_CACHE', {}))
+    return conf
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU with a per-entry TTL, shared by all requests
+    served by one worker process.
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < now:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TenantCache:
+    """
+    Resolves vendor ids to Vendor instances without hitting the database on
+    a warm path.
+
+    Lookups go through the in-process LRU first, then the optional shared
+    Django cache tier (``TENANT_CACHE['CACHE_ALIAS']``), and finally the
+    database. Shared entries are keyed by a per-vendor version so that an
+    invalidation in one process makes every other process miss the shared
+    tier as soon as its local entry expires.
+    """
+
+    def __init__(self):
+        conf = _config()
+        self.local = LRUCache(conf["MAX_SIZE"], conf["TTL"])
+        self.alias = conf["CACHE_ALIAS"]
+        self.shared_ttl = conf["SHARED_TTL"]
+        self._counter_lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def shared(self):
+        return caches[self.alias] if self.alias else None
+
+    def _version_key(self, vendor_id):
+        return 'tenant:ver:{}'.format(vendor_id)
+
+    def _entry_key(self, vendor_id, version):
+        return 'tenant:obj:{}:{}'.format(vendor_id, version)
+
+    def _count(self, name):
+        with self._counter_lock:
+            self._stats[name] += 1
+
+    def get(self, vendor_id):
+        try:
+            vendor_id = int(vendor_id)
+        except (TypeError, ValueError):
+            return None
+
+        vendor = self.local.get(vendor_id, _MISSING)
+        if vendor is not _MISSING:
+            self._count('local_hits')
+            return vendor
+
+        shared = self.shared
+        if shared is not None:
+            version = shared.get(self._version_key(vendor_id), 0)
+            cached = shared.get(self._entry_key(vendor_id, version), _MISSING)
+            if cached is not _MISSING:
+                self._count('shared_hits')
+                vendor = None if cached == _NOT_FOUND else cached
+                self.local.set(vendor_id, vendor)
+                return vendor
+
+        self._count('misses')
+        vendor = Vendor.objects.filter(id=vendor_id).first()
+        self.local.set(vendor_id, vendor)
+        if shared is not None:
+            shared.set(
+                self._entry_key(vendor_id, version),
+                _NOT_FOUND if vendor is None else vendor,
+                self.shared_ttl,
+            )
+        return vendor
+
+    def invalidate(self, vendor_id):
+        self.local.delete(vendor_id)
+        self._count('invalidations')
+        shared = self.shared
+        if shared is not None:
+            key = self._version_key(vendor_id)
+            if not shared.add(key, 1, None):
+                try:
+                    shared.incr(key)
+                except ValueError:
+                    shared.set(key, 1, None)
+
+    def clear(self):
+        self.local.clear()
+
+    def reset_stats(self):
+        with self._counter_lock:
+            self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def stats(self):
+        with self._counter_lock:
+            data = dict(self._stats)
+        data['hits'] = data['local_hits'] + data['shared_hits']
+        data['size'] = len(self.local)
+        return data
+
+
+tenant_cache = TenantCache()
+
+
+def get_vendor(vendor_id):
+    return tenant_cache.get(vendor_id)
+
+
+async def aget_vendor(vendor_id):
+    """Async get_vendor: local LRU hits stay on the event loop, misses run in a thread."""
+    try:
+        vendor = tenant_cache.local.get(int(vendor_id), _MISSING)
+    except (TypeError, ValueError):
+        return None
+    if vendor is not _MISSING:
+        tenant_cache._count('local_hits')
+        return vendor
+    return await sync_to_async(tenant_cache.get)(vendor_id)
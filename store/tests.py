@@ -1,3 +1,1333 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, IntegrityError, connection, connections, router
+from django.db.models import Count
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import db_connections, jobs
+from .authentication import user_states
+from .benchmarking import compare_baselines, load_collection, queries_from_server_timing
+from .instrumentation import registry
+from .login import attempts
+from .middleware import resolve_tenant
+from .jobs import enqueue, run_pending, task
+from .models import (
+    Vendor, User, Product, Customer, Order, OrderItem, TenantShard, IdempotencyKey, Job, VendorDailyStats,
+    ProductSearchTerm,
+)
+from .fast_serializers import compile_mapper
+from .pagination import KeysetPagination
+from .search import search
+from .sharding import forget_vendor
+from .serializers import OrderSerializer, ProductSerializer
+from .tenant_cache import TenantCache, get_vendor, tenant_cache
+from .token_serializers import MyTokenObtainPairSerializer
+from .views import ProductViewSet, OrderViewSet
+
+
+# Query-count and plan tests measure the primary; keep replicas out of them.
+primary_only = override_settings(READ_REPLICAS={'REPLICAS': {}})
+
+
+def seed_tenants(vendors=3, products=20, orders=20):
+    """Small multi-vendor dataset with every role populated."""
+    data = []
+    for v in range(vendors):
+        vendor = Vendor.objects.create(name='Vendor {}'.format(v), contact_email='v{}@example.com'.format(v))
+        owner = User.objects.create(username='owner{}'.format(v), role='owner', vendor=vendor)
+        staff = User.objects.create(username='staff{}'.format(v), role='staff', vendor=vendor)
+        customer_user = User.objects.create(username='customer{}'.format(v), role='customer', vendor=vendor)
+        customer = Customer.objects.create(vendor=vendor, user=customer_user, name='c', email='c@example.com')
+        items = Product.objects.bulk_create([
+            Product(vendor=vendor, name='p{}'.format(i), sku='v{}-{}'.format(v, i), price='9.99', quantity=10,
+                    assigned_to=staff if i % 2 else None)
+            for i in range(products)
+        ])
+        placed = Order.objects.bulk_create([
+            Order(vendor=vendor, customer=customer, total_amount='9.99', status='pending' if i % 3 else 'shipped',
+                  assigned_to=staff if i % 2 else None)
+            for i in range(orders)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=items[i % products], qty=1, price='9.99') for i, order in enumerate(placed)
+        ])
+        data.append({'vendor': vendor, 'owner': owner, 'staff': staff, 'customer': customer_user})
+    return data
+
+
+def bearer(user):
+    return 'Bearer {}'.format(MyTokenObtainPairSerializer.get_token(user).access_token)
+
+
+def client_for(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=bearer(user))
+    return client
+
+
+@primary_only
+class TenantCacheTests(TestCase):
+
+    def setUp(self):
+        self.vendor = Vendor.objects.create(name='Cached', contact_email='c@example.com')
+        tenant_cache.clear()
+        tenant_cache.reset_stats()
+
+    def test_warm_path_is_query_free(self):
+        request = RequestFactory().get('/', HTTP_X_TENANT_ID=str(self.vendor.id))
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_tenant(request), self.vendor)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_tenant(request), self.vendor)
+            self.assertEqual(get_vendor(str(self.vendor.id)), self.vendor)
+            self.assertIsNone(get_vendor('not-a-number'))
+        stats = tenant_cache.stats()
+        self.assertEqual((stats['misses'], stats['local_hits'], stats['hits']), (1, 2, 2))
+
+    def test_unknown_vendor_is_cached_too(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(get_vendor(999999))
+            self.assertIsNone(get_vendor(999999))
+
+    def test_vendor_save_and_delete_invalidate(self):
+        get_vendor(self.vendor.id)
+        self.vendor.name = 'Renamed'
+        self.vendor.save()
+        self.assertEqual(tenant_cache.stats()['invalidations'], 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(get_vendor(self.vendor.id).name, 'Renamed')
+        vendor_id = self.vendor.id
+        self.vendor.delete()
+        self.assertIsNone(get_vendor(vendor_id))
+
+    @override_settings(TENANT_CACHE={'CACHE_ALIAS': 'default'})
+    def test_shared_tier_versions(self):
+        cache.clear()
+        first, second = TenantCache(), TenantCache()  # two worker processes
+        first.get(self.vendor.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(second.get(self.vendor.id), self.vendor)
+        self.assertEqual(second.stats()['shared_hits'], 1)
+
+        Vendor.objects.filter(pk=self.vendor.pk).update(name='Renamed')
+        first.invalidate(self.vendor.id)
+        second.clear()  # its local entry expiring
+        with self.assertNumQueries(1):
+            self.assertEqual(second.get(self.vendor.id).name, 'Renamed')
+
+
+@primary_only
+class TokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user_states.clear()
+        self.tenant = seed_tenants(vendors=1, products=2, orders=2)[0]
+        self.staff = self.tenant['staff']
+        self.product = Product.objects.get(vendor=self.tenant['vendor'], assigned_to=self.staff)
+        self.order = Order.objects.get(vendor=self.tenant['vendor'], assigned_to=self.staff)
+
+    def test_staff_reads_and_updates_own_assignments(self):
+        client = client_for(self.staff)
+        product_url, order_url = '/api/products/{}/'.format(self.product.id), '/api/orders/{}/'.format(self.order.id)
+        self.assertEqual(client.get(product_url).status_code, 200)
+        self.assertEqual(client.patch(product_url, {'quantity': 4}, format='json').status_code, 200)
+        self.assertEqual(client.get(order_url).status_code, 200)
+        self.assertEqual(client.patch(order_url, {'assigned_to': self.staff.id}, format='json').status_code, 200)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).quantity, 4)
+
+    def test_deactivated_user_is_rejected(self):
+        client = client_for(self.staff)
+        url = '/api/orders/{}/'.format(self.order.id)
+        client.get(url)
+        with self.assertNumQueries(2):  # order and items; the user check is cached
+            self.assertEqual(client.get(url).status_code, 200)
+        self.staff.is_active = False
+        self.staff.save()
+        self.assertEqual(client.get(url).status_code, 401)
+
+    @override_settings(TOKEN_AUTH={'USER_CHECK_TTL': 0})
+    def test_check_without_cache(self):
+        client = client_for(self.staff)
+        url = '/api/orders/{}/'.format(self.order.id)
+        self.assertEqual(client.get(url).status_code, 200)
+        User.objects.filter(pk=self.staff.pk).update(is_active=False)  # no signal
+        self.assertEqual(client.get(url).status_code, 401)
+        self.assertEqual(client.get('/api/async/orders/{}/'.format(self.order.id)).status_code, 401)
+        User.objects.filter(pk=self.staff.pk).delete()
+        self.assertEqual(client.get(url).status_code, 401)
+
+
+@primary_only
+class OrderPlacementTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tenant = seed_tenants(vendors=1, products=12, orders=0)[0]
+        self.products = list(Product.objects.filter(vendor=self.tenant['vendor']).order_by('id'))
+        self.customer = client_for(self.tenant['customer'])
+
+    def place(self, items):
+        return self.customer.post('/api/orders/place/', {'items': items}, format='json')
+
+    def test_constant_queries_regardless_of_lines(self):
+        self.place([{'product': self.products[0].id, 'qty': 1}])  # warms tenant, user and staff caches
+        counts = {}
+        for lines in (1, 10):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.place([{'product': p.id, 'qty': 1} for p in self.products[:lines]])
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.json()['items_detail']), lines)
+            counts[lines] = len(queries)
+        self.assertEqual(counts[1], counts[10])
+
+    def test_stock_is_reserved(self):
+        first, second = self.products[:2]
+        response = self.place([{'product': first.id, 'qty': 3}, {'product': second.id, 'qty': 2},
+                               {'product': first.id, 'qty': 1}])
+        self.assertEqual(response.status_code, 201)
+        stock = dict(Product.objects.filter(pk__in=[first.pk, second.pk]).values_list('id', 'quantity'))
+        self.assertEqual(stock, {first.id: 6, second.id: 8})
+
+    def test_insufficient_stock_writes_nothing(self):
+        first, second = self.products[:2]
+        response = self.place([{'product': first.id, 'qty': 2}, {'product': second.id, 'qty': 11}])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['short'], [{'product': second.id, 'requested': 11, 'available': 10}])
+        self.assertEqual(set(Product.objects.filter(vendor=self.tenant['vendor']).values_list('quantity', flat=True)), {10})
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(Job.objects.exists())
+
+
+@primary_only
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = seed_tenants(vendors=1, products=2, orders=8)[0]
+        # Half the orders share one timestamp, so pages must break ties on id.
+        orders = Order.objects.order_by('id')
+        tied = timezone.now() - timedelta(hours=1)
+        Order.objects.filter(pk__in=[o.pk for o in orders[:4]]).update(created_at=tied)
+        cls.expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = client_for(self.tenant['owner'])
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return [row['id'] for row in body['results']], body
+
+    def test_next_and_previous_cursors(self):
+        seen, pages, url = [], [], '/api/orders/?page_size=3&count=true'
+        while url:
+            ids, body = self.page(url)
+            pages.append(ids)
+            seen.extend(ids)
+            url = body['next']
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(ids) for ids in pages], [3, 3, 2])
+        self.assertIsNone(self.page('/api/orders/?page_size=3')[1]['previous'])
+
+        url = body['previous']
+        for expected in reversed(pages[:-1]):
+            ids, body = self.page(url)
+            self.assertEqual(ids, expected)
+            url = body['previous']
+        self.assertIsNone(url)
+
+    def test_invalid_cursor(self):
+        for cursor in ('not-a-cursor', 'W10', 'eyJjIjoxfQ'):  # garbage, [], {"c": 1}
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get('/api/orders/', {'cursor': cursor}).status_code, 404)
+
+
+@primary_only
+class QueryPlanTests(TestCase):
+    """
+    Every tenant-scoped viewset queryset, as issued by the list endpoints,
+    must be answered from an index rather than a full table scan.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenants = seed_tenants()
+
+    def viewset_queryset(self, viewset_class, user, **query):
+        request = Request(APIRequestFactory().get('/', query))
+        request.user = user
+        request._request.tenant = user.vendor
+        view = viewset_class(request=request, format_kwarg=None, action='list')
+        queryset = view.get_queryset()
+        return KeysetPagination().get_page_queryset(queryset, request)
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+        return queryset.explain()
+
+    def assertIndexed(self, queryset):
+        plan = self.explain(queryset)
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan)
+        else:
+            for line in plan.splitlines():
+                self.assertNotRegex(line, r'\bSCAN store_', plan)
+                self.assertNotIn('TEMP B-TREE', line, plan)
+
+    def test_plans(self):
+        tenant = self.tenants[0]
+        cursor_row = Order.objects.filter(vendor=tenant['vendor']).order_by('-created_at', '-id').first()
+        cursor = KeysetPagination().encode_cursor(cursor_row, reverse=False)
+        cases = [
+            (ProductViewSet, 'owner'),
+            (ProductViewSet, 'staff'),
+            (OrderViewSet, 'owner'),
+            (OrderViewSet, 'staff'),
+            (OrderViewSet, 'customer'),
+        ]
+        for viewset_class, role in cases:
+            for query in ({}, {'cursor': cursor}):
+                with self.subTest(viewset=viewset_class.__name__, role=role, cursor=bool(query)):
+                    self.assertIndexed(self.viewset_queryset(viewset_class, tenant[role], **query))
+
+    def test_status_filter_plan(self):
+        vendor = self.tenants[0]['vendor']
+        self.assertIndexed(Order.objects.filter(vendor=vendor, status='pending'))
+
+    def test_sku_lookup_plan(self):
+        vendor = self.tenants[0]['vendor']
+        self.assertIndexed(Product.objects.filter(vendor=vendor, sku='v0-1'))
+
+
+@primary_only
+class ProductSkuTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tenants = seed_tenants(vendors=2, products=2, orders=0)
+        self.owner = client_for(self.tenants[0]['owner'])
+
+    def test_duplicate_sku_is_a_validation_error(self):
+        body = {'name': 'dup', 'sku': 'v0-1', 'price': '1.00', 'quantity': 1}
+        response = self.owner.post('/api/products/', body, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('sku', response.json())
+        self.assertEqual(client_for(self.tenants[1]['owner']).post('/api/products/', body, format='json').status_code, 201)
+
+        product = Product.objects.get(vendor=self.tenants[0]['vendor'], sku='v0-0')
+        url = '/api/products/{}/'.format(product.id)
+        self.assertEqual(self.owner.patch(url, {'sku': 'v0-1'}, format='json').status_code, 400)
+        self.assertEqual(self.owner.patch(url, {'sku': 'v0-0', 'quantity': 2}, format='json').status_code, 200)
+        self.assertEqual(self.owner.put(url, dict(body, sku='v0-0'), format='json').status_code, 200)
+
+    def test_blank_sku_is_stored_as_none(self):
+        body = {'name': 'loose', 'sku': '', 'price': '1.00', 'quantity': 1}
+        for _ in range(2):
+            response = self.owner.post('/api/products/', body, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertIsNone(response.json()['sku'])
+
+
+@primary_only
+class OrderListQueryCountTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenants = seed_tenants(vendors=1, products=10, orders=40)
+
+    def count_queries(self, client, url):
+        client.get(url)  # warm the tenant cache
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx), response.json()['results']
+
+    def test_constant_queries_regardless_of_page_size(self):
+        for role in ('owner', 'staff'):
+            client = client_for(self.tenants[0][role])
+            with self.subTest(role=role):
+                small, rows = self.count_queries(client, '/api/orders/?page_size=2')
+                large, more_rows = self.count_queries(client, '/api/orders/?page_size=40')
+                self.assertGreater(len(more_rows), len(rows))
+                self.assertEqual(small, large)
+                self.assertLessEqual(large, 2)
+
+    def test_compact_projection_skips_items(self):
+        client = client_for(self.tenants[0]['owner'])
+        queries, rows = self.count_queries(client, '/api/orders/?fields=compact')
+        self.assertEqual(queries, 1)
+        self.assertNotIn('items_detail', rows[0])
+        self.assertEqual(set(rows[0]), set(OrderViewSet.compact_fields))
+
+    def test_explicit_projection(self):
+        client = client_for(self.tenants[0]['owner'])
+        _, rows = self.count_queries(client, '/api/orders/?fields=id,status')
+        self.assertEqual(set(rows[0]), {'id', 'status'})
+
+
+@primary_only
+class CatalogCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tenant = seed_tenants(vendors=1, products=4, orders=0)[0]
+        self.owner = client_for(self.tenant['owner'])
+
+    def test_conditional_get_skips_the_view(self):
+        first = self.owner.get('/api/products/')
+        self.assertEqual(first.status_code, 200)
+        with mock.patch.object(ProductViewSet, 'get_queryset', side_effect=AssertionError), self.assertNumQueries(0):
+            self.assertEqual(self.owner.get('/api/products/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+            cached = self.owner.get('/api/products/')
+        self.assertEqual(cached.content, first.content)
+
+    def test_product_save_invalidates(self):
+        first = self.owner.get('/api/products/')
+        product = Product.objects.filter(vendor=self.tenant['vendor']).first()
+        product.price = '12.50'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        second = self.owner.get('/api/products/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertIn(b'"12.50"', second.content)
+
+    def test_keys_per_role_and_staff_member(self):
+        vendor = self.tenant['vendor']
+        other_staff = User.objects.create(username='staff-other', role='staff', vendor=vendor)
+        Product.objects.filter(vendor=vendor, assigned_to=None).update(assigned_to=other_staff)
+        responses = {
+            name: client_for(user).get('/api/products/')
+            for name, user in (('owner', self.tenant['owner']), ('staff', self.tenant['staff']), ('other', other_staff))
+        }
+        self.assertEqual(len(responses['owner'].json()['results']), 4)
+        self.assertEqual(len(responses['staff'].json()['results']), 2)
+        self.assertEqual(len(responses['other'].json()['results']), 2)
+        self.assertEqual(len({response['ETag'] for response in responses.values()}), 3)
+        self.assertTrue(set(r['id'] for r in responses['staff'].json()['results']).isdisjoint(
+            r['id'] for r in responses['other'].json()['results']))
+
+    def test_only_cacheable_responses_get_validators(self):
+        html = self.owner.get('/api/products/', HTTP_ACCEPT='text/html')
+        self.assertEqual(html.status_code, 200)
+        self.assertNotIn('ETag', html)
+        self.assertNotIn('ETag', self.owner.get('/api/products/999999/'))
+        with override_settings(WEB_CONCURRENCY=4):  # LocMem cannot be shared between workers
+            self.assertNotIn('ETag', self.owner.get('/api/products/'))
+
+
+@primary_only
+class VendorStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tenants = seed_tenants(vendors=2, products=2, orders=0)
+        self.vendor = self.tenants[0]['vendor']
+        self.url = '/api/vendors/{}/stats/'.format(self.vendor.id)
+        first, second = Product.objects.filter(vendor=self.vendor).order_by('id')
+        customer = client_for(self.tenants[0]['customer'])
+        for items in ([{'product': first.id, 'qty': 2}], [{'product': first.id, 'qty': 1}, {'product': second.id, 'qty': 3}]):
+            self.assertEqual(customer.post('/api/orders/place/', {'items': items}, format='json').status_code, 201)
+        run_pending(using='default')
+        self.first, self.second = first, second
+        self.old_day = timezone.localdate() - timedelta(days=40)
+        VendorDailyStats.objects.create(vendor=self.vendor, date=self.old_day, order_count=5, item_count=5, revenue='50.00')
+
+    def test_rollups(self):
+        response = client_for(self.tenants[0]['owner']).get(self.url)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['totals'], {'order_count': 2, 'item_count': 6, 'revenue': '59.94'})
+        self.assertEqual(len(body['days']), 1)
+        self.assertEqual(body['top_products'], [
+            {'product': self.first.id, 'units': 3, 'order_count': 2, 'revenue': '29.97'},
+            {'product': self.second.id, 'units': 3, 'order_count': 1, 'revenue': '29.97'},
+        ])
+
+    def test_date_range_and_top(self):
+        owner = client_for(self.tenants[0]['owner'])
+        day = self.old_day.isoformat()
+        body = owner.get(self.url, {'from': day, 'to': day}).json()
+        self.assertEqual((body['totals']['order_count'], body['top_products']), (5, []))
+        self.assertEqual(len(owner.get(self.url, {'from': day}).json()['days']), 2)
+        self.assertEqual(len(owner.get(self.url, {'top': -1}).json()['top_products']), 1)
+        self.assertEqual(len(owner.get(self.url, {'top': 0}).json()['top_products']), 1)
+        for query in ({'from': 'soon'}, {'to': '2024-13-01'}, {'from': '2024-02-01', 'to': '2024-01-01'}):
+            with self.subTest(query=query):
+                self.assertEqual(owner.get(self.url, query).json()['detail'], 'Invalid date range.')
+        response = owner.get(self.url, {'top': 'abc'})
+        self.assertEqual((response.status_code, response.json()['detail']), (400, 'top must be an integer.'))
+
+    def test_owner_and_admin_only(self):
+        admin = User.objects.create(username='platform', role='admin')
+        self.assertEqual(client_for(admin).get(self.url).status_code, 200)
+        for user in (self.tenants[1]['owner'], self.tenants[0]['staff'], self.tenants[0]['customer']):
+            with self.subTest(role=user.role, vendor=user.vendor_id):
+                self.assertEqual(client_for(user).get(self.url).status_code, 403)
+        for missing in ('abc', '999999'):
+            with self.subTest(vendor=missing):
+                self.assertEqual(client_for(admin).get('/api/vendors/{}/stats/'.format(missing)).status_code, 404)
+
+    def test_backfill_skips_jobs_a_worker_holds(self):
+        response = client_for(self.tenants[0]['customer']).post(
+            '/api/orders/place/', {'items': [{'product': self.first.id, 'qty': 1}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        [leased] = jobs.claim('default', 10, 30)
+        call_command('backfill_stats', vendor=self.vendor.id, stdout=StringIO())
+        self.assertTrue(jobs.run(leased))
+        totals = client_for(self.tenants[0]['owner']).get(self.url).json()['totals']
+        self.assertEqual(totals['order_count'], 3)
+
+
+@primary_only
+class ExportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tenant = seed_tenants(vendors=2, products=2, orders=2)[0]
+        self.owner = client_for(self.tenant['owner'])
+
+    def read(self, url):
+        response = self.owner.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_products_csv_and_ndjson(self):
+        Product.objects.filter(vendor=self.tenant['vendor'], sku='v0-0').update(name='=HYPERLINK("x")', price='-1.50')
+        rows = list(csv.reader(StringIO(self.read('/api/products/export/'))))
+        self.assertEqual(rows[0], ProductViewSet.export_fields)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual((rows[1][2], rows[1][4]), ('\'=HYPERLINK("x")', '-1.50'))
+        lines = [json.loads(line) for line in self.read('/api/products/export/?as=ndjson').splitlines()]
+        self.assertEqual(lines[0]['name'], '=HYPERLINK("x")')  # only CSV is read by spreadsheets
+        self.assertEqual([line['sku'] for line in lines], ['v0-0', 'v0-1'])
+        self.assertEqual(self.owner.get('/api/products/export/?as=xml').status_code, 400)
+
+    def test_orders_include_orders_without_items(self):
+        empty = Order.objects.create(vendor=self.tenant['vendor'], customer=Customer.objects.get(user=self.tenant['customer']))
+        rows = list(csv.DictReader(StringIO(self.read('/api/orders/export/'))))
+        self.assertEqual([int(row['order_id']) for row in rows],
+                         list(Order.objects.filter(vendor=self.tenant['vendor']).order_by('id').values_list('id', flat=True)))
+        self.assertEqual((rows[-1]['order_id'], rows[-1]['product_id'], rows[-1]['qty']), (str(empty.id), '', ''))
+        lines = [json.loads(line) for line in self.read('/api/orders/export/?as=ndjson').splitlines()]
+        self.assertEqual((lines[0]['qty'], lines[-1]['qty']), (1, None))
+        staff = client_for(self.tenant['staff']).get('/api/orders/export/')
+        self.assertEqual(len(b''.join(staff.streaming_content).splitlines()), 2)  # header + assigned order
+
+
+@primary_only
+class BulkImportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tenant = seed_tenants(vendors=1, products=2, orders=0)[0]
+        self.owner = client_for(self.tenant['owner'])
+        self.assigned = Product.objects.get(vendor=self.tenant['vendor'], sku='v0-1')  # quantity 10, staff
+
+    def upload(self, content):
+        return self.owner.post('/api/products/bulk/', {'file': SimpleUploadedFile('products.csv', content)}, format='multipart')
+
+    def test_csv_upload_with_error_report(self):
+        response = self.upload(
+            '\ufeffsku,name,price,quantity,assigned_to\n'
+            'N-1,New kettle,12.50,4,\n'
+            'N-2,,1.00,1,\n'
+            'N-3,Mug,abc,-1,{}\n'.format(self.tenant['owner'].id).encode('utf-8'))
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual({k: report[k] for k in ('processed', 'upserted', 'failed')}, {'processed': 3, 'upserted': 1, 'failed': 2})
+        self.assertEqual(report['errors'][0], {'row': 2, 'errors': {'name': ['This field is required.']}})
+        self.assertEqual(set(report['errors'][1]['errors']), {'price', 'quantity', 'assigned_to'})
+        created = Product.objects.get(sku='N-1')
+        self.assertEqual((created.name, created.price, created.quantity), ('New kettle', Decimal('12.50'), 4))
+
+    def test_upsert_only_touches_present_columns(self):
+        self.assertEqual(self.upload(b'sku,name,price\nv0-1,Renamed,3.00\n').status_code, 200)
+        product = Product.objects.get(pk=self.assigned.pk)
+        self.assertEqual((product.name, product.price), ('Renamed', Decimal('3.00')))
+        self.assertEqual((product.quantity, product.assigned_to_id), (10, self.tenant['staff'].id))
+
+        # JSON rows may differ in columns; a blank quantity keeps the stock.
+        response = self.owner.post('/api/products/bulk/', [
+            {'sku': 'v0-1', 'name': 'Renamed', 'price': '3.00', 'quantity': ''},
+            {'sku': 'v0-0', 'name': 'Other', 'price': '1.00', 'quantity': 2, 'assigned_to': None},
+        ], format='json')
+        self.assertEqual(response.json()['upserted'], 2)
+        self.assertEqual(Product.objects.get(pk=self.assigned.pk).quantity, 10)
+        self.assertEqual(Product.objects.get(sku='v0-0').quantity, 2)
+
+    def test_new_products_are_assigned_to_staff(self):
+        extra = User.objects.create(username='staff-import', role='staff', vendor=self.tenant['vendor'])
+        response = self.owner.post('/api/products/bulk/', [
+            {'sku': 'v0-0', 'name': 'Kept', 'price': '1.00'},
+            {'name': 'No SKU', 'price': '1.00'},
+            {'sku': 'N-1', 'name': 'One', 'price': '1.00'},
+            {'sku': 'N-2', 'name': 'Two', 'price': '1.00'},
+        ], format='json')
+        self.assertEqual(response.json()['upserted'], 4)
+        self.assertIsNone(Product.objects.get(sku='v0-0').assigned_to_id)
+        new = Product.objects.filter(vendor=self.tenant['vendor']).exclude(sku__in=['v0-0', 'v0-1'])
+        self.assertEqual(sorted(new.values_list('assigned_to_id', flat=True)), sorted([extra.id, extra.id, self.tenant['staff'].id]))
+
+    def test_non_utf8_upload_is_rejected(self):
+        response = self.upload('sku,name,price\nN-9,Café,1.00\n'.encode('latin-1'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.filter(sku='N-9').exists())
+
+
+@primary_only
+class ObjectPermissionQueryTests(TestCase):
+    """Object-level checks compare ids; they never load Vendor or User rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenants = seed_tenants(vendors=2, products=4, orders=4)
+        cls.admin = User.objects.create(username='admin', role='admin')
+        vendor, staff = cls.tenants[0]['vendor'], cls.tenants[0]['staff']
+        cls.assigned_order = Order.objects.filter(vendor=vendor, assigned_to=staff).first()
+        cls.other_order = Order.objects.filter(vendor=vendor, assigned_to=None).first()
+        cls.assigned_product = Product.objects.filter(vendor=vendor, assigned_to=staff).first()
+        cls.foreign_order = Order.objects.filter(vendor=cls.tenants[1]['vendor']).first()
+
+    def setUp(self):
+        cache.clear()
+
+    def request(self, user, method, url, **kwargs):
+        client = client_for(user)
+        if user.vendor_id:
+            get_vendor(user.vendor_id)  # warm the tenant cache
+        user_states.get(user.id)  # and the is_active check
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(url, format='json', **kwargs)
+        loads = [q['sql'] for q in queries if 'FROM "store_vendor"' in q['sql'] or 'FROM "store_user"' in q['sql']]
+        self.assertEqual(loads, [])
+        return response, len(queries)
+
+    def test_owner(self):
+        owner = self.tenants[0]['owner']
+        order_url = '/api/orders/{}/'.format(self.other_order.id)
+        self.assertEqual(self.request(owner, 'get', order_url)[0].status_code, 200)
+        self.assertEqual(self.request(owner, 'get', order_url)[1], 2)  # order + items
+        self.assertEqual(self.request(owner, 'patch', order_url, data={})[0].status_code, 200)
+        self.assertEqual(self.request(owner, 'get', '/api/orders/{}/'.format(self.foreign_order.id))[0].status_code, 404)
+        self.assertEqual(self.request(owner, 'delete', order_url)[0].status_code, 204)
+        response, queries = self.request(owner, 'get', '/api/products/{}/'.format(self.assigned_product.id))
+        self.assertEqual((response.status_code, queries), (200, 1))
+
+    def test_staff(self):
+        staff = self.tenants[0]['staff']
+        response, queries = self.request(staff, 'get', '/api/orders/{}/'.format(self.assigned_order.id))
+        self.assertEqual((response.status_code, queries), (200, 2))
+        self.assertEqual(self.request(staff, 'patch', '/api/products/{}/'.format(self.assigned_product.id),
+                                      data={'quantity': 3})[0].status_code, 200)
+        response, queries = self.request(staff, 'get', '/api/orders/{}/'.format(self.other_order.id))
+        self.assertEqual((response.status_code, queries), (404, 1))
+
+    def test_customer_and_admin(self):
+        for user in (self.tenants[0]['customer'], self.admin):
+            with self.subTest(role=user.role):
+                response, queries = self.request(user, 'get', '/api/orders/{}/'.format(self.assigned_order.id))
+                self.assertEqual((response.status_code, queries), (403, 0))
+
+
+@primary_only
+class FastListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenant = seed_tenants(vendors=1, products=6, orders=12)[0]
+        Product.objects.filter(pk=Product.objects.first().pk).update(
+            sku=None, description='caf\u00e9 \u2028 "quoted" \\ tab\t \x01 \U0001f600', price='-0.50')
+
+    def assertSameBytes(self, user, url):
+        cache.clear()
+        with override_settings(FAST_SERIALIZATION={'ENABLED': False}):
+            slow = client_for(user).get(url)
+        cache.clear()
+        fast = client_for(user).get(url)
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast['Content-Type'], slow['Content-Type'])
+        self.assertEqual(fast.content, slow.content)
+        return fast
+
+    def test_orders_match_serializer_output(self):
+        owner = self.tenant['owner']
+        for url in ('/api/orders/', '/api/orders/?fields=compact', '/api/orders/?fields=id,items_detail&count=true'):
+            with self.subTest(url=url):
+                response = self.assertSameBytes(owner, url + ('&' if '?' in url else '?') + 'page_size=5')
+        self.assertSameBytes(owner, response.json()['next'])
+        self.assertSameBytes(self.tenant['staff'], '/api/orders/')
+        self.assertIsNotNone(compile_mapper(OrderSerializer()))
+
+    def test_products_match_serializer_output(self):
+        response = self.assertSameBytes(self.tenant['owner'], '/api/products/')
+        self.assertIsNotNone(compile_mapper(ProductSerializer()))
+        self.assertIn('\\u2028', response.content.decode())
+        self.assertSameBytes(self.tenant['staff'], '/api/products/?page_size=2')
+        # The browsable API keeps the regular serializer.
+        self.assertEqual(client_for(self.tenant['owner']).get('/api/products/', HTTP_ACCEPT='text/html').status_code, 200)
+
+
+@primary_only
+class ShardMoveFenceTests(TestCase):
+    """Runs without shard databases: a frozen mapping refuses the vendor's writes."""
+
+    def setUp(self):
+        cache.clear()
+        self.tenant = seed_tenants(vendors=2, products=1, orders=0)[0]
+        self.product = Product.objects.get(vendor=self.tenant['vendor'])
+        TenantShard.objects.create(vendor=self.tenant['vendor'], alias='default', frozen=True)
+
+    def test_writes_are_refused_while_frozen(self):
+        owner = client_for(self.tenant['owner'])
+        response = owner.post('/api/products/', {'name': 'p', 'sku': 'new', 'price': '1.00', 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(owner.get('/api/products/').status_code, 200)
+        placed = client_for(self.tenant['customer']).post(
+            '/api/orders/place/', {'items': [{'product': self.product.id, 'qty': 1}]}, format='json')
+        self.assertEqual(placed.status_code, 503)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).quantity, 10)
+        self.assertFalse(Order.objects.exists())
+
+        TenantShard.objects.filter(vendor=self.tenant['vendor']).update(frozen=False)
+        forget_vendor(self.tenant['vendor'].id)  # what MAP_TTL does in other processes
+        response = owner.post('/api/products/', {'name': 'p', 'sku': 'new', 'price': '1.00', 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+
+@skipUnless('shard1' in settings.DATABASES, 'set SHARD_DATABASE_URLS=shard1=sqlite:///shard1.sqlite3 to run')
+@primary_only
+class ShardRoutingTests(TestCase):
+    databases = {'default', 'shard1'} if 'shard1' in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        cache.clear()
+        self.vendor = Vendor.objects.create(name='Sharded', contact_email='s@example.com')
+        TenantShard.objects.create(vendor=self.vendor, alias='shard1')
+        self.vendor.save()  # mirror the vendor row now that it is mapped
+        self.owner = User.objects.create(username='sh-owner', role='owner', vendor=self.vendor)
+        customer_user = User.objects.create(username='sh-customer', role='customer', vendor=self.vendor)
+        Customer.objects.using('shard1').create(vendor=self.vendor, user=customer_user, name='c', email='c@example.com')
+        self.customer = customer_user
+
+    def test_tenant_rows_follow_the_shard(self):
+        owner = client_for(self.owner)
+        response = owner.post('/api/products/', {'name': 'p', 'sku': 'p1', 'price': '2.50', 'quantity': 5}, format='json')
+        self.assertEqual(response.status_code, 201)
+        product_id = response.json()['id']
+        self.assertTrue(Product.objects.using('shard1').filter(pk=product_id).exists())
+        self.assertFalse(Product.objects.using('default').filter(pk=product_id).exists())
+
+        response = client_for(self.customer).post(
+            '/api/orders/place/', {'items': [{'product': product_id, 'qty': 2}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.using('shard1').filter(vendor=self.vendor).count(), 1)
+        self.assertEqual(OrderItem.objects.using('shard1').count(), 1)
+        self.assertEqual(Product.objects.using('shard1').get(pk=product_id).quantity, 3)
+        self.assertFalse(Order.objects.using('default').exists())
+
+        listed = owner.get('/api/orders/').json()['results']
+        self.assertEqual([row['id'] for row in listed], [response.json()['id']])
+
+    def test_admin_stats_read_the_vendor_shard(self):
+        product = Product.objects.using('shard1').create(vendor=self.vendor, name='p', sku='s1', price='2.00', quantity=5)
+        response = client_for(self.customer).post(
+            '/api/orders/place/', {'items': [{'product': product.id, 'qty': 2}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        run_pending(using='shard1')
+        admin = User.objects.create(username='sh-admin', role='admin')
+        body = client_for(admin).get('/api/vendors/{}/stats/'.format(self.vendor.id)).json()
+        self.assertEqual(body['totals'], {'order_count': 1, 'item_count': 2, 'revenue': '4.00'})
+
+    def test_move_vendor_between_shards(self):
+        Product.objects.using('shard1').create(vendor=self.vendor, name='p', sku='m1', price='1.00', quantity=1)
+        call_command('move_vendor_shard', self.vendor.id, 'default', batch_size=1, wait=0, stdout=StringIO())
+        self.assertEqual(Product.objects.using('default').filter(vendor=self.vendor).count(), 1)
+        self.assertEqual(Customer.objects.using('default').filter(vendor=self.vendor).count(), 1)
+        self.assertFalse(Product.objects.using('shard1').filter(vendor=self.vendor).exists())
+        self.assertFalse(TenantShard.objects.filter(vendor=self.vendor).exists())
+        listed = client_for(self.owner).get('/api/products/').json()['results']
+        self.assertEqual([row['sku'] for row in listed], ['m1'])
+
+
+@primary_only
+class AsyncReadTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tenant = seed_tenants(vendors=2, products=7, orders=7)[0]
+
+    def test_async_endpoints_match_viewsets(self):
+        product = Product.objects.filter(vendor=self.tenant['vendor']).first()
+        order = Order.objects.filter(vendor=self.tenant['vendor']).first()
+        paths = [
+            'products/?page_size=3', 'products/{}/'.format(product.id),
+            'orders/?page_size=3&count=true', 'orders/?fields=compact', 'orders/{}/'.format(order.id),
+        ]
+        for role in ('owner', 'staff'):
+            client = client_for(self.tenant[role])
+            for path in paths:
+                with self.subTest(role=role, path=path):
+                    expected = client.get('/api/' + path)
+                    actual = client.get('/api/async/' + path)
+                    self.assertEqual(actual.status_code, expected.status_code)
+                    # Identical apart from the prefix of the next/previous links.
+                    self.assertEqual(actual.content.replace(b'/api/async/', b'/api/'), expected.content)
+
+        # Follow a cursor across both stacks.
+        client = client_for(self.tenant['owner'])
+        cursor = client.get('/api/orders/?page_size=3').json()['next'].split('?', 1)[1]
+        self.assertEqual(
+            client.get('/api/async/orders/?' + cursor).content.replace(b'/api/async/', b'/api/'),
+            client.get('/api/orders/?' + cursor).content,
+        )
+
+    async def test_asgi_stack(self):
+        client = AsyncClient()
+        owner = {'Authorization': await sync_to_async(bearer)(self.tenant['owner'])}
+        response = await client.get('/api/async/orders/?fields=compact', headers=owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 7)
+        self.assertEqual((await client.get('/api/async/products/999999/', headers=owner)).status_code, 404)
+
+        self.assertEqual((await client.get('/api/async/products/')).status_code, 401)
+        customer = {'Authorization': await sync_to_async(bearer)(self.tenant['customer'])}
+        self.assertEqual((await client.get('/api/async/orders/', headers=customer)).status_code, 403)
+
+
+@primary_only
+@override_settings(STORE_METRICS={'METRICS_TOKEN': 'scrape', 'SERVER_TIMING': True})
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.tenant = seed_tenants(vendors=1, products=3, orders=3)[0]
+
+    def scrape(self):
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_server_timing_and_metrics(self):
+        owner = client_for(self.tenant['owner'])
+        owner.get('/api/orders/')  # warms the tenant cache
+        response = owner.get('/api/orders/')
+        timing = dict(part.strip().split(';', 1) for part in response['Server-Timing'].split(','))
+        self.assertEqual(set(timing), {'db', 'ser', 'app'})
+        self.assertIn('desc="2 queries"', timing['db'])
+
+        text = self.scrape()
+        labels = 'view="order-list",method="GET",tenant="{}"'.format(self.tenant['vendor'].id)
+        self.assertIn('store_request_queries_bucket{{{},le="2"}} 1'.format(labels), text)
+        self.assertIn('store_request_queries_bucket{{{},le="5"}} 2'.format(labels), text)
+        self.assertIn('store_request_duration_seconds_count{{{}}} 2'.format(labels), text)
+        self.assertIn('store_request_serializer_seconds_sum{{{}}}'.format(labels), text)
+
+    def test_slow_request_log_lists_slowest_queries(self):
+        with self.settings(STORE_METRICS={'SLOW_REQUEST_MS': 0, 'SLOW_QUERY_COUNT': 1}):
+            with self.assertLogs('store.slow_requests', 'WARNING') as logs:
+                client_for(self.tenant['owner']).get('/api/orders/')
+        message = logs.output[0]
+        self.assertIn('GET order-list', message)
+        self.assertEqual(message.count('SELECT'), 1)
+
+    def test_slow_request_log_leaves_out_parameters(self):
+        attempts.clear()
+        with self.settings(STORE_METRICS={'SLOW_REQUEST_MS': 0, 'SLOW_QUERY_COUNT': 10}):
+            with self.assertLogs('store.slow_requests', 'WARNING') as logs:
+                APIClient().post('/api/auth/login/', {'username': 'needle-user', 'password': 'x'}, format='json')
+        self.assertIn('"store_user"', logs.output[0])
+        self.assertNotIn('needle-user', logs.output[0])
+
+    def test_labels_are_bounded(self):
+        anonymous = APIClient()
+        for i in range(3):
+            anonymous.get('/api/products/', HTTP_X_TENANT_ID=str(1000 + i))
+            anonymous.generic('FOO{}'.format(i), '/api/products/')
+        text = self.scrape()
+        self.assertIn('view="product-list",method="GET",tenant=""', text)
+        self.assertIn('view="product-list",method="other",tenant=""', text)
+        self.assertNotIn('tenant="1000"', text)
+        self.assertNotIn('FOO', text)
+
+        with self.settings(STORE_METRICS={'MAX_SERIES': 2, 'METRICS_TOKEN': 'scrape'}):
+            client_for(self.tenant['owner']).get('/api/orders/')
+        self.assertIn('view="order-list",method="GET",tenant="other"', self.scrape())
+
+    def test_server_timing_is_off_by_default(self):
+        with self.settings(STORE_METRICS={}):
+            self.assertNotIn('Server-Timing', client_for(self.tenant['owner']).get('/api/orders/'))
+
+    def test_metrics_need_a_token(self):
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with self.settings(STORE_METRICS={}):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            with self.settings(DEBUG=True):
+                self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+@primary_only
+@override_settings(STORE_METRICS={'METRICS_TOKEN': 'scrape'})
+class ConnectionPoolTests(TestCase):
+
+    def test_connection_metrics(self):
+        db_connections.reset()
+        db_connections.count_connect(sender=None, connection=connection)
+        expected_mode = 'none' if settings.DB_CONNECTIONS['MODE'] == 'none' else 'persistent'
+        self.assertEqual(db_connections.mode('default'), expected_mode)
+        text = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').content.decode()
+        self.assertIn('store_db_connects_total{{alias="default",mode="{}"}} 1'.format(expected_mode), text)
+
+
+class BenchmarkHelperTests(TestCase):
+
+    def test_collection_requests(self):
+        requests = load_collection(settings.BASE_DIR / 'Multi-Tenant E-Commerce.postman_collection.json')
+        self.assertEqual(requests['Place Order (customer)'], ('POST', '/api/orders/place/', {'items': [{'product': 1, 'qty': 2}]}))
+        self.assertEqual(requests['Owner: List Orders'], ('GET', '/api/orders/', None))
+
+    def test_compare_baselines(self):
+        def report(rps, p95):
+            return {'endpoints': {'list_orders': {'rps': rps, 'p95_ms': p95}}}
+        rows, regressions = compare_baselines(report(100, 10), report(95, 10.5))
+        self.assertEqual((rows, regressions), ([('list_orders', -5.0, 5.0)], []))
+        _, regressions = compare_baselines(report(100, 10), report(100, 20))
+        self.assertEqual(regressions, ['list_orders'])
+        self.assertEqual(queries_from_server_timing('db;dur=1.20;desc="3 queries", app;dur=4.00'), 3)
+
+
+@primary_only
+class LoginTests(TestCase):
+
+    def setUp(self):
+        attempts.clear()
+        vendor = Vendor.objects.create(name='Login', contact_email='l@example.com')
+        self.user = User.objects.create_user(username='shopper', password='s3cret-pass', role='customer', vendor=vendor)
+
+    def login(self, password='s3cret-pass', **extra):
+        return APIClient().post('/api/auth/login/', {'username': 'shopper', 'password': password}, format='json', **extra)
+
+    def test_login_issues_tenant_claims(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.login('wrong').status_code, 401)
+        refresh = response.json()['refresh']
+        with self.assertNumQueries(0):
+            refreshed = APIClient().post('/api/auth/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(refreshed.status_code, 200)
+        claims = AccessToken(refreshed.json()['access'])
+        self.assertEqual((claims['role'], claims['tenant_id'], claims['username']), ('customer', self.user.vendor_id, 'shopper'))
+
+    @override_settings(STORE_LOGIN={'REFRESH_REVOCATION_CHECK': True})
+    def test_refresh_revocation_check(self):
+        refresh = self.login().json()['refresh']
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(APIClient().post('/api/auth/refresh/', {'refresh': refresh}, format='json').status_code, 401)
+
+    @override_settings(STORE_LOGIN={'USER_ATTEMPTS': 3, 'IP_ATTEMPTS': 0})
+    def test_attempts_are_limited_per_user(self):
+        statuses = [self.login('wrong').status_code for _ in range(4)]
+        self.assertEqual(statuses, [401, 401, 401, 429])
+        limited = self.login()
+        self.assertEqual(limited.status_code, 429)
+        self.assertIn('Retry-After', limited)
+
+    @override_settings(STORE_LOGIN={'USER_ATTEMPTS': 0, 'IP_ATTEMPTS': 2, 'TRUSTED_PROXY_HOPS': 1})
+    def test_attempts_are_limited_per_forwarded_ip(self):
+        # All requests arrive from the proxy's REMOTE_ADDR; clients differ by X-Forwarded-For.
+        first = [self.login('wrong', HTTP_X_FORWARDED_FOR='spoofed, 203.0.113.{}'.format(n % 2)).status_code for n in range(4)]
+        self.assertEqual(first, [401, 401, 401, 401])
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='203.0.113.0').status_code, 429)
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='203.0.113.7').status_code, 200)
+
+    @mock.patch('store.login._unset_hops_warned', False)
+    def test_forwarded_for_without_trusted_hops_is_logged(self):
+        with self.assertLogs('store.login', 'WARNING') as logs:
+            self.login(HTTP_X_FORWARDED_FOR='203.0.113.9')
+            self.login(HTTP_X_FORWARDED_FOR='203.0.113.9')
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('LOGIN_TRUSTED_PROXY_HOPS', logs.output[0])
+
+
+@primary_only
+class IdempotentPlaceTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tenant = seed_tenants(vendors=1, products=2, orders=0)[0]
+        self.customer = client_for(self.tenant['customer'])
+        self.body = {'items': [{'product': Product.objects.filter(vendor=self.tenant['vendor']).first().id, 'qty': 1}]}
+
+    def place(self, key, body=None):
+        return self.customer.post('/api/orders/place/', body or self.body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_repeat_replays_stored_response(self):
+        first = self.place('k-1')
+        self.assertEqual(first.status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            repeat = self.place('k-1')
+        self.assertEqual((repeat.status_code, repeat.content), (201, first.content))
+        self.assertEqual(repeat['Idempotent-Replayed'], 'true')
+        self.assertFalse([q for q in queries if 'store_product' in q['sql'] or 'store_order' in q['sql']])
+        self.assertEqual(Order.objects.filter(vendor=self.tenant['vendor']).count(), 1)
+
+        # Another customer's identical key is a separate request.
+        other = User.objects.create(username='other', role='customer', vendor=self.tenant['vendor'])
+        self.assertNotIn('Idempotent-Replayed', client_for(other).post(
+            '/api/orders/place/', self.body, format='json', HTTP_IDEMPOTENCY_KEY='k-1'))
+        self.assertEqual(self.place('k-1', {'items': [dict(self.body['items'][0], qty=2)]}).status_code, 422)
+
+    def test_failures_release_the_key(self):
+        self.assertEqual(self.place('k-2', {'items': [dict(self.body['items'][0], qty=10 ** 6)]}).status_code, 409)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.place('k-2').status_code, 201)
+
+    @override_settings(IDEMPOTENCY={'WAIT': 0})
+    def test_in_progress_duplicate_and_purge(self):
+        now = timezone.now()
+        self.assertEqual(self.place('k-3').status_code, 201)
+        record = IdempotencyKey.objects.get()
+        IdempotencyKey.objects.filter(pk=record.pk).update(
+            status_code=None, locked_until=now + timedelta(minutes=1))
+        self.assertEqual(self.place('k-3').status_code, 409)
+
+        IdempotencyKey.objects.update(expires_at=now - timedelta(seconds=1))
+        call_command('purge_idempotency_keys', database='default', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_unscoped_or_deleted_users_are_rejected_without_spinning(self):
+        loose = User.objects.create(username='loose', role='customer')
+        response = client_for(loose).post('/api/orders/place/', self.body, format='json', HTTP_IDEMPOTENCY_KEY='k-4')
+        self.assertEqual(response.status_code, 403)
+
+        # A user deleted while their cached state is still valid fails the
+        # insert on the user foreign key, which no retry can fix.
+        client = self.customer
+        User.objects.filter(pk=self.tenant['customer'].pk).delete()
+        stale_state = mock.patch.object(user_states, 'get', return_value=(True, None))
+        failing_insert = mock.patch('django.db.models.query.QuerySet.create', side_effect=IntegrityError('FOREIGN KEY'))
+        with stale_state, failing_insert as create:
+            started = time.monotonic()
+            response = client.post('/api/orders/place/', self.body, format='json', HTTP_IDEMPOTENCY_KEY='k-4')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(create.call_count, 1)
+        self.assertLess(time.monotonic() - started, 1)
+
+
+@task('tests.flaky')
+def flaky(payload):
+    raise RuntimeError(payload['message'])
+
+
+@primary_only
+class JobQueueTests(TestCase):
+
+    def test_order_rollups_are_queued_with_the_order(self):
+        tenant = seed_tenants(vendors=1, products=2, orders=0)[0]
+        product = Product.objects.filter(vendor=tenant['vendor']).first()
+        response = client_for(tenant['customer']).post(
+            '/api/orders/place/', {'items': [{'product': product.id, 'qty': 3}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(list(Job.objects.values_list('name', 'payload')), [('stats.record_order', {'order_id': response.data['id']})])
+        self.assertFalse(VendorDailyStats.objects.exists())
+
+        self.assertEqual(run_pending(using='default'), 1)
+        self.assertFalse(Job.objects.exists())
+        stats = VendorDailyStats.objects.get(vendor=tenant['vendor'])
+        self.assertEqual((stats.order_count, stats.item_count), (1, 3))
+
+    @override_settings(JOBS={'RUN_INLINE': True})
+    def test_run_inline_after_commit(self):
+        tenant = seed_tenants(vendors=1, products=2, orders=0)[0]
+        product = Product.objects.filter(vendor=tenant['vendor']).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client_for(tenant['customer']).post(
+                '/api/orders/place/', {'items': [{'product': product.id, 'qty': 2}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Job.objects.exists())
+        stats = VendorDailyStats.objects.get(vendor=tenant['vendor'])
+        self.assertEqual((stats.order_count, stats.item_count), (1, 2))
+
+    @override_settings(JOBS={'BACKOFF': 10})
+    def test_failures_back_off_then_fail(self):
+        job = enqueue('tests.flaky', {'message': 'boom'}, using='default')
+        with self.assertLogs('store.jobs', 'WARNING'):
+            self.assertEqual(run_pending(using='default'), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.PENDING, 1))
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=9))
+        self.assertIn('boom', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now(), max_attempts=2)
+        with self.assertLogs('store.jobs', 'WARNING'):
+            run_pending(using='default')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+
+@primary_only
+class StaffAssignmentTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tenant = seed_tenants(vendors=1, products=2, orders=0)[0]
+        vendor = self.tenant['vendor']
+        self.staff = [self.tenant['staff'].id] + [
+            User.objects.create(username='staff-extra{}'.format(i), role='staff', vendor=vendor).id for i in range(2)
+        ]
+        self.product = Product.objects.filter(vendor=vendor).first()
+
+    def place(self):
+        # Loads are counted on commit, which TestCase otherwise never reaches.
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client_for(self.tenant['customer']).post(
+                '/api/orders/place/', {'items': [{'product': self.product.id, 'qty': 1}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['assigned_to']
+
+    def test_least_outstanding_without_per_order_counts(self):
+        Order.objects.create(vendor=self.tenant['vendor'], customer=Customer.objects.get(), assigned_to_id=self.staff[0])
+        first = self.place()  # warms the cached loads
+        self.assertEqual(first, self.staff[1])
+        with CaptureQueriesContext(connection) as queries:
+            assigned = [self.place() for _ in range(4)]
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+        self.assertEqual(sorted([first] + assigned), sorted([self.staff[0], self.staff[1], self.staff[1]] + [self.staff[2]] * 2))
+
+        # Reassigning through the API moves the load along.
+        owner = client_for(self.tenant['owner'])
+        order = Order.objects.filter(assigned_to_id=self.staff[2]).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = owner.patch('/api/orders/{}/'.format(order.id), {'assigned_to': self.staff[0]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.place(), self.staff[2])
+
+    def test_failed_placement_is_not_counted(self):
+        self.assertEqual(self.place(), self.staff[0])
+        # The placement fails after the pick, so its transaction rolls back.
+        with mock.patch('store.serializers.enqueue', side_effect=DatabaseError('boom')), self.assertRaises(DatabaseError):
+            self.place()
+        self.assertEqual(self.place(), self.staff[1])
+        self.assertEqual(self.place(), self.staff[2])
+
+    @override_settings(WEB_CONCURRENCY=2, STAFF_ASSIGNMENT={'LOCAL_TTL': 7})
+    def test_process_local_cache_is_reconciled_on_the_short_ttl(self):
+        roster_key = 'assign:order:{}:staff'.format(self.tenant['vendor'].id)
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            self.assertEqual(self.place(), self.staff[0])
+        self.assertIn(mock.call(roster_key, tuple(self.staff), 7), cache_set.call_args_list)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual([self.place() for _ in range(2)], self.staff[1:])
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+
+    @override_settings(STAFF_ASSIGNMENT={'STRATEGY': 'round_robin'})
+    def test_round_robin(self):
+        self.assertEqual([self.place() for _ in range(4)], self.staff + self.staff[:1])
+
+    def test_rebalance_command(self):
+        vendor, customer = self.tenant['vendor'], Customer.objects.get()
+        Order.objects.bulk_create([Order(vendor=vendor, customer=customer, assigned_to_id=self.staff[0]) for _ in range(7)])
+        Order.objects.bulk_create([Order(vendor=vendor, customer=customer) for _ in range(2)])
+        Order.objects.create(vendor=vendor, customer=customer, status='shipped', assigned_to_id=self.staff[0])
+        call_command('rebalance_staff', vendor=[vendor.id], stdout=StringIO())
+        loads = dict(Order.objects.filter(status='pending').values_list('assigned_to_id').annotate(n=Count('id')))
+        self.assertEqual(loads, {self.staff[0]: 3, self.staff[1]: 3, self.staff[2]: 3})
+        self.assertEqual(Order.objects.get(status='shipped').assigned_to_id, self.staff[0])
+
+
+@primary_only
+class ProductSearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tenant = seed_tenants(vendors=2, products=3, orders=0)[0]
+        vendor = self.tenant['vendor']
+        make = lambda **kw: Product.objects.create(vendor=vendor, price='1.00', quantity=1, **kw)
+        self.kettle = make(name='Electric kettle', sku='KT-100', description='Boils water fast')
+        self.mug = make(name='Ceramic mug', sku='MG-200', description='Holds tea from the kettle',
+                        assigned_to=self.tenant['staff'])
+        self.lamp = make(name='Desk lamp', sku='LP-300', description='Warm light')
+
+    def get(self, user, **query):
+        return client_for(user).get('/api/products/search/', query)
+
+    def test_ranked_typo_and_prefix_matches(self):
+        response = self.get(self.tenant['owner'], q='ketle')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.kettle.id, self.mug.id])
+        self.assertEqual([row['id'] for row in self.get(self.tenant['owner'], q='cera').data['results']], [self.mug.id])
+        self.assertEqual([row['id'] for row in self.get(self.tenant['owner'], q='lp-300').data['results']], [self.lamp.id])
+        self.assertEqual(self.get(self.tenant['owner']).status_code, 400)
+
+    def test_scoped_to_vendor_and_staff(self):
+        other = Vendor.objects.exclude(pk=self.tenant['vendor'].pk).get()
+        Product.objects.create(vendor=other, name='Electric kettle', sku='X-1', price='1.00', quantity=1)
+        self.assertEqual(len(self.get(self.tenant['owner'], q='kettle').data['results']), 2)
+        self.assertEqual([row['id'] for row in self.get(self.tenant['staff'], q='kettle').data['results']], [self.mug.id])
+
+    def test_index_follows_writes(self):
+        self.kettle.name = 'Toaster'
+        self.kettle.save()
+        self.assertEqual(search(self.tenant['vendor'].id, 'toaster'), [(self.kettle.id, 7 * 3)])  # 7 prefix trigrams, name weight
+        self.lamp.delete()
+        self.assertEqual(search(self.tenant['vendor'].id, 'lamp'), [])
+        response = client_for(self.tenant['owner']).post(
+            '/api/products/bulk/', [{'sku': 'KT-100', 'name': 'Kettle', 'price': '1.00', 'quantity': 1},
+                                    {'sku': 'NEW-1', 'name': 'Teapot', 'price': '1.00', 'quantity': 1}], format='json')
+        self.assertEqual(response.status_code, 200)
+        run_pending(using='default')  # imports are indexed by a queued job
+        self.assertEqual(search(self.tenant['vendor'].id, 'teapot')[0][0], Product.objects.get(sku='NEW-1').id)
+        self.assertEqual(search(self.tenant['vendor'].id, 'toaster'), [])
+
+    def test_rebuild_and_plan(self):
+        ProductSearchTerm.objects.all().delete()
+        call_command('rebuild_search_index', database=['default'], stdout=StringIO())
+        self.assertEqual(search(self.tenant['vendor'].id, 'kettle')[0][0], self.kettle.id)
+        self.assertEqual(ProductSearchTerm.objects.values('product').distinct().count(), Product.objects.count())
+        plan = ProductSearchTerm.objects.filter(vendor=self.tenant['vendor'], term__in=['ket', 'ett']).values('product_id').annotate(n=Count('term')).explain()
+        self.assertNotRegex(plan, r'\bSCAN store_productsearchterm\b|Seq Scan')
+
+
+@primary_only
+class AdminScaleTests(TestCase):
+    """
+    Changelists stay bounded as tables grow. Seeds ADMIN_SCALE_ORDERS orders
+    (default 5000); run with ADMIN_SCALE_ORDERS=1000000 for the full check.
+    """
+
+    orders = int(os.getenv('ADMIN_SCALE_ORDERS', '5000'))
+    budget = float(os.getenv('ADMIN_SCALE_BUDGET', '2.0'))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendors = Vendor.objects.bulk_create([
+            Vendor(name='Scale vendor {}'.format(i), contact_email='s{}@example.com'.format(i)) for i in range(50)])
+        customers = Customer.objects.bulk_create([
+            Customer(vendor=vendor, name='Customer {}'.format(i), email='c@example.com') for i, vendor in enumerate(cls.vendors)])
+        for start in range(0, cls.orders, 10000):
+            Order.objects.bulk_create([
+                Order(vendor_id=customers[i % 50].vendor_id, customer=customers[i % 50], total_amount='1.00')
+                for i in range(start, min(start + 10000, cls.orders))
+            ])
+        product = Product.objects.create(vendor=cls.vendors[0], name='Widget', sku='W-1', price='1.00', quantity=1)
+        cls.big_order = Order.objects.filter(vendor=cls.vendors[0]).first()
+        OrderItem.objects.bulk_create([OrderItem(order=cls.big_order, product=product, qty=1, price='1.00') for _ in range(120)])
+        cls.admin = User.objects.create_superuser('scale-admin', 'admin@example.com', 'pass')
+
+    def get(self, url):
+        self.client.force_login(self.admin)
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(elapsed, self.budget)
+        sql = [q['sql'] for q in queries]
+        self.assertFalse([q for q in sql if 'FROM "store_vendor"' in q and 'WHERE' not in q], 'vendor filter listed every vendor')
+        return response, sql
+
+    def test_changelists_bounded(self):
+        response, sql = self.get('/admin/store/order/')
+        # session, user, row estimate (in a savepoint), capped count, page, status values
+        self.assertLessEqual(len(sql), 9)
+        self.assertEqual(len([q for q in sql if 'COUNT(' in q]), 1)  # no separate full count
+        vendor = self.vendors[3]
+        response, sql = self.get('/admin/store/order/?vendor__id__exact={}'.format(vendor.id))
+        self.assertLessEqual(len(sql), 10)
+        self.assertContains(response, 'Scale vendor 3')
+        for url in ('/admin/store/product/', '/admin/store/customer/', '/admin/store/user/'):
+            self.get(url)
+
+    @override_settings(STORE_ADMIN={'ESTIMATE_THRESHOLD': 1})
+    def test_unfiltered_count_is_estimated(self):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE store_order')
+        _, sql = self.get('/admin/store/order/')
+        self.assertFalse([q for q in sql if 'COUNT(' in q and 'store_order' in q])
+
+    def test_item_inline_is_paginated(self):
+        url = '/admin/store/order/{}/change/'.format(self.big_order.id)
+        response, _ = self.get(url + '?_changelist_filters=status%3Dpending&items_page=3')
+        self.assertContains(response, '3 / 3 (120 order items)')
+        self.assertContains(response, 'href="?_changelist_filters=status%3Dpending&amp;items_page=2"')
+        self.assertEqual(response.context['inline_admin_formsets'][0].formset.total_form_count(), 20)
+
+
+@skipUnless('replica1' in settings.DATABASES, 'set REPLICA_DATABASE_URLS=replica1=sqlite:///replica1.sqlite3')
+class ReplicaRoutingTests(TransactionTestCase):
+    # Replica connections only see committed rows, so no per-test transaction.
+    databases = {'default', 'replica1'} if 'replica1' in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        cache.clear()
+        self.tenant = seed_tenants(vendors=1, products=2, orders=2)[0]
+
+    def list_orders(self, client):
+        with CaptureQueriesContext(connections['replica1']) as replica, CaptureQueriesContext(connection) as primary:
+            response = client.get('/api/orders/')
+        self.assertEqual(response.status_code, 200)
+        return len(replica), len(primary)
+
+    def test_safe_reads_use_the_replica(self):
+        replica, _ = self.list_orders(client_for(self.tenant['owner']))
+        self.assertGreater(replica, 0)
+
+    def test_writes_pin_client_and_tenant_to_primary(self):
+        customer = client_for(self.tenant['customer'])
+        product = Product.objects.filter(vendor=self.tenant['vendor']).first()
+        response = customer.post('/api/orders/place/', {'items': [{'product': product.id, 'qty': 1}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('primary_pin', response.cookies)
+
+        # Other users of the tenant see the cache marker.
+        for user in (self.tenant['owner'], self.tenant['staff']):
+            replica, primary = self.list_orders(client_for(user))
+            self.assertEqual(replica, 0)
+            self.assertGreater(primary, 0)
+
+        cache.clear()
+        owner = client_for(self.tenant['owner'])
+        replica, _ = self.list_orders(owner)
+        self.assertGreater(replica, 0)
+
+        # The writer itself carries the cookie.
+        owner.cookies['primary_pin'] = '1'
+        replica, primary = self.list_orders(owner)
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+
+    def test_router_only_uses_replicas_when_enabled(self):
+        from .replicas import set_replica_reads
+        self.assertEqual(router.db_for_read(Order), 'default')
+        set_replica_reads(True)
+        try:
+            self.assertEqual(router.db_for_read(Order), 'replica1')
+            self.assertEqual(router.db_for_write(Order), 'default')
+        finally:
+            set_replica_reads(False)
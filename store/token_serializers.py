@@ -1,10 +1,61 @@
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.conf import settings
+from django.contrib.auth import get_user_model, user_login_failed
+from django.contrib.auth.models import update_last_login
+from rest_framework import exceptions
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .login import _config as login_config, verify_password
+
+DEFAULT_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
         token['role'] = user.role
-        token['tenant_id'] = user.vendor_id 
+        token['tenant_id'] = user.vendor_id
         token['username'] = user.username
         return token
+
+    def validate(self, attrs):
+        # Custom backends keep the stock authenticate() path.
+        if list(settings.AUTHENTICATION_BACKENDS) != DEFAULT_BACKENDS:
+            return super().validate(attrs)
+
+        username = attrs[self.username_field]
+        User = get_user_model()
+        user = User._default_manager.filter(**{User.USERNAME_FIELD: username}).first()
+        # Same rules as ModelBackend: verify (or burn a dummy hash) then require is_active.
+        if not verify_password(user, attrs['password']) or not user.is_active:
+            user_login_failed.send(
+                sender=__name__, credentials={self.username_field: username},
+                request=self.context.get('request'),
+            )
+            user = None
+        self.user = user
+        if not api_settings.USER_AUTHENTICATION_RULE(self.user):
+            raise exceptions.AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        refresh = self.get_token(self.user)
+        data = {'refresh': str(refresh), 'access': str(refresh.access_token)}
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, self.user)
+        return data
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Issues the new access token from the refresh token's own claims (role,
+    tenant_id, username are copied over) without loading the ``User``.
+    With ``STORE_LOGIN['REFRESH_REVOCATION_CHECK']`` or refresh rotation
+    enabled the stock serializer runs, which checks the user still exists
+    and is active.
+    """
+
+    def validate(self, attrs):
+        if login_config()["REFRESH_REVOCATION_CHECK"] or api_settings.ROTATE_REFRESH_TOKENS:
+            return super().validate(attrs)
+        refresh = self.token_class(attrs['refresh'])
+        return {'access': str(refresh.access_token)}
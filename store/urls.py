@@ -1,4 +1,5 @@
-from .views import ProductViewSet, OrderViewSet, RegisterView, CustomTokenObtainPairView, VendorViewSet
+from .views import ProductViewSet, OrderViewSet, RegisterView, CustomTokenObtainPairView, ClaimsTokenRefreshView, VendorViewSet
+from .async_views import AsyncOrderView, AsyncProductView
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
@@ -10,5 +11,11 @@ router.register(r'vendors', VendorViewSet, basename='vendor')
 urlpatterns = [
     path('auth/register/', RegisterView.as_view(), name='register'),  # <-- use .as_view()
     path('auth/login/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('auth/refresh/', ClaimsTokenRefreshView.as_view(), name='token_refresh'),
+    # Async (ASGI) equivalents of the product/order list and retrieve endpoints.
+    path('async/products/', AsyncProductView.as_view(), name='async-product-list'),
+    path('async/products/<int:pk>/', AsyncProductView.as_view(), name='async-product-detail'),
+    path('async/orders/', AsyncOrderView.as_view(), name='async-order-list'),
+    path('async/orders/<int:pk>/', AsyncOrderView.as_view(), name='async-order-detail'),
     path('', include(router.urls)),
 ]
@@ -1,13 +1,37 @@
-from rest_framework import viewsets, status
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import router
+from django.db.models import Prefetch, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import exceptions, viewsets, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from .models import Product, Order, User, Customer, Vendor
+from .models import Product, Order, OrderItem, User, Customer, Vendor, VendorDailyStats, ProductDailyStats
 from .serializers import ProductSerializer, OrderSerializer, VendorSerializer
-from .permissions import IsStoreOwner, IsStaffOrOwner, IsVendorObject
+from .assignment import ORDER, PRODUCT, order_changed, pick_staff, reassigned
+from .bulk_import import import_products, iter_upload_rows
+from .exports import EXPORT_FORMATS, export_response
+from .fast_serializers import FastListMixin
+from .idempotency import HEADER as IDEMPOTENCY_HEADER, run_once
+from .login import check_login_rate, client_ip
+from .pagination import KeysetPagination
+from .permissions import IsStoreOwner, IsStaffOrOwner, IsVendorObject, principal
+from .response_cache import CatalogCacheMixin
+from .search import search as search_products
+from .tenant_cache import get_vendor
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _money(value):
+    return str(Decimal(value).quantize(Decimal('0.01')))
 
 
 class RegisterView(APIView):
@@ -53,39 +77,232 @@ class VendorViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Only platform admins can create vendors."}, status=status.HTTP_403_FORBIDDEN)
         return super().create(request, *args, **kwargs)
 
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """
+        Daily revenue, order count and top products for a vendor, read only
+        from the VendorDailyStats/ProductDailyStats rollups.
+        Query params: from, to (YYYY-MM-DD, default last 30 days), top (default 10).
+        """
+        user = request.user
+        if not (user.role == 'admin' or (user.role == 'owner' and str(user.vendor_id) == str(pk))):
+            return Response({"detail": "You do not have permission to perform this action."}, status=status.HTTP_403_FORBIDDEN)
+        vendor = get_vendor(pk)
+        if vendor is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            date_to = parse_date(request.query_params['to']) if 'to' in request.query_params else timezone.localdate()
+            date_from = parse_date(request.query_params['from']) if 'from' in request.query_params else date_to - timedelta(days=29)
+        except (TypeError, ValueError):
+            date_from = None
+        if date_from is None or date_to is None or date_from > date_to:
+            return Response({"detail": "Invalid date range."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top = int(request.query_params.get('top', 10))
+        except ValueError:
+            return Response({"detail": "top must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        top = max(1, min(top, 100))
+
+        # Admins have no request tenant, so point the reads at the vendor's shard.
+        using = router.db_for_read(VendorDailyStats, instance=vendor)
+        days = list(
+            VendorDailyStats.objects.using(using)
+            .filter(vendor_id=vendor.id, date__range=(date_from, date_to))
+            .order_by('date')
+            .values('date', 'order_count', 'item_count', 'revenue')
+        )
+        top_products = (
+            ProductDailyStats.objects.using(using)
+            .filter(vendor_id=vendor.id, date__range=(date_from, date_to))
+            .values('product_id')
+            .annotate(units=Sum('units'), revenue=Sum('revenue'), order_count=Sum('order_count'))
+            .order_by('-revenue', 'product_id')[:top]
+        )
+        return Response({
+            "vendor": vendor.id,
+            "from": date_from,
+            "to": date_to,
+            "totals": {
+                "order_count": sum(day['order_count'] for day in days),
+                "item_count": sum(day['item_count'] for day in days),
+                "revenue": _money(sum((day['revenue'] for day in days), Decimal('0'))),
+            },
+            "days": [dict(day, revenue=_money(day['revenue'])) for day in days],
+            "top_products": [
+                {"product": row['product_id'], "units": row['units'], "order_count": row['order_count'], "revenue": _money(row['revenue'])}
+                for row in top_products
+            ],
+        })
+
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CatalogCacheMixin, FastListMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated, IsStaffOrOwner, IsVendorObject]
+    pagination_class = KeysetPagination
+    replica_reads = True
 
     def get_queryset(self):
-        tenant = getattr(self.request, 'tenant', None) or self.request.user.vendor
-        if tenant is None and self.request.user.role == 'admin':
+        caller = principal(self.request)
+        if caller.tenant_id is None and caller.role == 'admin':
             return Product.objects.all()
-        if self.request.user.role == 'staff':
-            return Product.objects.filter(assigned_to=self.request.user)
-        return Product.objects.filter(vendor=tenant)
+        if caller.role == 'staff':
+            return Product.objects.filter(assigned_to_id=caller.user_id)
+        return Product.objects.filter(vendor_id=caller.tenant_id)
 
     def perform_create(self, serializer):
         vendor = getattr(self.request, 'tenant', None) or self.request.user.vendor
-        serializer.save(vendor=vendor)
+        extra = {}
+        if 'assigned_to' not in serializer.validated_data and vendor is not None:
+            extra['assigned_to_id'] = pick_staff(PRODUCT, vendor.id)
+        serializer.save(vendor=vendor, **extra)
+
+    def perform_update(self, serializer):
+        before = serializer.instance.assigned_to_id
+        product = serializer.save()
+        reassigned(PRODUCT, product.vendor_id, before, product.assigned_to_id)
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        reassigned(PRODUCT, instance.vendor_id, instance.assigned_to_id, None)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsStoreOwner])
+    def bulk(self, request):
+        """
+        Upsert products on (vendor, sku) from a JSON array body or a multipart
+        CSV upload in ``file``. Rows are validated in memory and written in
+        chunks; the response lists the rows that were rejected.
+        """
+        vendor = getattr(request, 'tenant', None) or request.user.vendor
+        if vendor is None:
+            return Response({"detail": "No vendor associated with this user."}, status=status.HTTP_400_BAD_REQUEST)
+        rows = iter_upload_rows(request)
+        if rows is None:
+            return Response({"detail": "Send a JSON array or a CSV file upload."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(import_products(vendor, rows))
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Typo-tolerant search over name, SKU and description: ?q= (required)
+        and ?limit= (default 20). Results are ranked, best first, and cached
+        with the catalog.
+        """
+        return self.cached_response(self.search_results, request)
 
-class OrderViewSet(viewsets.ModelViewSet):
+    def search_results(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"detail": "Pass a search term in ?q=."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = max(1, int(request.query_params.get('limit', 20)))
+        except ValueError:
+            return Response({"detail": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        scope = self.get_queryset() if request.user.role == 'staff' else None
+        ranked = search_products(self.get_catalog_vendor_id(), query, limit, products=scope)
+        found = self.get_queryset().in_bulk([product_id for product_id, _ in ranked])
+        results = [found[product_id] for product_id, _ in ranked if product_id in found]
+        return Response({"query": query, "results": self.get_serializer(results, many=True).data})
+
+    export_fields = ['id', 'sku', 'name', 'description', 'price', 'quantity', 'assigned_to_id', 'created_at']
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the whole (scoped) catalog as ?as=csv (default) or ?as=ndjson."""
+        export_format = request.query_params.get('as', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({"detail": "Unsupported export format."}, status=status.HTTP_400_BAD_REQUEST)
+        # The body streams after the middleware unbinds tenant/replica routing,
+        # so fix the database alias now.
+        rows = (
+            self.get_queryset()
+            .using(router.db_for_read(Product))
+            .order_by('id')
+            .values_list(*self.export_fields)
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        return export_response(export_format, 'products', self.export_fields, rows)
+
+class OrderViewSet(FastListMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated, IsStaffOrOwner, IsVendorObject]
+    pagination_class = KeysetPagination
+    replica_reads = True
+
+    # ?fields=compact drops the nested items from list responses.
+    compact_fields = ['id', 'customer', 'vendor', 'total_amount', 'status', 'created_at', 'assigned_to']
+
+    def get_projection(self):
+        if self.action != 'list':
+            return None
+        raw = self.request.query_params.get('fields')
+        if not raw:
+            return None
+        if raw == 'compact':
+            return self.compact_fields
+        return [name.strip() for name in raw.split(',') if name.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_projection()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
 
     def get_queryset(self):
-        tenant = getattr(self.request, 'tenant', None) or self.request.user.vendor
-        if self.request.user.role == 'admin':
+        queryset = self.get_scoped_queryset()
+        fields = self.get_projection()
+        if fields is None or 'items_detail' in fields:
+            # items_detail renders product as a pk, so items alone are enough.
+            # Ordered so the fast list path (store.fast_serializers) matches.
+            queryset = queryset.prefetch_related(Prefetch('items', queryset=OrderItem.objects.order_by('pk')))
+        return queryset
+
+    def get_scoped_queryset(self):
+        caller = principal(self.request)
+        if caller.role == 'admin':
             return Order.objects.all()
-        if self.request.user.role == 'customer':
-            customer = Customer.objects.filter(user=self.request.user).first()
+        if caller.role == 'customer':
+            customer = Customer.objects.filter(user_id=caller.user_id).first()
             if not customer:
                 return Order.objects.none()
             return Order.objects.filter(customer=customer)
-        if self.request.user.role == 'staff':
-            return Order.objects.filter(assigned_to=self.request.user)
-        return Order.objects.filter(vendor=tenant)
+        if caller.role == 'staff':
+            return Order.objects.filter(assigned_to_id=caller.user_id)
+        return Order.objects.filter(vendor_id=caller.tenant_id)
+
+    def perform_update(self, serializer):
+        before = (serializer.instance.assigned_to_id, serializer.instance.status)
+        order = serializer.save()
+        order_changed(order.vendor_id, before, (order.assigned_to_id, order.status))
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        order_changed(instance.vendor_id, (instance.assigned_to_id, instance.status), (None, None))
+
+    # LEFT JOIN from the order side, so orders without items still get a row.
+    export_fields = [
+        'id', 'created_at', 'status', 'customer_id', 'assigned_to_id', 'total_amount',
+        'items__product_id', 'items__qty', 'items__price',
+    ]
+    export_header = ['order_id', 'created_at', 'status', 'customer_id', 'assigned_to_id', 'total_amount', 'product_id', 'qty', 'price']
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream one row per order item (one row with empty item columns for an
+        order without items) as ?as=csv (default) or ?as=ndjson.
+        """
+        export_format = request.query_params.get('as', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response({"detail": "Unsupported export format."}, status=status.HTTP_400_BAD_REQUEST)
+        rows = (
+            self.get_scoped_queryset()
+            .using(router.db_for_read(Order))
+            .order_by('id', 'items__id')
+            .values_list(*self.export_fields)
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        return export_response(export_format, 'orders', self.export_header, rows)
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
     def place(self, request):
@@ -95,7 +312,16 @@ class OrderViewSet(viewsets.ModelViewSet):
         """
         if request.user.role != 'customer':
             return Response({"detail": "Only customers can place orders."}, status=status.HTTP_403_FORBIDDEN)
+        if getattr(request, 'tenant', None) is None and request.user.vendor_id is None:
+            return Response({"detail": "Customer is not linked to a vendor."}, status=status.HTTP_403_FORBIDDEN)
+
+        # Retries carrying the same Idempotency-Key get the first response back.
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is not None:
+            return run_once(request, key, lambda: self.place_order(request))
+        return self.place_order(request)
 
+    def place_order(self, request):
         serializer = self.get_serializer(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
@@ -106,3 +332,16 @@ class OrderViewSet(viewsets.ModelViewSet):
 class CustomTokenObtainPairView(TokenObtainPairView):
     from .token_serializers import MyTokenObtainPairSerializer
     serializer_class = MyTokenObtainPairSerializer
+
+    def post(self, request, *args, **kwargs):
+        # Counted before any hashing, so floods are turned away cheaply.
+        username = request.data.get(self.serializer_class.username_field)
+        wait = check_login_rate(username if isinstance(username, str) else None, client_ip(request))
+        if wait:
+            raise exceptions.Throttled(wait=wait)
+        return super().post(request, *args, **kwargs)
+
+
+class ClaimsTokenRefreshView(TokenRefreshView):
+    from .token_serializers import ClaimsTokenRefreshSerializer
+    serializer_class = ClaimsTokenRefreshSerializer